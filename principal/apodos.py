@@ -0,0 +1,421 @@
+"""
+Validación de apodos del chat: normalización, términos prohibidos y unicidad por canal.
+
+`set_guest_name` solo miraba que el apodo no estuviera vacío ni pasara de
+20 caracteres, así que "ＡＤＭＩＮ", "аdmin" (con a cirílica) o el username
+de un streamer de la casa pasaban igual y los moderadores los perseguían a
+mano. Ahora cada apodo pasa por:
+
+1. `normalizar`: NFKC, espacios colapsados, sin caracteres de control ni de
+   formato (overrides bidi, ancho cero) y sin pilas de diacríticos.
+2. `esqueleto`: la forma que se compara. casefold, sin diacríticos, con los
+   homoglifos cirílicos/griegos y el leetspeak llevados a su letra latina
+   y sin separadores: "Ad_M1n", "ádmín" y "аdmіn" dan lo mismo.
+3. Un autómata de Aho-Corasick precompilado con los términos prohibidos:
+   los reservados de la casa, los de APODOS_PROHIBIDOS (uno por línea) y
+   los usernames de los canales (del índice en memoria, sin consultas).
+   Revisar un apodo es una sola pasada por su esqueleto, O(largo), sin
+   importar cuántos términos haya. Cómo choca cada término:
+   - Los de APODOS_PROHIBIDOS (insultos y demás) en cualquier parte.
+   - Los reservados y los usernames, solo como palabras enteras: el
+     término tiene que empezar y terminar en un corte del apodo
+     (separadores, minúscula -> mayúscula, letra <-> dígito). "Admin_Pepe",
+     "AdminPepe" y "a.d.m.i.n" chocan con "admin"; "badminton" no, ni
+     "mariana" con el canal "maria".
+   - Los usernames más cortos que APODOS_CANAL_MIN, solo con el apodo
+     entero ("ana" no prohíbe "Ana Paula").
+4. Un índice acotado (LRU de APODOS_RESERVAS_MAX entradas) de
+   (canal, esqueleto) -> visitante que vence a los APODOS_RESERVA_SEGUNDOS
+   sin actividad: dos visitantes no pueden usar el mismo apodo en el mismo
+   canal a la vez. Cada proceso tiene el suyo. El canal va con el username
+   exacto, como en el índice y el directorio: "Juan" y "juan" son salas
+   distintas.
+
+El autómata se arma de nuevo en un hilo de fondo cuando cambia el archivo
+de términos o la lista de canales, y se reemplaza de una vez: las
+validaciones en curso siguen con el anterior. El primero ya sale con los
+canales de la DB: desde el event loop hay que llamar antes a `aasegurar`.
+"""
+import asyncio
+import logging
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict, deque
+
+from django.conf import settings
+from django.db import connections
+
+from .indice import indice
+
+logger = logging.getLogger(__name__)
+
+# Siempre prohibidos, aunque no haya archivo
+RESERVADOS = ('admin', 'administrador', 'moderador', 'kaircam', 'oficial', 'soporte', 'staff', 'sistema')
+
+# Diacríticos seguidos permitidos sobre una letra (más que eso es "zalgo")
+_MAX_DIACRITICOS = 2
+
+# Homoglifos y leetspeak -> letra latina; separadores -> nada.
+# `i` y `l` se pliegan juntas (junto con 1 | !), igual que los términos.
+_CONFUSIBLES = str.maketrans({
+    # Cirílico
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'з': 'e', 'і': 'l', 'ї': 'l', 'ј': 'j', 'к': 'k',
+    'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x',
+    'ѕ': 's', 'һ': 'h', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w', 'ӏ': 'l', 'п': 'n', 'г': 'r',
+    # Griego
+    'α': 'a', 'β': 'b', 'γ': 'y', 'ε': 'e', 'η': 'n', 'ι': 'l', 'κ': 'k', 'ν': 'v',
+    'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x', 'ω': 'w',
+    # Latín extendido que NFKD no descompone
+    'ı': 'l', 'ł': 'l', 'ø': 'o', 'đ': 'd', 'ħ': 'h', 'ŧ': 't', 'ɡ': 'g', 'ʀ': 'r',
+    # Leetspeak
+    '0': 'o', '1': 'l', 'i': 'l', '|': 'l', '!': 'l', '3': 'e', '4': 'a', '@': 'a',
+    '5': 's', '$': 's', '7': 't', '8': 'b', '9': 'g',
+    # Separadores
+    ' ': None, '_': None, '-': None, '.': None, '·': None, "'": None,
+})
+
+# Leetspeak que no es letra ni número: no corta palabras
+_LEET = frozenset('|!@$')
+
+# Cómo choca cada término (ver el docstring)
+SUBCADENA, PALABRA, ENTERO = 'subcadena', 'palabra', 'entero'
+
+# Categorías Unicode que no pueden aparecer en un apodo
+_PROHIBIDAS = {'Cc', 'Cf', 'Co', 'Cn', 'Cs', 'Zl', 'Zp'}
+
+MOTIVOS = {
+    'reservado': 'Ese nombre no está permitido.',
+    'canal': 'Ese nombre es de un canal de KairCam.',
+}
+
+
+class ApodoInvalido(ValueError):
+    """El mensaje es el que se le muestra al usuario."""
+
+
+# ============================
+# NORMALIZACIÓN
+# ============================
+def normalizar(texto, maximo):
+    """Apodo tal como se va a mostrar. ApodoInvalido si no sirve."""
+    texto = ' '.join(unicodedata.normalize('NFKC', texto).split())
+    if not texto:
+        raise ApodoInvalido('El nombre no puede estar vacío.')
+    if len(texto) > maximo:
+        raise ApodoInvalido(f'El nombre es muy largo (máx {maximo} caracteres).')
+
+    diacriticos = 0
+    alfanumerico = False
+    for caracter in texto:
+        categoria = unicodedata.category(caracter)
+        if categoria in _PROHIBIDAS:
+            raise ApodoInvalido('El nombre tiene caracteres no permitidos.')
+        if categoria[0] == 'M':
+            diacriticos += 1
+            if diacriticos > _MAX_DIACRITICOS:
+                raise ApodoInvalido('El nombre tiene caracteres no permitidos.')
+            continue
+        diacriticos = 0
+        alfanumerico = alfanumerico or categoria[0] in 'LN'
+    if not alfanumerico:
+        raise ApodoInvalido('El nombre tiene que tener alguna letra o número.')
+    return texto
+
+
+def esqueleto(texto):
+    """Forma de comparación: sin mayúsculas, diacríticos, homoglifos ni separadores."""
+    descompuesto = unicodedata.normalize('NFKD', texto.casefold())
+    plano = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return plano.translate(_CONFUSIBLES).replace('rn', 'm').replace('vv', 'w')
+
+
+def _tipo(caracter):
+    """'A' mayúscula, 'a' el resto de las letras, 'N' dígito, None separador."""
+    if caracter.isdigit():
+        return 'N'
+    if caracter.isupper():
+        return 'A'
+    if caracter.isalpha() or caracter in _LEET or unicodedata.combining(caracter):
+        return 'a'
+    return None   # separador
+
+
+def esqueleto_y_cortes(texto):
+    """
+    (esqueleto, cortes): el esqueleto del apodo y las posiciones (en el
+    esqueleto) donde empieza o termina una palabra.
+    """
+    partes, actual, previo = [], [], None
+    for caracter in texto:
+        tipo = _tipo(caracter)
+        # Corta en los separadores y donde cambia el tipo, salvo la mayúscula inicial ("Admin")
+        if actual and (tipo is None or (tipo != previo and (previo, tipo) != ('A', 'a'))):
+            partes.append(''.join(actual))
+            actual = []
+        if tipo is not None:
+            actual.append(caracter)
+        previo = tipo
+    if actual:
+        partes.append(''.join(actual))
+
+    esqueletos = [esqueleto(parte) for parte in partes]
+    cortes = {0}
+    largo = 0
+    for forma in esqueletos:
+        largo += len(forma)
+        cortes.add(largo)
+    return ''.join(esqueletos), frozenset(cortes)
+
+
+# ============================
+# AUTÓMATA (AHO-CORASICK)
+# ============================
+class Automata:
+    """Todos los términos en un solo autómata: una pasada por el texto los busca a todos."""
+
+    __slots__ = ('_siguiente', '_fallo', '_salidas', 'terminos')
+
+    def __init__(self, terminos):
+        """`terminos`: (esqueleto, modo, motivo), con modo SUBCADENA, PALABRA o ENTERO."""
+        siguiente = [{}]
+        salidas = [()]
+        for patron, modo, motivo in terminos:
+            estado = 0
+            for caracter in patron:
+                hijo = siguiente[estado].get(caracter)
+                if hijo is None:
+                    hijo = siguiente[estado][caracter] = len(siguiente)
+                    siguiente.append({})
+                    salidas.append(())
+                estado = hijo
+            salidas[estado] += ((len(patron), modo, motivo, patron),)
+
+        # Enlaces de fallo por niveles: el de cada estado es más corto, ya está resuelto
+        fallo = [0] * len(siguiente)
+        cola = deque(siguiente[0].values())
+        while cola:
+            estado = cola.popleft()
+            for caracter, hijo in siguiente[estado].items():
+                destino = fallo[estado]
+                while destino and caracter not in siguiente[destino]:
+                    destino = fallo[destino]
+                fallo[hijo] = siguiente[destino].get(caracter, 0)
+                salidas[hijo] += salidas[fallo[hijo]]
+                cola.append(hijo)
+
+        self._siguiente = siguiente
+        self._fallo = fallo
+        self._salidas = salidas
+        self.terminos = len(terminos)
+
+    def buscar(self, texto, permitido=None, cortes=None):
+        """
+        (motivo, término) del primer término prohibido en `texto`, o None.
+        `cortes`: dónde empiezan y terminan las palabras (sin ellos, todo el texto es una).
+        """
+        cortes = cortes if cortes is not None else (0, len(texto))
+        siguiente, fallo, salidas = self._siguiente, self._fallo, self._salidas
+        largo = len(texto)
+        estado = 0
+        for fin, caracter in enumerate(texto, 1):
+            while estado and caracter not in siguiente[estado]:
+                estado = fallo[estado]
+            estado = siguiente[estado].get(caracter, 0)
+            for largo_patron, modo, motivo, patron in salidas[estado]:
+                if modo == ENTERO and not (fin == largo == largo_patron):
+                    continue
+                if modo == PALABRA and not (fin in cortes and fin - largo_patron in cortes):
+                    continue
+                if patron == permitido:
+                    continue
+                return motivo, patron
+        return None
+
+
+# ============================
+# MOTOR
+# ============================
+class Apodos:
+    def __init__(self, archivo, recarga, largo_max, canal_min, reservas_max, reserva_segundos):
+        self.archivo = archivo
+        self.recarga = recarga
+        self.largo_max = largo_max
+        self.canal_min = canal_min
+        self.reservas_max = reservas_max
+        self.reserva_segundos = reserva_segundos
+
+        self._automata = None
+        self._firma = None
+        self.canales = frozenset()   # usernames (exactos) del último armado
+        self._reservas = OrderedDict()   # (canal, esqueleto) -> (visitante, vence)
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._lock_reservas = threading.Lock()
+
+        self.validados = 0
+        self.rechazados = Counter()
+        self.recargas = 0
+        self.choques = 0
+        self.desalojadas = 0
+
+    # ----------------------------
+    # Términos
+    # ----------------------------
+    def _leer_archivo(self):
+        try:
+            with open(self.archivo, encoding='utf-8') as f:
+                return [linea.strip() for linea in f if linea.strip() and not linea.lstrip().startswith('#')]
+        except FileNotFoundError:
+            return []
+
+    def _mtime(self):
+        try:
+            return self.archivo.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def armar(self, usernames=()):
+        """Compila el autómata con los términos actuales y lo pone en uso."""
+        terminos = {}
+        for termino in self._leer_archivo():
+            forma = esqueleto(termino)
+            if forma:
+                terminos[forma] = (SUBCADENA, 'reservado')
+        for termino in RESERVADOS:
+            terminos.setdefault(esqueleto(termino), (PALABRA, 'reservado'))
+        for username in usernames:
+            forma = esqueleto(username)
+            if forma and forma not in terminos:
+                terminos[forma] = (ENTERO if len(forma) < self.canal_min else PALABRA, 'canal')
+
+        automata = Automata([(forma, modo, motivo) for forma, (modo, motivo) in terminos.items()])
+        self.canales = frozenset(usernames)
+        self._automata = automata
+        self.recargas += 1
+        return automata
+
+    # ----------------------------
+    # Recarga en caliente (un hilo por proceso, arranque perezoso)
+    # ----------------------------
+    def asegurar(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                # El primero se arma acá, ya con los canales (va a la DB)
+                if self._automata is None:
+                    self.revisar()
+                self._hilo = threading.Thread(target=self._bucle, name='recarga-apodos', daemon=True)
+                self._hilo.start()
+
+    async def aasegurar(self):
+        """asegurar() para el event loop: el primer armado corre en otro hilo."""
+        if self._hilo is None:
+            await asyncio.to_thread(self._asegurar_aparte)
+
+    def _asegurar_aparte(self):
+        try:
+            self.asegurar()
+        finally:
+            # Este hilo no es de un request: cerramos la conexión nosotros
+            connections.close_all()
+
+    def _bucle(self):
+        while True:
+            inicio = time.monotonic()
+            try:
+                self.revisar()
+            except Exception:
+                logger.exception("Error recargando los términos prohibidos de apodos")
+            finally:
+                # Este hilo no es de un request: cerramos la conexión nosotros
+                connections.close_all()
+            time.sleep(max(0.0, self.recarga - (time.monotonic() - inicio)))
+
+    def revisar(self):
+        """Rearma el autómata si cambió el archivo de términos o la lista de canales."""
+        usernames = frozenset(indice.usernames())
+        firma = (self._mtime(), usernames)
+        if firma != self._firma:
+            self.armar(usernames)
+            self._firma = firma
+
+    # ----------------------------
+    # Validación
+    # ----------------------------
+    def validar(self, texto, propio=None):
+        """
+        Apodo normalizado, o ApodoInvalido con el mensaje para el usuario.
+        `propio`: username del que lo pide, que sí puede usar el nombre de su canal.
+        """
+        self.asegurar()
+        try:
+            apodo = normalizar(texto, self.largo_max)
+        except ApodoInvalido:
+            self.rechazados['formato'] += 1
+            raise
+        forma, cortes = esqueleto_y_cortes(apodo)
+        encontrado = self._automata.buscar(forma, esqueleto(propio) if propio else None, cortes)
+        if encontrado is not None:
+            motivo, _ = encontrado
+            self.rechazados[motivo] += 1
+            raise ApodoInvalido(MOTIVOS[motivo])
+        self.validados += 1
+        return apodo
+
+    def es_canal(self, nombre):
+        return nombre in self.canales
+
+    # ----------------------------
+    # Unicidad por canal
+    # ----------------------------
+    def reservar(self, canal, apodo, visitante):
+        """
+        Toma (o renueva) `apodo` en `canal` para `visitante`. False si lo
+        tiene otro visitante y todavía no venció.
+        """
+        clave = (canal, esqueleto(apodo))
+        ahora = time.monotonic()
+        with self._lock_reservas:
+            reservas = self._reservas
+            # Las que llevan más tiempo sin tocarse están al principio: las vencidas salen primero
+            while reservas:
+                primera = next(iter(reservas))
+                if reservas[primera][1] > ahora:
+                    break
+                del reservas[primera]
+
+            actual = reservas.get(clave)
+            if actual is not None and actual[0] != visitante:
+                self.choques += 1
+                return False
+            reservas[clave] = (visitante, ahora + self.reserva_segundos)
+            reservas.move_to_end(clave)
+            if len(reservas) > self.reservas_max:
+                reservas.popitem(last=False)
+                self.desalojadas += 1
+            return True
+
+    def estadisticas(self):
+        return {
+            'terminos': self._automata.terminos if self._automata is not None else 0,
+            'canales': len(self.canales),
+            'recargas': self.recargas,
+            'validados': self.validados,
+            'rechazados': dict(self.rechazados),
+            'reservas': len(self._reservas),
+            'choques': self.choques,
+            'desalojadas': self.desalojadas,
+        }
+
+
+# Instancia única del proceso
+apodos = Apodos(
+    settings.APODOS_PROHIBIDOS,
+    recarga=settings.APODOS_RECARGA,
+    largo_max=settings.APODOS_LARGO_MAX,
+    canal_min=settings.APODOS_CANAL_MIN,
+    reservas_max=settings.APODOS_RESERVAS_MAX,
+    reserva_segundos=settings.APODOS_RESERVA_SEGUNDOS,
+)
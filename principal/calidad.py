@@ -0,0 +1,204 @@
+"""
+Calidad de reproducción (QoS) informada por el reproductor.
+
+El navegador junta eventos de hls.js (tiempo hasta el primer cuadro,
+cortes por buffer vacío, cambios de calidad y errores fatales) y los
+manda en lote con navigator.sendBeacon a /api/calidad/. La vista solo
+valida y los agrega a una cola en memoria acotada (CALIDAD_COLA eventos;
+si está llena, el lote se descarta y se cuenta): no hay I/O en el request.
+El canal lo manda el cliente: se guarda el username exacto que da el
+índice en memoria, y los lotes de canales que no existen se descartan.
+
+Un hilo por proceso (arranque perezoso) vacía la cola cada CALIDAD_VOLCADO
+segundos, o antes si se llenó a la mitad, y escribe el lote entero de una
+vez en CALIDAD_DIR/calidad-<fecha>-<hora>-<pid>.bin. Cada archivo lo
+escribe un solo proceso, así que no hace falta lock entre procesos.
+
+Formato: registros [largo u32][msgpack] append-only, uno por volcado, en
+columnas y con los textos repetidos (canal, sesión) como diccionario:
+    {'ts': [...], 'tipo': [...], 'valor': [...], 'detalle': [...],
+     'canales': [...], 'canal': [índices], 'sesiones': [...], 'sesion': [índices]}
+
+`manage.py calidad` lee esos archivos y resume percentiles por canal.
+"""
+import atexit
+import logging
+import os
+import struct
+import threading
+import time
+
+import msgpack
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_LARGO = struct.Struct('<I')
+EXTENSION = '.bin'
+
+# Tipos de evento (en disco va el número)
+TIPOS = {
+    'inicio': 1,    # valor: ms desde que arranca el reproductor hasta el primer cuadro
+    'corte': 2,     # valor: ms que estuvo detenido esperando datos
+    'nivel': 3,     # valor: kbps del nivel nuevo
+    'fatal': 4,     # detalle: tipo y detalle del error de hls.js
+}
+NOMBRES_TIPOS = {numero: nombre for nombre, numero in TIPOS.items()}
+
+MAX_TEXTO = 64
+MAX_VALOR = 10_000_000
+
+
+def validar(datos, max_eventos, canal_de):
+    """
+    Eventos del cuerpo de un beacon como tuplas (canal, sesion, tipo, valor,
+    detalle); ValueError si el cuerpo no tiene la forma esperada.
+    `canal_de` lleva el canal pedido a su nombre exacto, o None si no existe.
+    """
+    if not isinstance(datos, dict):
+        raise ValueError('cuerpo')
+    canal, sesion, eventos = datos.get('canal'), datos.get('sesion'), datos.get('eventos')
+    if not isinstance(canal, str) or not isinstance(sesion, str) or not isinstance(eventos, list):
+        raise ValueError('campos')
+    if not canal or len(canal) > 160 or not sesion or len(sesion) > MAX_TEXTO:
+        raise ValueError('canal o sesión')
+    if len(eventos) > max_eventos:
+        raise ValueError('demasiados eventos')
+    canal = canal_de(canal)
+    if canal is None:
+        raise ValueError('canal desconocido')
+
+    validos = []
+    for evento in eventos:
+        if not isinstance(evento, dict):
+            raise ValueError('evento')
+        tipo = TIPOS.get(evento.get('tipo'))
+        valor = evento.get('valor', 0)
+        detalle = evento.get('detalle', '')
+        if tipo is None or not isinstance(valor, (int, float)) or not isinstance(detalle, str):
+            raise ValueError('evento')
+        validos.append((canal, sesion, tipo, int(min(max(valor, 0), MAX_VALOR)), detalle[:MAX_TEXTO]))
+    return validos
+
+
+def _columnas(eventos):
+    """Lote de eventos (ts, canal, sesion, tipo, valor, detalle) en columnas."""
+    columnas = {'ts': [], 'tipo': [], 'valor': [], 'detalle': [],
+                'canales': [], 'canal': [], 'sesiones': [], 'sesion': []}
+    canales, sesiones = {}, {}
+    for ts, canal, sesion, tipo, valor, detalle in eventos:
+        if canal not in canales:
+            canales[canal] = len(canales)
+            columnas['canales'].append(canal)
+        if sesion not in sesiones:
+            sesiones[sesion] = len(sesiones)
+            columnas['sesiones'].append(sesion)
+        columnas['ts'].append(ts)
+        columnas['canal'].append(canales[canal])
+        columnas['sesion'].append(sesiones[sesion])
+        columnas['tipo'].append(tipo)
+        columnas['valor'].append(valor)
+        columnas['detalle'].append(detalle)
+    return columnas
+
+
+def leer(ruta):
+    """Itera los eventos de un archivo como (ts, canal, sesion, tipo, valor, detalle)."""
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+    offset = 0
+    while offset + _LARGO.size <= len(datos):
+        (largo,) = _LARGO.unpack_from(datos, offset)
+        inicio = offset + _LARGO.size
+        if inicio + largo > len(datos):
+            break  # volcado cortado a la mitad (el proceso murió escribiendo)
+        lote = msgpack.unpackb(datos[inicio:inicio + largo], raw=False)
+        canales, sesiones = lote['canales'], lote['sesiones']
+        for i, ts in enumerate(lote['ts']):
+            yield (ts, canales[lote['canal'][i]], sesiones[lote['sesion'][i]],
+                   lote['tipo'][i], lote['valor'][i], lote['detalle'][i])
+        offset = inicio + largo
+
+
+class ColaCalidad:
+    def __init__(self, directorio, capacidad, volcado):
+        self.directorio = directorio
+        self.capacidad = capacidad
+        self.volcado = volcado
+        self.recibidos = 0
+        self.descartados = 0
+        self.escritos = 0
+        self._pendientes = []
+        self._hay_trabajo = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    # ----------------------------
+    # Ingreso (desde las vistas)
+    # ----------------------------
+    def agregar(self, eventos):
+        """Encola el lote entero o nada. False si la cola estaba llena."""
+        ahora = round(time.time(), 3)
+        self.asegurar()
+        with self._lock:
+            if len(self._pendientes) + len(eventos) > self.capacidad:
+                self.descartados += len(eventos)
+                return False
+            self._pendientes.extend((ahora, *evento) for evento in eventos)
+            self.recibidos += len(eventos)
+            mitad = len(self._pendientes) >= self.capacidad // 2
+        if mitad:
+            self._hay_trabajo.set()
+        return True
+
+    # ----------------------------
+    # Volcado (un hilo por proceso, arranque perezoso)
+    # ----------------------------
+    def asegurar(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='volcado-calidad', daemon=True)
+                self._hilo.start()
+                atexit.register(self.volcar)
+
+    def _bucle(self):
+        while True:
+            self._hay_trabajo.wait(timeout=self.volcado)
+            self._hay_trabajo.clear()
+            try:
+                self.volcar()
+            except OSError:
+                logger.exception("No se pudieron guardar los eventos de calidad")
+
+    def volcar(self):
+        """Escribe los eventos pendientes en un solo append. Devuelve cuántos escribió."""
+        with self._lock:
+            eventos, self._pendientes = self._pendientes, []
+        if not eventos:
+            return 0
+
+        datos = msgpack.packb(_columnas(eventos), use_bin_type=True)
+        os.makedirs(self.directorio, exist_ok=True)
+        nombre = f"calidad-{time.strftime('%Y%m%d-%H')}-{os.getpid()}{EXTENSION}"
+        with open(os.path.join(self.directorio, nombre), 'ab') as f:
+            f.write(_LARGO.pack(len(datos)) + datos)
+        self.escritos += len(eventos)
+        return len(eventos)
+
+    def estadisticas(self):
+        return {
+            'recibidos': self.recibidos,
+            'descartados': self.descartados,
+            'escritos': self.escritos,
+            'pendientes': len(self._pendientes),
+        }
+
+
+# Instancia única del proceso
+cola = ColaCalidad(
+    directorio=str(settings.CALIDAD_DIR),
+    capacidad=settings.CALIDAD_COLA,
+    volcado=settings.CALIDAD_VOLCADO,
+)
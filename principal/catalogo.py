@@ -0,0 +1,120 @@
+"""
+Catálogo de canales para /api/channels/: foto versionada + paginación keyset.
+
+La foto se arma con UNA consulta (canal + usuario + cliente) y se vuelve a
+armar cada CATALOGO_TTL segundos. Su versión es un hash del contenido: si
+nada cambió, la versión (y por lo tanto el ETag de cada página) es la misma
+y los clientes que sondean reciben 304 sin cuerpo.
+
+El orden es (en vivo primero, username en minúsculas, username) y el cursor
+es la clave del último canal entregado: la página siguiente es un bisect, no
+un OFFSET que haya que recorrer. El username exacto va en la clave porque
+"Juan" y "juan" son canales distintos: sin él comparten clave y el segundo
+se salta si el primero cierra una página.
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+from bisect import bisect_right
+
+from django.conf import settings
+
+from .directorio import CAMPOS, canal_desde_fila
+from .models import CanalTransmision
+from .sondeo import sondeador
+
+
+def _dict_canal(canal, en_vivo, hls_url):
+    cliente = canal.cliente._asdict() if canal.cliente else None
+    return {
+        'username': canal.username,
+        'en_vivo': en_vivo,
+        'hls_url': hls_url,
+        'cliente': cliente,
+    }
+
+
+def codificar_cursor(clave):
+    texto = ':'.join(map(str, clave)).encode('utf-8')
+    return base64.urlsafe_b64encode(texto).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Clave (orden, username_minúsculas, username) del cursor; ValueError si no es válido."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        texto = base64.urlsafe_b64decode(cursor + relleno).decode('utf-8')
+        orden, minusculas, username = texto.split(':', 2)
+        return int(orden), minusculas, username
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Cursor inválido') from e
+
+
+class FotoCatalogo:
+    __slots__ = ('version', 'generada', 'claves', 'canales')
+
+    def __init__(self, version, generada, claves, canales):
+        self.version = version
+        self.generada = generada
+        self.claves = claves      # [(0|1, username_minúsculas, username)] ordenadas
+        self.canales = canales    # dicts listos para serializar, mismo orden
+
+    def pagina(self, despues=None, limite=50):
+        inicio = bisect_right(self.claves, despues) if despues is not None else 0
+        fin = inicio + limite
+        siguiente = codificar_cursor(self.claves[fin - 1]) if fin < len(self.claves) else None
+        return self.canales[inicio:fin], siguiente
+
+    def etag(self, *partes):
+        """ETag fuerte de una página: versión de la foto + parámetros de la página."""
+        sufijo = hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()[:12]
+        return f'"{self.version}-{sufijo}"'
+
+
+class Catalogo:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.foto = None
+        self._vence = 0.0
+        self._lock = threading.Lock()
+
+    def _armar(self):
+        # Import diferido: views importa este módulo
+        from .views import build_hls_url
+
+        vivos = sondeador.instantanea()
+        filas = CanalTransmision.objects.values_list(*CAMPOS)
+
+        items = []
+        for fila in filas:
+            canal = canal_desde_fila(fila)
+            en_vivo = vivos.en_vivo(canal.username) if vivos else canal.en_vivo
+            hls_url = canal.url_hls or build_hls_url(f"{canal.username}.m3u8", canal.username)
+            clave = (0 if en_vivo else 1, canal.username.lower(), canal.username)
+            items.append((clave, _dict_canal(canal, en_vivo, hls_url)))
+        items.sort(key=lambda item: item[0])
+
+        canales = [canal for _, canal in items]
+        contenido = json.dumps(canales, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        version = hashlib.sha1(contenido).hexdigest()[:16]
+
+        anterior = self.foto
+        if anterior is not None and anterior.version == version:
+            return anterior
+        return FotoCatalogo(version, time.time(), [clave for clave, _ in items], canales)
+
+    def obtener(self):
+        """Foto vigente; la rearma un solo hilo cuando venció."""
+        if time.monotonic() < self._vence and self.foto is not None:
+            return self.foto
+        with self._lock:
+            if time.monotonic() >= self._vence or self.foto is None:
+                self.foto = self._armar()
+                self._vence = time.monotonic() + self.ttl
+        return self.foto
+
+
+# Instancia única del proceso
+catalogo = Catalogo(ttl=settings.CATALOGO_TTL)
@@ -0,0 +1,256 @@
+"""
+Salas de chat por canal sobre WebSocket (ASGI).
+
+Cada canal tiene una sala en memoria con:
+- un buffer circular de tamaño fijo (los últimos N mensajes) para quien
+  entra tarde,
+- un lote de mensajes pendientes que se serializa UNA sola vez con msgpack
+  y se escribe igual en todas las conexiones,
+- su registro en disco (chatlog), de donde se recupera el historial y la
+  numeración de mensajes si el proceso se reinicia. Las escrituras (lotes,
+  rotación, purga) no corren en el event loop: van a UN hilo escritor por
+  proceso, que las hace de a una y en el orden en que llegaron.
+
+La sala del canal oficial se llama SALA_OFICIAL, un nombre que no puede ser
+username (lleva '~'); `nombre_sala` es el único lugar que la distingue.
+
+El apodo sale de la cookie firmada que entrega `set_guest_name` (ver
+invitado.py); se valida al conectar, sin ir a la base. Al conectar y con
+cada mensaje se renueva su reserva en la sala (ver apodos.py): si otro
+visitante ya lo está usando en el canal, no se puede chatear con él.
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .apodos import ApodoInvalido, apodos
+from .chatlog import registros
+from .directorio import directorio
+from .estado_vivo import hub
+from .invitado import invitado_de_scope
+
+# Nombre de la sala del canal oficial (no tiene fila en core_canaltransmision).
+# Los usernames de Django no admiten '~': no choca con ningún canal.
+SALA_OFICIAL = '~oficial'
+
+MAX_LARGO_MENSAJE = 500
+
+APODO_OCUPADO = 'Ese nombre ya lo está usando otra persona en este canal.'
+
+
+# Un solo hilo: los lotes de una sala llegan al disco en orden
+_escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chatlog')
+
+
+def nombre_sala(username):
+    """Sala de `username`: la oficial o el username canónico del canal; None si no existe."""
+    if username == SALA_OFICIAL:
+        return SALA_OFICIAL
+    canal = directorio.obtener(username)
+    return canal.username if canal else None
+
+
+def es_sala(nombre):
+    """Como nombre_sala, pero sin ir a la base: solo nombres exactos."""
+    return nombre == SALA_OFICIAL or apodos.es_canal(nombre)
+
+
+async def _escribir(funcion, *args):
+    return await asyncio.get_running_loop().run_in_executor(_escritor, funcion, *args)
+
+
+def _empaquetar(tipo, **datos):
+    datos['t'] = tipo
+    return msgpack.packb(datos, use_bin_type=True)
+
+
+class Sala:
+    """Una sala de chat: conexiones, historial circular y lote pendiente."""
+
+    def __init__(self, nombre, tamano_historial, espera_lote, registro, soltar=None):
+        self.nombre = nombre
+        self.soltar = soltar   # la saca del gestor cuando queda vacía
+        self.conexiones = set()
+        self.registro = registro
+        # Cada mensaje es una lista compacta: [id, autor, texto, ts_ms]
+        ultimos, _ = registro.pagina(limite=tamano_historial)
+        self.historial = deque(ultimos, maxlen=tamano_historial)
+        self.espera_lote = espera_lote
+        self._pendientes = []
+        self._programado = False
+
+    def publicar(self, autor, texto):
+        # El id lo pone el registro al escribir el lote (es único entre procesos)
+        mensaje = [None, autor, texto, int(time.time() * 1000)]
+        self._pendientes.append(mensaje)
+
+        # Juntamos todo lo que llegue en la ventana del lote en UN solo frame
+        if not self._programado:
+            self._programado = True
+            asyncio.get_running_loop().call_later(
+                self.espera_lote, lambda: asyncio.ensure_future(self._vaciar()),
+            )
+        return mensaje
+
+    def vacia(self):
+        return not self.conexiones and not self._pendientes
+
+    async def _vaciar(self):
+        self._programado = False
+        if not self._pendientes:
+            return
+        lote, self._pendientes = self._pendientes, []
+        # El registro numera el lote al escribirlo (en el hilo escritor)
+        await _escribir(self.registro.agregar, lote)
+        self.historial.extend(lote)
+        await self.difundir(_empaquetar('lote', m=lote))
+        # Si el último se fue mientras el lote esperaba, la sala se suelta ahora
+        if self.vacia() and self.soltar is not None:
+            self.soltar(self)
+
+    async def difundir(self, frame):
+        conexiones = list(self.conexiones)
+        if conexiones:
+            await asyncio.gather(*(c.enviar_bytes(frame) for c in conexiones))
+
+
+class ConexionChat:
+    __slots__ = ('send', 'abierta', 'apodo', 'visitante')
+
+    def __init__(self, send, apodo, visitante):
+        self.send = send
+        self.abierta = True
+        self.apodo = apodo
+        self.visitante = visitante
+
+    async def enviar_bytes(self, frame):
+        if not self.abierta:
+            return
+        try:
+            await self.send({'type': 'websocket.send', 'bytes': frame})
+        except Exception:
+            self.abierta = False
+
+
+class GestorSalas:
+    def __init__(self, tamano_historial, espera_lote):
+        self.tamano_historial = tamano_historial
+        self.espera_lote = espera_lote
+        self.salas = {}
+
+    def entrar(self, nombre, conexion):
+        sala = self.salas.get(nombre)
+        if sala is None:
+            sala = self.salas[nombre] = Sala(
+                nombre, self.tamano_historial, self.espera_lote, registros.obtener(nombre), self._soltar,
+            )
+        sala.conexiones.add(conexion)
+        return sala
+
+    def salir(self, sala, conexion):
+        sala.conexiones.discard(conexion)
+        # Sala vacía y sin nada pendiente: la soltamos para no acumular memoria
+        # (con lote pendiente la suelta _vaciar al escribirlo)
+        if sala.vacia():
+            self._soltar(sala)
+
+    def _soltar(self, sala):
+        if self.salas.get(sala.nombre) is sala:
+            del self.salas[sala.nombre]
+
+    def conexiones(self):
+        return sum(len(sala.conexiones) for sala in self.salas.values())
+
+
+# Instancia única del proceso
+salas = GestorSalas(
+    tamano_historial=settings.CHAT_HISTORIAL,
+    espera_lote=settings.CHAT_LOTE_MS / 1000,
+)
+
+
+async def _al_cambiar_estado(username, anterior, nuevo):
+    """Cada transmisión arranca su propio segmento; al terminar se purga lo viejo."""
+    estaba_en_vivo, esta_en_vivo = anterior[0], nuevo[0]
+    if estaba_en_vivo == esta_en_vivo:
+        return
+
+    registro = registros.obtener(username)
+    await _escribir(registro.rotar)
+    if estaba_en_vivo and not esta_en_vivo:
+        await _escribir(registro.purgar, settings.CHAT_LOG_RETENCION_DIAS * 86400)
+        # Igual que hacía el navegador: el chat en vivo se vacía al cortar
+        sala = salas.salas.get(username)
+        if sala is not None:
+            sala.historial.clear()
+
+
+hub.agregar_oyente(_al_cambiar_estado)
+
+
+# ============================
+# CONSUMIDOR ASGI
+# ============================
+async def chat_ws(scope, receive, send, username):
+    """WebSocket /ws/chat/<username>/: texto del cliente, msgpack del servidor."""
+    mensaje = await receive()
+    if mensaje['type'] != 'websocket.connect':
+        return
+
+    nombre = await sync_to_async(nombre_sala)(username)
+    if nombre is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    await send({'type': 'websocket.accept'})
+
+    # sync_to_async solo por la migración desde sesiones viejas (va a la DB)
+    apodo, visitante, propio = await sync_to_async(invitado_de_scope)(scope)
+    conexion = ConexionChat(send, apodo, visitante)
+
+    sala = salas.entrar(nombre, conexion)
+    try:
+        await conexion.enviar_bytes(_empaquetar('historial', m=list(sala.historial)))
+
+        if conexion.apodo is not None:
+            # El token puede ser de antes de un término prohibido nuevo
+            await apodos.aasegurar()
+            try:
+                apodos.validar(conexion.apodo, propio)
+                error = None if apodos.reservar(nombre, conexion.apodo, visitante) else APODO_OCUPADO
+            except ApodoInvalido as e:
+                error = str(e)
+            if error:
+                conexion.apodo = None
+                await conexion.enviar_bytes(_empaquetar('error', e=error))
+
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'websocket.disconnect':
+                break
+            if mensaje['type'] != 'websocket.receive':
+                continue
+
+            texto = (mensaje.get('text') or '').strip()
+            if not texto or len(texto) > MAX_LARGO_MENSAJE:
+                continue
+
+            # Sin apodo al conectar: el navegador reconecta después de elegirlo
+            if conexion.apodo is None:
+                await conexion.enviar_bytes(_empaquetar('error', e='Elegí un nombre para chatear.'))
+                continue
+            # Renueva la reserva; si venció y la tomó otro, este ya no puede usarlo
+            if not apodos.reservar(nombre, conexion.apodo, conexion.visitante):
+                conexion.apodo = None
+                await conexion.enviar_bytes(_empaquetar('error', e=APODO_OCUPADO))
+                continue
+
+            sala.publicar(conexion.apodo, texto)
+    finally:
+        conexion.abierta = False
+        salas.salir(sala, conexion)
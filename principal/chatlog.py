@@ -0,0 +1,240 @@
+"""
+Registro de chat en disco: append-only, por canal, en segmentos rotados.
+
+Estructura en CHAT_LOG_DIR/c_<username>/:
+    <id_base>.log   registros [largo u32][msgpack [id, autor, texto, ts_ms]]
+    <id_base>.idx   un u64 por registro con su offset dentro del .log
+
+El id de cada mensaje es global al canal, así que sirve directamente de
+cursor para paginar hacia atrás (?before=<id>). Las lecturas mapean en
+memoria (mmap) sólo el segmento que hace falta: nunca se carga un archivo
+entero ni crece la memoria por sala.
+
+Con varios workers cada uno tiene su propia sala del mismo canal, así que
+puede haber varios escritores: cada append toma un flock del canal
+(c_<username>/.lock), relee del disco el último id y numera el lote recién
+ahí. Los ids quedan consecutivos y sin repetir entre procesos, que es lo
+que `pagina()` supone (id = base + posición en el segmento). Las
+lecturas no toman el lock.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_right
+from pathlib import Path
+
+import msgpack
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock (un solo proceso)
+    fcntl = None
+
+_LARGO = struct.Struct('<I')
+_OFFSET = struct.Struct('<Q')
+
+
+def _mapear(ruta):
+    """mmap de sólo lectura; None si el archivo no existe o está vacío."""
+    try:
+        with open(ruta, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+class RegistroCanal:
+    def __init__(self, ruta, max_bytes_segmento):
+        self.ruta = Path(ruta)
+        self.max_bytes_segmento = max_bytes_segmento
+        self._lock = threading.Lock()
+        self._bases = None           # ids base de los segmentos, ordenados
+        # Último id al pedir la rotación: si el segmento actual empieza
+        # después, otro proceso ya rotó y no hace falta abrir otro
+        self._rotar = None
+
+    # ----------------------------
+    # Segmentos
+    # ----------------------------
+    def _segmentos(self):
+        if self._bases is None:
+            if self.ruta.is_dir():
+                self._bases = sorted(int(p.stem) for p in self.ruta.glob('*.idx'))
+            else:
+                self._bases = []
+        return self._bases
+
+    def _archivos(self, base):
+        nombre = f'{base:016d}'
+        return self.ruta / f'{nombre}.log', self.ruta / f'{nombre}.idx'
+
+    def _cantidad(self, base):
+        _, idx = self._archivos(base)
+        try:
+            return idx.stat().st_size // _OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    def ultimo_id(self):
+        with self._lock:
+            self._bases = None
+            bases = self._segmentos()
+            if not bases:
+                return 0
+            return bases[-1] + self._cantidad(bases[-1]) - 1
+
+    # ----------------------------
+    # Escritura
+    # ----------------------------
+    def agregar(self, mensajes):
+        """
+        Agrega un lote de mensajes [id, autor, texto, ts]. Los ids se asignan
+        acá (sobre las mismas listas), bajo el lock del canal.
+        """
+        if not mensajes:
+            return
+        with self._lock:
+            self.ruta.mkdir(parents=True, exist_ok=True)
+            with open(self.ruta / '.lock', 'a+b') as f_lock:
+                if fcntl is not None:
+                    fcntl.flock(f_lock.fileno(), fcntl.LOCK_EX)
+                # Otro proceso pudo haber escrito o rotado desde la última vez
+                self._bases = None
+                bases = self._segmentos()
+                base = bases[-1] if bases else None
+                siguiente = base + self._cantidad(base) if base is not None else 1
+                for i, mensaje in enumerate(mensajes):
+                    mensaje[0] = siguiente + i
+
+                if base is not None:
+                    log, _ = self._archivos(base)
+                    lleno = log.exists() and log.stat().st_size >= self.max_bytes_segmento
+                    rotar = self._rotar is not None and base <= self._rotar
+                    if lleno or rotar:
+                        base = None
+                if base is None:
+                    base = siguiente
+                    bases.append(base)
+                self._rotar = None
+
+                log, idx = self._archivos(base)
+                with open(log, 'ab') as f_log:
+                    offset = f_log.tell()
+                    registros = bytearray()
+                    offsets = bytearray()
+                    for mensaje in mensajes:
+                        datos = msgpack.packb(mensaje, use_bin_type=True)
+                        offsets += _OFFSET.pack(offset + len(registros))
+                        registros += _LARGO.pack(len(datos)) + datos
+                    f_log.write(registros)
+                # El índice se escribe DESPUÉS del log: un lector nunca ve un
+                # offset que apunte a bytes todavía no escritos.
+                with open(idx, 'ab') as f_idx:
+                    f_idx.write(offsets)
+
+    def rotar(self):
+        """Cierra el segmento actual; el próximo mensaje abre uno nuevo."""
+        ultimo = self.ultimo_id()
+        with self._lock:
+            self._rotar = ultimo
+
+    def purgar(self, antiguedad_segundos):
+        """Borra los segmentos cerrados que no se tocan hace más de `antiguedad_segundos`."""
+        limite = time.time() - antiguedad_segundos
+        borrados = 0
+        with self._lock:
+            bases = self._segmentos()
+            # El último segmento nunca se borra: ahí se sigue escribiendo
+            for base in list(bases[:-1]):
+                log, idx = self._archivos(base)
+                try:
+                    if log.stat().st_mtime >= limite:
+                        continue
+                except FileNotFoundError:
+                    pass
+                idx.unlink(missing_ok=True)
+                log.unlink(missing_ok=True)
+                bases.remove(base)
+                borrados += 1
+        return borrados
+
+    # ----------------------------
+    # Lectura
+    # ----------------------------
+    def pagina(self, antes=None, limite=50):
+        """
+        Hasta `limite` mensajes con id < `antes` (o los últimos si es None),
+        en orden cronológico, y el cursor para pedir la página anterior.
+        """
+        with self._lock:
+            # Se vuelve a listar: el que escribe puede ser otro proceso
+            self._bases = None
+            bases = list(self._segmentos())
+        if not bases or limite <= 0:
+            return [], None
+
+        objetivo = (antes - 1) if antes is not None else None
+        pos = len(bases) - 1 if objetivo is None else bisect_right(bases, objetivo) - 1
+
+        mensajes = []
+        while pos >= 0 and len(mensajes) < limite:
+            base = bases[pos]
+            mensajes.extend(self._leer_hacia_atras(base, objetivo, limite - len(mensajes)))
+            objetivo = base - 1
+            pos -= 1
+
+        mensajes.reverse()
+        hay_mas = bool(mensajes) and mensajes[0][0] > bases[0]
+        return mensajes, (mensajes[0][0] if hay_mas else None)
+
+    def _leer_hacia_atras(self, base, objetivo, cantidad):
+        log, idx = self._archivos(base)
+        mapa_idx = _mapear(idx)
+        if mapa_idx is None:
+            return []
+        mapa_log = _mapear(log)
+        try:
+            total = len(mapa_idx) // _OFFSET.size
+            ultimo = total - 1 if objetivo is None else min(objetivo - base, total - 1)
+            salida = []
+            i = ultimo
+            while i >= 0 and len(salida) < cantidad:
+                (offset,) = _OFFSET.unpack_from(mapa_idx, i * _OFFSET.size)
+                (largo,) = _LARGO.unpack_from(mapa_log, offset)
+                inicio = offset + _LARGO.size
+                salida.append(msgpack.unpackb(mapa_log[inicio:inicio + largo], raw=False))
+                i -= 1
+            return salida
+        finally:
+            mapa_idx.close()
+            if mapa_log is not None:
+                mapa_log.close()
+
+
+class GestorRegistros:
+    def __init__(self, directorio_base, max_bytes_segmento):
+        self.directorio_base = Path(directorio_base)
+        self.max_bytes_segmento = max_bytes_segmento
+        self._registros = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, nombre):
+        with self._lock:
+            registro = self._registros.get(nombre)
+            if registro is None:
+                # Prefijo fijo: ningún username ('..' es válido en Django) escapa del directorio
+                registro = RegistroCanal(self.directorio_base / f'c_{nombre}', self.max_bytes_segmento)
+                self._registros[nombre] = registro
+            return registro
+
+
+# Instancia única del proceso
+registros = GestorRegistros(
+    directorio_base=settings.CHAT_LOG_DIR,
+    max_bytes_segmento=settings.CHAT_LOG_SEGMENTO_BYTES,
+)
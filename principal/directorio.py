@@ -0,0 +1,228 @@
+"""
+Directorio de canales en memoria (uno por proceso).
+
+Cada visita a /stream/<username>/ y cada búsqueda resolvían el canal con
+varias consultas (canal, usuario y cliente por separado). Acá guardamos el
+resultado de UNA sola consulta como un registro compacto, indexado por el
+username tal como se pidió, con vencimiento por TTL y desalojo LRU.
+
+Los usernames de Django distinguen mayúsculas ("Juan" y "juan" pueden ser
+dos cuentas): se busca primero el username exacto y solo si no existe se
+cae a la comparación sin mayúsculas.
+
+La cache sigue indexada por el username exacto, y aparte lleva un mapa de
+alias en minúsculas. Cuando una grafía se resolvió sin mayúsculas y es la
+única cuenta de ese nombre, el registro se guarda con su username real y
+el alias apunta a él: cualquier otra grafía ("JUAN", "Juan") lo encuentra
+sin volver a la DB. Con varias cuentas que difieren solo en mayúsculas no
+hay alias y cada grafía se resuelve por su cuenta.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from .models import CanalTransmision
+
+# ============================
+# REGISTROS
+# ============================
+ClienteInfo = namedtuple('ClienteInfo', [
+    'nombre', 'apellido', 'bio',
+    'instagram', 'x_twitter', 'facebook', 'youtube', 'discord', 'tiktok',
+])
+
+CanalInfo = namedtuple('CanalInfo', [
+    'username', 'usuario_id', 'en_vivo', 'url_hls', 'cliente',
+])
+
+# Columnas que se piden en la consulta única (canal + usuario + cliente)
+CAMPOS = (
+    'usuario__username', 'usuario_id', 'en_vivo', 'url_hls',
+    'usuario__cliente_publico__id',
+) + tuple(f'usuario__cliente_publico__{campo}' for campo in ClienteInfo._fields)
+
+# Marca para recordar que un username NO existe (evita martillar la DB)
+_NO_EXISTE = object()
+
+
+def canal_desde_fila(fila):
+    """Arma un CanalInfo a partir de una fila de values_list(*CAMPOS)."""
+    username, usuario_id, en_vivo, url_hls, cliente_id = fila[:5]
+    cliente = ClienteInfo(*fila[5:]) if cliente_id is not None else None
+    return CanalInfo(username, usuario_id, en_vivo, url_hls or '', cliente)
+
+
+def _exacto(clave):
+    return CanalTransmision.objects.filter(usuario__username=clave).values_list(*CAMPOS)
+
+
+def _sin_mayusculas(clave):
+    # Si hay varios que difieren solo en mayúsculas, siempre gana el mismo (la cuenta más vieja)
+    return (
+        CanalTransmision.objects
+        .filter(usuario__username__iexact=clave)
+        .order_by('usuario_id')
+        .values_list(*CAMPOS)
+    )
+
+
+def _resultado(filas, exacta):
+    """
+    (CanalInfo | None, comun): `comun` indica que cualquier grafía del nombre
+    lleva a este mismo resultado (no había cuenta exacta y a lo sumo hay una).
+    """
+    if exacta:
+        return canal_desde_fila(filas[0]), False
+    return (canal_desde_fila(filas[0]) if filas else None), len(filas) <= 1
+
+
+def _cargar_canal(clave):
+    """Trae el canal, su usuario y su cliente en una sola consulta (LEFT JOIN)."""
+    fila = _exacto(clave).first()
+    if fila is not None:
+        return _resultado([fila], True)
+    # Dos filas alcanzan para saber si el nombre es de una sola cuenta
+    return _resultado(list(_sin_mayusculas(clave)[:2]), False)
+
+
+async def _acargar_canal(clave):
+    """_cargar_canal con el ORM async."""
+    fila = await _exacto(clave).afirst()
+    if fila is not None:
+        return _resultado([fila], True)
+    return _resultado([f async for f in _sin_mayusculas(clave)[:2]], False)
+
+
+class DirectorioCanales:
+    """Cache LRU con TTL de CanalInfo, seguro entre hilos."""
+
+    def __init__(self, ttl, ttl_negativo, max_entradas,
+                 cargador=_cargar_canal, cargador_async=_acargar_canal):
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.max_entradas = max_entradas
+        self._cargador = cargador
+        self._cargador_async = cargador_async
+        self._datos = OrderedDict()  # clave -> (vence_en, CanalInfo | _NO_EXISTE)
+        self._alias = {}             # minúsculas -> clave del registro al que lleva cualquier grafía
+        self._pliegues = {}          # minúsculas -> claves en cache con ese nombre
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def clave(username):
+        return username.strip()
+
+    def _en_cache(self, clave):
+        """(True, CanalInfo | None) si está vigente en la cache, (False, None) si no."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None and clave.lower() in self._alias:
+                clave = self._alias[clave.lower()]
+                entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._datos.move_to_end(clave)
+                self.hits += 1
+                valor = entrada[1]
+                return True, (None if valor is _NO_EXISTE else valor)
+            self.misses += 1
+        return False, None
+
+    def obtener(self, username):
+        """CanalInfo del username exacto o, si no existe, del que coincide sin mayúsculas; o None."""
+        clave = self.clave(username)
+        if not clave:
+            return None
+
+        encontrado, info = self._en_cache(clave)
+        if encontrado:
+            return info
+
+        # La consulta se hace fuera del lock para no frenar al resto de los hilos
+        info, comun = self._cargador(clave)
+        self.guardar(clave, info, comun)
+        return info
+
+    async def aobtener(self, username):
+        """obtener() para vistas async: en un miss consulta con el ORM async."""
+        clave = self.clave(username)
+        if not clave:
+            return None
+
+        encontrado, info = self._en_cache(clave)
+        if encontrado:
+            return info
+
+        info, comun = await self._cargador_async(clave)
+        self.guardar(clave, info, comun)
+        return info
+
+    def guardar(self, username, info, comun=False):
+        """
+        Guarda lo que se resolvió para `username`. Con `comun` (toda grafía lleva
+        al mismo resultado) se guarda bajo el username real y queda el alias.
+        """
+        clave = self.clave(username)
+        if comun and info is not None:
+            clave = info.username
+        pliegue = clave.lower()
+        ttl = self.ttl if info is not None else self.ttl_negativo
+        valor = info if info is not None else _NO_EXISTE
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            self._pliegues.setdefault(pliegue, set()).add(clave)
+            if comun:
+                self._alias[pliegue] = clave
+            while len(self._datos) > self.max_entradas:
+                vieja, _ = self._datos.popitem(last=False)
+                self._olvidar(vieja)
+
+    def _olvidar(self, clave):
+        """Saca una clave ya desalojada de los mapas por minúsculas (con el lock tomado)."""
+        pliegue = clave.lower()
+        claves = self._pliegues.get(pliegue)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._pliegues[pliegue]
+        if self._alias.get(pliegue) == clave:
+            del self._alias[pliegue]
+
+    def invalidar(self, username):
+        """Olvida un canal (p. ej. cuando cambia en_vivo o url_hls), con cualquier grafía pedida."""
+        pliegue = self.clave(username).lower()
+        with self._lock:
+            self._alias.pop(pliegue, None)
+            for clave in self._pliegues.pop(pliegue, ()):
+                self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._alias.clear()
+            self._pliegues.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / total) if total else 0.0,
+                'entradas': len(self._datos),
+                'alias': len(self._alias),
+                'max_entradas': self.max_entradas,
+            }
+
+
+# Instancia única del proceso
+directorio = DirectorioCanales(
+    ttl=settings.CANAL_CACHE_TTL,
+    ttl_negativo=settings.CANAL_CACHE_TTL_NEGATIVO,
+    max_entradas=settings.CANAL_CACHE_MAX,
+)
@@ -0,0 +1,336 @@
+"""
+DVR: archivo de segmentos por canal y playlists "hacia atrás" armadas al vuelo.
+
+`manage.py dvr indexar` sigue las playlists que el empaquetador escribe en
+DVR_FUENTE (por defecto HLS_LOCAL_DIR/<programa>): cada segmento nuevo se
+enlaza (hard link; copia si no se puede) en el archivo del canal y se
+agrega una entrada al índice. Así el segmento sobrevive aunque la playlist
+en vivo lo saque de su ventana.
+
+Estructura en DVR_DIR/c_<username>/:
+    <secuencia:012d>.ts   los segmentos, con numeración propia del archivo
+    indice.bin            un registro fijo por segmento, en orden de secuencia:
+                          [secuencia u64][inicio f64 (epoch)][duración f32][bytes u32]
+
+Como los registros tienen tamaño fijo y el inicio crece con la secuencia,
+ubicar un instante es una búsqueda binaria sobre el índice mapeado en
+memoria: /dvr/<username>/playlist.m3u8 arma la playlist pedida sin listar
+directorios ni leer más que los registros que entran en ella.
+
+- ?desde=<epoch>&hasta=<epoch>: VOD (termina en #EXT-X-ENDLIST).
+- ?desde=<epoch>: playlist en vivo (sin EXT-X-PLAYLIST-TYPE) que arranca
+  ahí y crece con el vivo. No es EVENT: la retención (`dvr podar`) y la
+  ventana máxima le sacan segmentos del comienzo, y eso solo se permite en
+  una playlist en vivo, avanzando EXT-X-MEDIA-SEQUENCE.
+- ?atras=<minutos>: redirige a la de `desde` fijo, para que las recargas
+  pidan siempre la misma.
+
+La secuencia del archivo no es la del empaquetador: si éste se reinicia,
+su EXT-X-MEDIA-SEQUENCE vuelve a empezar. Un segmento es nuevo si empieza
+después del último archivado, y recibe el número siguiente del archivo;
+cuando la fuente vuelve atrás o marca #EXT-X-DISCONTINUITY se saltea un
+número, y armar_playlist lo convierte en discontinuidad.
+
+Un solo proceso escribe el índice de cada canal (el indexador); las
+lecturas pueden venir de cualquier proceso.
+"""
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+_REGISTRO = struct.Struct('<QdfI')     # secuencia, inicio, duración, bytes
+EXTENSION = '.ts'
+INDICE = 'indice.bin'
+
+# Hueco entre segmentos (segundos) a partir del cual se marca una discontinuidad
+_TOLERANCIA = 1.0
+
+_SECUENCIA = re.compile(r'^#EXT-X-MEDIA-SEQUENCE:(\d+)')
+_DURACION = re.compile(r'^#EXTINF:([\d.]+)')
+_FECHA = re.compile(r'^#EXT-X-PROGRAM-DATE-TIME:(.+)$')
+
+# Última secuencia del empaquetador vista por canal (solo en el proceso indexador)
+_fuentes = {}
+
+
+def _mapear(ruta):
+    """mmap de sólo lectura; None si el archivo no existe o está vacío."""
+    try:
+        with open(ruta, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+class _Inicios:
+    """Vista de la columna `inicio` del índice, para bisect."""
+
+    __slots__ = ('mapa', 'cantidad')
+
+    def __init__(self, mapa, cantidad):
+        self.mapa = mapa
+        self.cantidad = cantidad
+
+    def __len__(self):
+        return self.cantidad
+
+    def __getitem__(self, i):
+        return _REGISTRO.unpack_from(self.mapa, i * _REGISTRO.size)[1]
+
+
+def directorio_canal(username):
+    # Prefijo fijo: ningún username ('..' es válido en Django) escapa del directorio
+    return Path(settings.DVR_DIR) / f'c_{username}'
+
+
+def nombre_segmento(secuencia):
+    return f'{secuencia:012d}{EXTENSION}'
+
+
+def es_nombre_segmento(nombre):
+    numero = nombre[:-len(EXTENSION)]
+    return nombre.endswith(EXTENSION) and len(numero) == 12 and numero.isdigit()
+
+
+class IndiceCanal:
+    def __init__(self, directorio):
+        self.directorio = Path(directorio)
+        self.ruta = self.directorio / INDICE
+
+    # ----------------------------
+    # Escritura (solo el indexador)
+    # ----------------------------
+    def agregar(self, registros):
+        """Agrega (secuencia, inicio, duración, bytes) con secuencias crecientes."""
+        if not registros:
+            return
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        datos = b''.join(_REGISTRO.pack(*registro) for registro in registros)
+        with open(self.ruta, 'ab') as f:
+            # Un registro cortado por una caída anterior se descarta
+            sobrante = f.tell() % _REGISTRO.size
+            if sobrante:
+                f.truncate(f.tell() - sobrante)
+            f.write(datos)
+
+    def ultimo(self):
+        """Último registro (secuencia, inicio, duración, bytes) o None."""
+        try:
+            with open(self.ruta, 'rb') as f:
+                tamano = os.fstat(f.fileno()).st_size
+                cantidad = tamano // _REGISTRO.size
+                if not cantidad:
+                    return None
+                f.seek((cantidad - 1) * _REGISTRO.size)
+                return _REGISTRO.unpack(f.read(_REGISTRO.size))
+        except FileNotFoundError:
+            return None
+
+    def podar(self, antes_de):
+        """Borra los segmentos que empiezan antes de `antes_de` y reescribe el índice."""
+        mapa = _mapear(self.ruta)
+        if mapa is None:
+            return 0
+        try:
+            cantidad = len(mapa) // _REGISTRO.size
+            corte = bisect_left(_Inicios(mapa, cantidad), antes_de)
+            if not corte:
+                return 0
+            viejos = [_REGISTRO.unpack_from(mapa, i * _REGISTRO.size)[0] for i in range(corte)]
+            resto = mapa[corte * _REGISTRO.size:cantidad * _REGISTRO.size]
+        finally:
+            mapa.close()
+
+        # Primero el índice nuevo (los lectores con el viejo mapeado no se enteran)
+        temporal = self.ruta.with_suffix('.tmp')
+        with open(temporal, 'wb') as f:
+            f.write(resto)
+        os.replace(temporal, self.ruta)
+        for secuencia in viejos:
+            (self.directorio / nombre_segmento(secuencia)).unlink(missing_ok=True)
+        return len(viejos)
+
+    # ----------------------------
+    # Lectura
+    # ----------------------------
+    def rango(self, desde, hasta, maximo):
+        """
+        Registros de los segmentos que se reproducen entre `desde` y `hasta`
+        (None = hasta el último), como mucho `maximo`.
+        """
+        mapa = _mapear(self.ruta)
+        if mapa is None:
+            return []
+        try:
+            cantidad = len(mapa) // _REGISTRO.size
+            inicios = _Inicios(mapa, cantidad)
+            # El segmento que contiene `desde` también entra
+            primero = max(0, bisect_right(inicios, desde) - 1)
+            ultimo = cantidad if hasta is None else bisect_left(inicios, hasta)
+            ultimo = min(ultimo, primero + maximo)
+            registros = [_REGISTRO.unpack_from(mapa, i * _REGISTRO.size) for i in range(primero, ultimo)]
+        finally:
+            mapa.close()
+        # El que contiene `desde` puede haber terminado antes (hay un hueco)
+        if registros and registros[0][1] + registros[0][2] <= desde:
+            registros.pop(0)
+        return registros
+
+
+# ============================
+# PLAYLISTS
+# ============================
+def _fecha(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def armar_playlist(registros, terminada):
+    """
+    Texto de una playlist VOD (`terminada`) o en vivo con los registros dados.
+    La en vivo no declara tipo: su comienzo avanza (MEDIA-SEQUENCE = primer registro).
+    """
+    duracion_objetivo = max((math.ceil(registro[2]) for registro in registros), default=1)
+    lineas = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{duracion_objetivo}',
+        f'#EXT-X-MEDIA-SEQUENCE:{registros[0][0] if registros else 0}',
+    ]
+    if terminada:
+        lineas.append('#EXT-X-PLAYLIST-TYPE:VOD')
+    anterior = None
+    for secuencia, inicio, duracion, _ in registros:
+        if anterior is None:
+            lineas.append(f'#EXT-X-PROGRAM-DATE-TIME:{_fecha(inicio)}')
+        elif secuencia != anterior[0] + 1 or inicio - (anterior[1] + anterior[2]) > _TOLERANCIA:
+            # Se cortó la transmisión (o faltan segmentos): el reproductor tiene que saberlo
+            lineas.append('#EXT-X-DISCONTINUITY')
+            lineas.append(f'#EXT-X-PROGRAM-DATE-TIME:{_fecha(inicio)}')
+        lineas.append(f'#EXTINF:{duracion:.3f},')
+        lineas.append(nombre_segmento(secuencia))
+        anterior = (secuencia, inicio, duracion)
+    if terminada:
+        lineas.append('#EXT-X-ENDLIST')
+    return ('\n'.join(lineas) + '\n').encode('utf-8')
+
+
+# ============================
+# INDEXADOR (manage.py dvr indexar)
+# ============================
+def _parsear_fecha(texto):
+    return datetime.fromisoformat(texto.strip().replace('Z', '+00:00')).timestamp()
+
+
+def segmentos_de_playlist(texto):
+    """[(secuencia, uri, duración, inicio o None, discontinuidad)] de una playlist de medios."""
+    secuencia = 0
+    duracion = None
+    fecha = None
+    corte = False
+    segmentos = []
+    for linea in texto.splitlines():
+        linea = linea.strip()
+        if not linea:
+            continue
+        if linea.startswith('#'):
+            if coincidencia := _SECUENCIA.match(linea):
+                secuencia = int(coincidencia.group(1))
+            elif coincidencia := _DURACION.match(linea):
+                duracion = float(coincidencia.group(1))
+            elif coincidencia := _FECHA.match(linea):
+                fecha = _parsear_fecha(coincidencia.group(1))
+            elif linea == '#EXT-X-DISCONTINUITY':
+                corte = True
+            continue
+        if duracion is None:
+            continue  # URI de otra cosa (playlist maestra, partes)
+        segmentos.append((secuencia, linea, duracion, fecha, corte))
+        secuencia += 1
+        corte = False
+        # Sin fecha explícita, el siguiente empieza donde termina este
+        fecha = fecha + duracion if fecha is not None else None
+        duracion = None
+    return segmentos
+
+
+def indexar_playlist(username, ruta_playlist):
+    """Archiva los segmentos nuevos de la playlist en vivo de un canal. Devuelve cuántos."""
+    with open(ruta_playlist, encoding='utf-8') as f:
+        segmentos = segmentos_de_playlist(f.read())
+
+    directorio = directorio_canal(username)
+    indice = IndiceCanal(directorio)
+    ultimo = indice.ultimo()
+    base = Path(ruta_playlist).parent
+
+    siguiente = ultimo[0] + 1 if ultimo is not None else 0
+    # Ya archivado = empieza antes de la mitad del último segmento del archivo
+    limite = ultimo[1] + ultimo[2] / 2 if ultimo is not None else -math.inf
+    # El empaquetador se reinició: su numeración volvió atrás
+    anterior = _fuentes.get(username)
+    reinicio = anterior is not None and bool(segmentos) and segmentos[-1][0] < anterior
+    if segmentos:
+        _fuentes[username] = segmentos[-1][0]
+
+    nuevos = []
+    for _, uri, duracion, inicio, corte in segmentos:
+        origen = base / uri
+        try:
+            estado = origen.stat()
+        except FileNotFoundError:
+            continue  # ya lo borró el empaquetador
+        if inicio is None:
+            # El empaquetador escribe el segmento al terminarlo
+            inicio = estado.st_mtime - duracion
+        if inicio <= limite:
+            continue
+        if (reinicio or corte) and siguiente:
+            siguiente += 1  # el hueco en la numeración marca la discontinuidad
+            reinicio = False
+        directorio.mkdir(parents=True, exist_ok=True)
+        destino = directorio / nombre_segmento(siguiente)
+        # Lo que haya con ese nombre quedó de una pasada cortada: se reemplaza
+        destino.unlink(missing_ok=True)
+        try:
+            os.link(origen, destino)
+        except OSError:
+            shutil.copyfile(origen, destino)
+        nuevos.append((siguiente, inicio, duracion, estado.st_size))
+        siguiente += 1
+        limite = inicio + duracion / 2
+
+    indice.agregar(nuevos)
+    return len(nuevos)
+
+
+def indexar_todo():
+    """Una pasada por todas las playlists de DVR_FUENTE. Devuelve {canal: nuevos}."""
+    fuente = settings.DVR_FUENTE
+    if fuente is None or not os.path.isdir(fuente):
+        return {}
+    resultado = {}
+    for nombre in sorted(os.listdir(fuente)):
+        if nombre.endswith('.m3u8'):
+            username = nombre[:-len('.m3u8')]
+            resultado[username] = indexar_playlist(username, os.path.join(fuente, nombre))
+    return resultado
+
+
+def podar_todo(horas):
+    """Aplica la retención a todos los canales archivados. Devuelve cuántos segmentos borró."""
+    raiz = Path(settings.DVR_DIR)
+    if not raiz.is_dir():
+        return 0
+    antes_de = time.time() - horas * 3600
+    return sum(IndiceCanal(d).podar(antes_de) for d in raiz.iterdir() if d.name.startswith('c_'))
@@ -0,0 +1,185 @@
+"""
+Aviso en tiempo real de cambios de estado de los canales (WebSocket).
+
+Antes el visitante sólo se enteraba de que un stream empezó o terminó
+recargando la página. Ahora cada pestaña abre /ws/estado/<username>/ y un
+único hub por proceso consulta la tabla espejo UNA vez por ciclo para todos
+los canales con espectadores, y reparte el cambio (en_vivo / url_hls) a
+todas las conexiones suscritas.
+
+El estado que se compara es el de la DB (en_vivo, url_hls), no la URL que
+arma build_hls_url: esa depende del origen asignado (origenes.py), y un
+reparto nuevo no es un cambio del canal ni tiene que reiniciar a nadie.
+La URL se resuelve recién al mandar el mensaje.
+
+El hub solo sondea mientras hay alguien suscrito, y las consultas van
+siempre al mismo hilo, que conserva su conexión entre vueltas (o la
+devuelve al pool con DB_POOL; ver replicas.soltar_conexiones).
+"""
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .directorio import directorio
+from .models import CanalTransmision
+from .replicas import soltar_conexiones
+
+logger = logging.getLogger(__name__)
+
+
+def _hls_de(username, url_hls):
+    # Import diferido: views importa el directorio y no queremos ciclos
+    from .views import build_hls_url
+    return url_hls or build_hls_url(f"{username}.m3u8", username)
+
+
+class ConexionWS:
+    """Envoltorio mínimo sobre el `send` ASGI de una conexión."""
+
+    __slots__ = ('send', 'abierta')
+
+    def __init__(self, send):
+        self.send = send
+        self.abierta = True
+
+    async def enviar_texto(self, texto):
+        if not self.abierta:
+            return
+        try:
+            await self.send({'type': 'websocket.send', 'text': texto})
+        except Exception:
+            # El cliente se fue mientras le escribíamos
+            self.abierta = False
+
+
+class HubEstado:
+    """Reparte los cambios de estado de los canales a sus espectadores."""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._suscriptores = {}  # username -> set(ConexionWS)
+        self._estados = {}       # username -> (en_vivo, url_hls) tal como están en la DB
+        self._tarea = None
+        self._oyentes = []       # callbacks(username, anterior, nuevo)
+        # Un solo hilo para las consultas: se queda con su conexión
+        self._consultas = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hub-estado')
+
+    def agregar_oyente(self, funcion):
+        """Registra una función que se llama en cada transición de estado."""
+        self._oyentes.append(funcion)
+
+    def conexiones(self):
+        return sum(len(conexiones) for conexiones in self._suscriptores.values())
+
+    def estado(self, username):
+        return self._estados.get(username)
+
+    def suscribir(self, username, conexion, estado_inicial):
+        self._suscriptores.setdefault(username, set()).add(conexion)
+        self._estados.setdefault(username, estado_inicial)
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.ensure_future(self._bucle())
+
+    def desuscribir(self, username, conexion):
+        conexiones = self._suscriptores.get(username)
+        if not conexiones:
+            return
+        conexiones.discard(conexion)
+        if not conexiones:
+            del self._suscriptores[username]
+            self._estados.pop(username, None)
+
+    async def difundir(self, username, texto):
+        """Escribe el MISMO frame ya serializado en todas las conexiones del canal."""
+        conexiones = list(self._suscriptores.get(username, ()))
+        if conexiones:
+            await asyncio.gather(*(c.enviar_texto(texto) for c in conexiones))
+
+    async def _bucle(self):
+        # Vive mientras haya al menos un espectador conectado
+        while self._suscriptores:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self._sondear()
+            except Exception:
+                logger.exception("Error consultando el estado de los canales")
+
+    @staticmethod
+    def _consultar(usernames):
+        try:
+            # UNA consulta para todos los canales con espectadores
+            filas = list(
+                CanalTransmision.objects.filter(usuario__username__in=usernames)
+                .values_list('usuario__username', 'en_vivo', 'url_hls')
+            )
+        except Exception:
+            soltar_conexiones(fallo=True)
+            raise
+        soltar_conexiones()
+        return filas
+
+    async def _sondear(self):
+        usernames = list(self._suscriptores)
+        if not usernames:
+            return
+
+        filas = await asyncio.get_running_loop().run_in_executor(self._consultas, self._consultar, usernames)
+        for username, en_vivo, url_hls in filas:
+            nuevo = (en_vivo, url_hls or '')
+            anterior = self._estados.get(username)
+            if anterior is None or anterior == nuevo:
+                continue
+
+            self._estados[username] = nuevo
+            directorio.invalidar(username)
+            for oyente in self._oyentes:
+                try:
+                    await oyente(username, anterior, nuevo)
+                except Exception:
+                    logger.exception("Error en oyente de estado de %s", username)
+
+            await self.difundir(username, _mensaje_estado(username, nuevo))
+
+
+def _mensaje_estado(username, estado):
+    en_vivo, url_hls = estado
+    return json.dumps({'tipo': 'estado', 'en_vivo': en_vivo, 'hls_url': _hls_de(username, url_hls)})
+
+
+# Instancia única del proceso
+hub = HubEstado(intervalo=settings.ESTADO_POLL_SEGUNDOS)
+
+
+# ============================
+# CONSUMIDOR ASGI
+# ============================
+async def estado_ws(scope, receive, send, username):
+    """WebSocket /ws/estado/<username>/: sólo servidor -> cliente."""
+    mensaje = await receive()
+    if mensaje['type'] != 'websocket.connect':
+        return
+
+    canal = await sync_to_async(directorio.obtener)(username)
+    if canal is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    await send({'type': 'websocket.accept'})
+
+    conexion = ConexionWS(send)
+    username = canal.username
+    hub.suscribir(username, conexion, (canal.en_vivo, canal.url_hls or ''))
+    try:
+        # Estado actual apenas conecta (por si cambió desde que se renderizó la página)
+        await conexion.enviar_texto(_mensaje_estado(username, hub.estado(username)))
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'websocket.disconnect':
+                break
+    finally:
+        conexion.abierta = False
+        hub.desuscribir(username, conexion)
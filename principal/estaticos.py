@@ -0,0 +1,148 @@
+"""
+Estáticos con nombre por contenido, precomprimidos, y servidos sin nginx.
+
+`collectstatic` con `EstaticosComprimidos` (ver STORAGES):
+- copia cada archivo con un hash de su contenido en el nombre
+  (base.css -> base.3f2a9c1d0e4b.css) y arma staticfiles.json; el tag
+  {% static %} devuelve ese nombre solo, así los templates no cambian,
+- al lado de cada archivo comprimible deja un .gz y, si está instalado
+  el paquete `brotli` (opcional), un .br; solo si salen más chicos.
+
+Como el nombre cambia cuando cambia el contenido, esos archivos se pueden
+cachear para siempre (Cache-Control: immutable).
+
+STATIC_ROOT no se versiona: en cada deploy se corre
+
+    python manage.py derivadas
+    python manage.py collectstatic --clear --noinput
+
+Un árbol copiado sin su staticfiles.json deja URLs con hash que no
+existen en disco.
+
+Con STATIC_SERVIR=True (sin nginx delante) `servir_estatico` los entrega
+desde STATIC_ROOT eligiendo .br / .gz según Accept-Encoding.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional: sin ella solo se genera .gz
+    brotli = None
+
+COMPRIMIBLES = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ico')
+MIN_BYTES = 256
+
+# Nombre con el hash de ManifestStaticFilesStorage (12 hex antes de la extensión)
+_HASHEADO = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_SIN_HASH = 'public, max-age=3600'
+
+
+def _comprimir(ruta):
+    """Escribe ruta.gz / ruta.br si reducen el tamaño. Devuelve cuántos escribió."""
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+
+    escritos = 0
+    variantes = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variantes.append(('.br', lambda d: brotli.compress(d, quality=11)))
+
+    for extension, comprimir in variantes:
+        comprimido = comprimir(datos)
+        destino = ruta + extension
+        if len(comprimido) < len(datos):
+            with open(destino, 'wb') as f:
+                f.write(comprimido)
+            escritos += 1
+        elif os.path.exists(destino):
+            os.remove(destino)  # quedó de una colección anterior
+    return escritos
+
+
+class EstaticosComprimidos(ManifestStaticFilesStorage):
+    # Si falta una entrada del manifest se usa el nombre sin hash en lugar
+    # de romper la página con un 500
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            # Ni en el manifest ni en disco (p. ej. images/favicon.png): URL sin hash
+            return StaticFilesStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        hasheados = []
+        for nombre, hasheado, procesado in super().post_process(paths, dry_run, **options):
+            if hasheado and not isinstance(procesado, Exception):
+                hasheados.append(hasheado)
+            yield nombre, hasheado, procesado
+
+        if dry_run:
+            return
+        for nombre in set(hasheados):
+            ruta = self.path(nombre)
+            if nombre.endswith(COMPRIMIBLES) and os.path.getsize(ruta) >= MIN_BYTES:
+                _comprimir(ruta)
+
+
+def _acepta(cabecera, codificacion):
+    """¿Accept-Encoding admite `codificacion` (con q > 0)?"""
+    for parte in cabecera.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        if nombre.strip() not in (codificacion, '*'):
+            continue
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                return float(parametros[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+@require_safe
+def servir_estatico(request, ruta):
+    """Estáticos desde STATIC_ROOT, con .br / .gz precomprimidos si el cliente los acepta."""
+    try:
+        completa = safe_join(settings.STATIC_ROOT, ruta)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(completa):
+        raise Http404
+
+    tipo, _ = mimetypes.guess_type(completa)
+    aceptadas = request.headers.get('Accept-Encoding', '')
+    archivo, codificacion = completa, None
+    for extension, nombre in (('.br', 'br'), ('.gz', 'gzip')):
+        if os.path.isfile(completa + extension) and _acepta(aceptadas, nombre):
+            archivo, codificacion = completa + extension, nombre
+            break
+
+    estado = os.stat(archivo)
+    desde = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if desde is not None and int(estado.st_mtime) <= desde:
+        respuesta = HttpResponseNotModified()
+    else:
+        respuesta = FileResponse(open(archivo, 'rb'), content_type=tipo or 'application/octet-stream')
+        respuesta['Content-Length'] = estado.st_size
+        if codificacion:
+            respuesta['Content-Encoding'] = codificacion
+    respuesta['Last-Modified'] = http_date(estado.st_mtime)
+    respuesta['Vary'] = 'Accept-Encoding'
+    respuesta['Cache-Control'] = CACHE_INMUTABLE if _HASHEADO.search(ruta) else CACHE_SIN_HASH
+    return respuesta
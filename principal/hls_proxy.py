@@ -0,0 +1,163 @@
+"""
+Proxy de playlists HLS (.m3u8) con single-flight y cache de vida muy corta.
+
+hls.js vuelve a pedir la playlist en cada duración de segmento, así que
+sin proxy la carga sobre el origen crece con la audiencia. Con
+HLS_PROXY=True, `build_hls_url` apunta a /hls/... de este mismo sitio y:
+
+- las peticiones simultáneas de la misma playlist se juntan en UNA sola
+  descarga al origen (single-flight),
+- la respuesta se guarda HLS_PROXY_TTL segundos (menos que un segmento),
+
+de modo que el origen recibe, como mucho, una petición por playlist y TTL
+sin importar cuántos espectadores haya.
+"""
+import hashlib
+import http.client
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TIPO_PLAYLIST = 'application/vnd.apple.mpegurl'
+
+# Pasado este tamaño, cada descarga aprovecha para tirar lo vencido
+_MAX_ENTRADAS = 4096
+
+
+class ErrorOrigen(Exception):
+    """El origen no respondió o respondió con error."""
+
+    def __init__(self, status):
+        super().__init__(f'El origen respondió {status}')
+        self.status = status
+
+
+class Playlist:
+    __slots__ = ('cuerpo', 'etag', 'obtenida', 'vence', 'error')
+
+    def __init__(self, cuerpo, obtenida, vence, error=None):
+        self.cuerpo = cuerpo
+        self.etag = '"%s"' % hashlib.md5(cuerpo, usedforsecurity=False).hexdigest() if cuerpo is not None else None
+        self.obtenida = obtenida
+        self.vence = vence
+        self.error = error
+
+
+class _Vuelo:
+    """Descarga en curso: los seguidores esperan el evento del líder."""
+
+    __slots__ = ('evento', 'resultado')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+
+
+def descargar(url, timeout):
+    """GET al origen; devuelve los bytes o levanta ErrorOrigen."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as respuesta:
+            return respuesta.read()
+    except urllib.error.HTTPError as e:
+        raise ErrorOrigen(e.code)
+    except (urllib.error.URLError, OSError, http.client.HTTPException):
+        raise ErrorOrigen(502)
+    except ValueError:
+        # URL mal armada (p. ej. HLS_ORIGIN_URL vacío)
+        raise ErrorOrigen(502)
+
+
+class CachePlaylists:
+    def __init__(self, origen, ttl, ttl_error, timeout, descargador=descargar):
+        self.origen = origen.rstrip('/')
+        self.ttl = ttl
+        self.ttl_error = ttl_error
+        self.timeout = timeout
+        self._descargar = descargador
+        self._cache = {}    # ruta -> Playlist
+        self._vuelos = {}   # ruta -> _Vuelo
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalescidas = 0
+        self.descargas = 0
+
+    def url_origen(self, ruta):
+        return f'{self.origen}/{quote(ruta)}'
+
+    def obtener(self, ruta):
+        """Playlist fresca para `ruta`; como mucho una descarga en vuelo por ruta."""
+        with self._lock:
+            ahora = time.monotonic()
+            playlist = self._cache.get(ruta)
+            if playlist is not None and playlist.vence > ahora:
+                self.hits += 1
+                return playlist
+
+            vuelo = self._vuelos.get(ruta)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[ruta] = _Vuelo()
+                self.misses += 1
+                self.descargas += 1
+            else:
+                self.coalescidas += 1
+
+        if not lider:
+            vuelo.evento.wait(self.timeout + 1)
+            if vuelo.resultado is None:
+                return Playlist(None, time.time(), 0, error=ErrorOrigen(504))
+            return vuelo.resultado
+
+        playlist = None
+        try:
+            cuerpo = self._descargar(self.url_origen(ruta), self.timeout)
+            playlist = Playlist(cuerpo, time.time(), time.monotonic() + self.ttl)
+        except ErrorOrigen as e:
+            # Los errores también se recuerdan un rato, para no martillar un origen caído
+            playlist = Playlist(None, time.time(), time.monotonic() + self.ttl_error, error=e)
+        except Exception:
+            logger.exception("Error inesperado descargando %s", ruta)
+            playlist = Playlist(None, time.time(), time.monotonic() + self.ttl_error, error=ErrorOrigen(502))
+        finally:
+            # Pase lo que pase el vuelo se cierra: si no, la ruta queda trabada para siempre
+            with self._lock:
+                if playlist is not None:
+                    self._cache[ruta] = playlist
+                self._vuelos.pop(ruta, None)
+                if len(self._cache) > _MAX_ENTRADAS:
+                    self._limpiar_vencidas()
+            vuelo.resultado = playlist
+            vuelo.evento.set()
+        return playlist
+
+    def _limpiar_vencidas(self):
+        ahora = time.monotonic()
+        for ruta in [r for r, p in self._cache.items() if p.vence <= ahora]:
+            del self._cache[ruta]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalescidas': self.coalescidas,
+                'descargas': self.descargas,
+                'entradas': len(self._cache),
+            }
+
+
+# Instancia única del proceso
+playlists = CachePlaylists(
+    origen=settings.HLS_ORIGIN_URL or '',
+    ttl=settings.HLS_PROXY_TTL,
+    ttl_error=settings.HLS_PROXY_TTL_ERROR,
+    timeout=settings.HLS_PROXY_TIMEOUT,
+)
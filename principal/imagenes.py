@@ -0,0 +1,167 @@
+"""
+Derivadas de las imágenes estáticas (logo, avatar...) para pantallas chicas.
+
+Los templates servían los PNG originales (kaircam-icon.png pesa ~400 KB y
+se muestra a 40px). `manage.py derivadas`, que se corre antes de
+collectstatic, genera versiones WebP (y AVIF si Pillow lo soporta) a
+varios anchos en principal/static/principal/derivadas/ junto con un
+manifest.json. El tag {% imagen %} (templatetags/imagenes.py) lee ese
+manifest y arma el <picture> con srcset; si la derivada no existe, queda
+el <img> de siempre.
+
+Del ícono del sitio (ICONO) salen además PNG cuadrados de TAMANOS_ICONO
+px para el favicon y el apple-touch-icon (PNG: es lo que entienden todos
+los navegadores), que el tag {% icono %} toma del mismo manifest.
+
+Pillow es opcional: solo hace falta para generar, no para servir.
+"""
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+try:
+    from PIL import Image
+except ImportError:  # dependencia opcional (solo para `manage.py derivadas`)
+    Image = None
+
+CARPETA = 'principal/derivadas'
+MANIFEST = f'{CARPETA}/manifest.json'
+EXTENSIONES = ('.png', '.jpg', '.jpeg')
+
+ICONO = 'principal/images/kaircam-icon.png'
+TAMANOS_ICONO = (32, 180)
+
+# Sin manifest, cada cuánto se lo vuelve a buscar (no en cada render)
+_REINTENTO_SEGUNDOS = 30
+
+# formato -> (extensión, tipo MIME, opciones de Pillow). AVIF primero: es el más chico.
+FORMATOS = {
+    'avif': ('.avif', 'image/avif', {'quality': 50}),
+    'webp': ('.webp', 'image/webp', {'quality': 80, 'method': 6}),
+}
+
+
+def formatos_disponibles():
+    Image.init()
+    return [formato for formato in FORMATOS if formato.upper() in Image.SAVE]
+
+
+def _anchos(original, anchos):
+    """Anchos a generar: los configurados menores al original, más el tope."""
+    elegidos = sorted({ancho for ancho in anchos if ancho < original})
+    tope = min(original, max(anchos))
+    if tope not in elegidos:
+        elegidos.append(tope)
+    return elegidos
+
+
+def _icono(imagen, tamano):
+    """La imagen entera, centrada en un cuadrado transparente de `tamano` px."""
+    reducida = imagen.convert('RGBA')
+    reducida.thumbnail((tamano, tamano), Image.LANCZOS)
+    lienzo = Image.new('RGBA', (tamano, tamano), (0, 0, 0, 0))
+    lienzo.paste(reducida, ((tamano - reducida.width) // 2, (tamano - reducida.height) // 2))
+    return lienzo
+
+
+def generar(origenes, destino, anchos, calidad=None):
+    """
+    Genera las derivadas de cada (ruta_static, ruta_en_disco) de `origenes`
+    en el directorio `destino` y escribe el manifest. Solo rehace las que
+    son más viejas que su original. Devuelve (manifest, generadas).
+    """
+    if Image is None:
+        raise RuntimeError("Para generar derivadas hace falta Pillow (pip install Pillow).")
+
+    formatos = formatos_disponibles()
+    os.makedirs(destino, exist_ok=True)
+    manifest = {}
+    generadas = 0
+
+    for ruta_static, ruta_disco in origenes:
+        mtime = os.path.getmtime(ruta_disco)
+        with Image.open(ruta_disco) as imagen:
+            imagen.load()
+            if imagen.mode not in ('RGB', 'RGBA'):
+                imagen = imagen.convert('RGBA')
+            ancho_original, alto_original = imagen.size
+            base = os.path.splitext(os.path.basename(ruta_disco))[0]
+
+            variantes = {formato: [] for formato in formatos}
+            for ancho in _anchos(ancho_original, anchos):
+                alto = max(1, round(alto_original * ancho / ancho_original))
+                reducida = None
+                for formato in formatos:
+                    extension, _, opciones = FORMATOS[formato]
+                    nombre = f'{base}-{ancho}{extension}'
+                    salida = os.path.join(destino, nombre)
+                    if not os.path.exists(salida) or os.path.getmtime(salida) < mtime:
+                        if reducida is None:
+                            reducida = imagen.resize((ancho, alto), Image.LANCZOS)
+                        if calidad is not None:
+                            opciones = dict(opciones, quality=calidad)
+                        reducida.save(salida, formato.upper(), **opciones)
+                        generadas += 1
+                    variantes[formato].append([ancho, f'{CARPETA}/{nombre}'])
+
+            manifest[ruta_static] = {
+                'ancho': ancho_original,
+                'alto': alto_original,
+                'variantes': variantes,
+            }
+            if ruta_static == ICONO:
+                iconos = {}
+                for tamano in TAMANOS_ICONO:
+                    nombre = f'{base}-icono-{tamano}.png'
+                    salida = os.path.join(destino, nombre)
+                    if not os.path.exists(salida) or os.path.getmtime(salida) < mtime:
+                        _icono(imagen, tamano).save(salida, 'PNG', optimize=True)
+                        generadas += 1
+                    iconos[str(tamano)] = f'{CARPETA}/{nombre}'
+                manifest[ruta_static]['iconos'] = iconos
+
+    with open(os.path.join(destino, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest, generadas
+
+
+# ============================
+# LECTURA (para el template tag)
+# ============================
+_cache = {'ruta': None, 'mtime': None, 'datos': {}, 'buscado': None}
+
+
+def manifest():
+    """Manifest de derivadas ({} si todavía no se generaron). Se relee si cambia."""
+    ruta = _cache['ruta']
+    if not ruta:
+        # Buscarlo recorre los finders: sin manifest, se recuerda la falta un rato
+        ahora = time.monotonic()
+        if _cache['buscado'] is not None and ahora - _cache['buscado'] < _REINTENTO_SEGUNDOS:
+            return {}
+        _cache['buscado'] = ahora
+        ruta = finders.find(MANIFEST)
+    if not ruta:
+        return {}
+    try:
+        mtime = os.path.getmtime(ruta)
+    except OSError:
+        _cache.update(ruta=None, mtime=None, datos={})
+        return {}
+    if mtime != _cache['mtime']:
+        with open(ruta, encoding='utf-8') as f:
+            _cache.update(ruta=ruta, mtime=mtime, datos=json.load(f))
+    return _cache['datos']
+
+
+def origenes_por_defecto():
+    """Imágenes de principal/static/principal/images (ruta static, ruta en disco)."""
+    carpeta = os.path.join(settings.BASE_DIR, 'principal', 'static', 'principal', 'images')
+    return [
+        (f'principal/images/{nombre}', os.path.join(carpeta, nombre))
+        for nombre in sorted(os.listdir(carpeta))
+        if nombre.lower().endswith(EXTENSIONES)
+    ]
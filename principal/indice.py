@@ -0,0 +1,183 @@
+"""
+Índice en memoria de usernames de canales, para búsqueda y autocompletado.
+
+`search_view` hacía un `iexact` contra auth_user (scan secuencial en
+Postgres) en cada búsqueda. Acá mantenemos los usernames en dos listas
+ordenadas (canales en vivo / fuera del aire) con clave (minúsculas,
+username): como en Django "Juan" y "juan" pueden ser dos cuentas, cada una
+tiene su clave, y el orden sigue siendo el de las minúsculas. Así:
+
+- la búsqueda exacta es un acceso a dict (y si no está, un bisect por la
+  forma en minúsculas),
+- los top-k por prefijo son bisect + k pasos, con los canales en vivo primero.
+
+El índice se refresca de forma incremental: cada tanto se lee la tabla
+espejo y se aplican sólo las diferencias, y el hub de estado en vivo
+avisa las transiciones apenas las ve.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .estado_vivo import hub
+from .models import CanalTransmision
+
+
+def _clave(username):
+    return (username.lower(), username)
+
+
+class IndiceCanales:
+    def __init__(self, refresco):
+        self.refresco = refresco
+        self._datos = {}      # (minúsculas, username) -> (username, en_vivo)
+        self._vivos = []      # claves ordenadas de canales en vivo
+        self._offline = []    # claves ordenadas del resto
+        self._lock = threading.Lock()
+        self._refrescando = threading.Lock()
+        self._actualizado = 0.0
+
+    # ----------------------------
+    # Mantenimiento
+    # ----------------------------
+    def _lista(self, en_vivo):
+        return self._vivos if en_vivo else self._offline
+
+    def _quitar(self, clave):
+        _, en_vivo = self._datos.pop(clave)
+        lista = self._lista(en_vivo)
+        del lista[bisect_left(lista, clave)]
+
+    def _poner(self, clave, username, en_vivo):
+        self._datos[clave] = (username, en_vivo)
+        insort(self._lista(en_vivo), clave)
+
+    def actualizar(self, username, en_vivo):
+        """Alta o cambio de un canal sin releer la tabla."""
+        clave = _clave(username)
+        with self._lock:
+            if self._datos.get(clave) == (username, en_vivo):
+                return
+            if clave in self._datos:
+                self._quitar(clave)
+            self._poner(clave, username, en_vivo)
+
+    def refrescar(self):
+        """Relee la tabla espejo (una consulta) y aplica sólo las diferencias."""
+        filas = CanalTransmision.objects.values_list('usuario__username', 'en_vivo')
+        self._aplicar({_clave(username): (username, en_vivo) for username, en_vivo in filas})
+
+    async def arefrescar(self):
+        """Igual que refrescar, con el ORM async (para las vistas async)."""
+        filas = CanalTransmision.objects.values_list('usuario__username', 'en_vivo')
+        self._aplicar({_clave(username): (username, en_vivo) async for username, en_vivo in filas})
+
+    def _aplicar(self, nuevos):
+        with self._lock:
+            for clave in [c for c in self._datos if c not in nuevos]:
+                self._quitar(clave)
+            for clave, (username, en_vivo) in nuevos.items():
+                actual = self._datos.get(clave)
+                if actual == (username, en_vivo):
+                    continue
+                if actual is not None:
+                    self._quitar(clave)
+                self._poner(clave, username, en_vivo)
+            self._actualizado = time.monotonic()
+
+    def _asegurar_fresco(self):
+        if time.monotonic() - self._actualizado < self.refresco:
+            return
+        # Un solo hilo refresca; el resto sigue usando el índice que hay
+        if not self._refrescando.acquire(blocking=not self._actualizado):
+            return
+        try:
+            if time.monotonic() - self._actualizado >= self.refresco:
+                self.refrescar()
+        finally:
+            self._refrescando.release()
+
+    async def _aasegurar_fresco(self):
+        if time.monotonic() - self._actualizado < self.refresco:
+            return
+        # En el event loop no se espera el lock: si otro ya está refrescando
+        # se sigue con lo que hay (salvo la primera carga, que se hace igual)
+        if not self._refrescando.acquire(blocking=False):
+            if not self._actualizado:
+                await self.arefrescar()
+            return
+        try:
+            if time.monotonic() - self._actualizado >= self.refresco:
+                await self.arefrescar()
+        finally:
+            self._refrescando.release()
+
+    # ----------------------------
+    # Consultas
+    # ----------------------------
+    def _exacto(self, texto):
+        texto = texto.strip()
+        dato = self._datos.get(_clave(texto))
+        if dato is not None:
+            return dato[0]
+        # Sin el exacto, el primero que coincide sin mayúsculas (en vivo primero)
+        pliegue = texto.lower()
+        with self._lock:
+            for lista in (self._vivos, self._offline):
+                i = bisect_left(lista, (pliegue,))
+                if i < len(lista) and lista[i][0] == pliegue:
+                    return lista[i][1]
+        return None
+
+    def exacto(self, texto):
+        """Username con exactamente ese nombre; si no hay, uno que coincida sin mayúsculas; o None."""
+        self._asegurar_fresco()
+        return self._exacto(texto)
+
+    async def aexacto(self, texto):
+        await self._aasegurar_fresco()
+        return self._exacto(texto)
+
+    def prefijo(self, texto, k=10):
+        """Hasta k canales cuyo username empieza con `texto`; primero los en vivo."""
+        self._asegurar_fresco()
+        prefijo = texto.strip().lower()
+        if not prefijo or k <= 0:
+            return []
+
+        resultados = []
+        with self._lock:
+            for lista in (self._vivos, self._offline):
+                i = bisect_left(lista, (prefijo,))
+                while i < len(lista) and len(resultados) < k and lista[i][0].startswith(prefijo):
+                    resultados.append(self._datos[lista[i]])
+                    i += 1
+        return resultados
+
+    def usernames(self):
+        """Todos los usernames canónicos (refresca si hace falta: no llamar desde el event loop)."""
+        self._asegurar_fresco()
+        with self._lock:
+            return [username for username, _ in self._datos.values()]
+
+    def en_vivo(self):
+        """Usernames marcados en vivo en la tabla espejo, ordenados."""
+        self._asegurar_fresco()
+        with self._lock:
+            return [username for _, username in self._vivos]
+
+    def __len__(self):
+        return len(self._datos)
+
+
+# Instancia única del proceso
+indice = IndiceCanales(refresco=settings.INDICE_REFRESCO_SEGUNDOS)
+
+
+async def _al_cambiar_estado(username, anterior, nuevo):
+    indice.actualizar(username, nuevo[0])
+
+
+hub.agregar_oyente(_al_cambiar_estado)
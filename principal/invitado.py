@@ -0,0 +1,136 @@
+"""
+Identidad del invitado (apodo del chat) sin tocar la tabla de sesiones.
+
+Antes `set_guest_name` guardaba el apodo en `request.session`: con el
+backend de sesiones en la DB, cada invitado que elegía apodo creaba una
+fila en django_session y cada visita posterior hacía una consulta para
+leerla. Ahora el apodo viaja en una cookie firmada (HMAC con SECRET_KEY,
+vía django.core.signing) que lleva su propia fecha y vence a los
+GUEST_TOKEN_MAX_AGE segundos: se valida en memoria, sin DB.
+
+Migración: si todavía no hay cookie pero el visitante trae una sesión con
+`guest_name` (de antes del cambio), se lee UNA vez (con el `request.session`
+del request, que ya cachea la fila) y se le entrega la cookie nueva. Si la
+sesión no tenía apodo se entrega igual una cookie firmada vacía, la marca
+de "ya migrado": sin ella cada visita de alguien con sesión y sin apodo
+volvería a consultar la tabla. Con GUEST_MIGRAR_SESION=False eso se apaga
+del todo, en las vistas sync, las async y el WebSocket.
+
+Además del apodo (`n`), el token lleva un id de visitante al azar (`v`),
+con el que apodos.py reconoce quién tiene reservado un apodo en un canal,
+y el username del que lo eligió logueado (`p`), que sí puede usar el
+nombre de su propio canal. Los tokens viejos, sin `v`, siguen valiendo.
+"""
+import secrets
+from importlib import import_module
+
+from django.conf import settings
+from django.core import signing
+
+_SALT = 'principal.invitado'
+
+
+def nuevo_visitante():
+    return secrets.token_urlsafe(12)
+
+
+def firmar(apodo, visitante=None, propio=None):
+    datos = {'n': apodo, 'v': visitante or nuevo_visitante()}
+    if propio:
+        datos['p'] = propio
+    return signing.dumps(datos, salt=_SALT)
+
+
+def _cargar(token):
+    """Dict firmado de la cookie (con apodo o la marca vacía), o None."""
+    if not token:
+        return None
+    try:
+        datos = signing.loads(token, salt=_SALT, max_age=settings.GUEST_TOKEN_MAX_AGE)
+    except signing.BadSignature:  # incluye SignatureExpired
+        return None
+    return datos if isinstance(datos, dict) else None
+
+
+def leer_datos(token):
+    """Dict del token ({'n', 'v', 'p'}), o None si falta, está adulterado, venció o es la marca."""
+    datos = _cargar(token)
+    return datos if datos and datos.get('n') else None
+
+
+def leer_token(token):
+    """Apodo del token, o None si falta, está adulterado o venció."""
+    datos = leer_datos(token)
+    return datos['n'] if datos else None
+
+
+def visitante_de(request):
+    """Id de visitante de la cookie actual (para conservarlo al cambiar de apodo)."""
+    datos = leer_datos(request.COOKIES.get(settings.GUEST_COOKIE_NAME))
+    return datos.get('v') if datos else None
+
+
+def guardar(respuesta, apodo, visitante=None, propio=None):
+    """Entrega la cookie del apodo; sin apodo, la marca de sesión ya migrada."""
+    respuesta.set_cookie(
+        settings.GUEST_COOKIE_NAME,
+        firmar(apodo, visitante, propio) if apodo else signing.dumps({}, salt=_SALT),
+        max_age=settings.GUEST_TOKEN_MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+def _migrar(datos, session_key):
+    """Hay que mirar la sesión vieja: migración activa, sesión y ninguna cookie nuestra."""
+    return bool(settings.GUEST_MIGRAR_SESION and session_key) and datos is None
+
+
+def apodo_de(request):
+    """
+    (apodo, migrar) del visitante. Con `migrar` hay que llamar a `guardar`
+    con el apodo (o None): la sesión vieja ya se leyó y no se vuelve a leer.
+    """
+    datos = _cargar(request.COOKIES.get(settings.GUEST_COOKIE_NAME))
+    if not _migrar(datos, request.COOKIES.get(settings.SESSION_COOKIE_NAME)):
+        return (datos or {}).get('n') or None, False
+    return request.session.get('guest_name') or None, True
+
+
+async def aapodo_de(request):
+    """apodo_de para vistas async: solo la migración pasa por un hilo (DB)."""
+    datos = _cargar(request.COOKIES.get(settings.GUEST_COOKIE_NAME))
+    if not _migrar(datos, request.COOKIES.get(settings.SESSION_COOKIE_NAME)):
+        return (datos or {}).get('n') or None, False
+    return await request.session.aget('guest_name') or None, True
+
+
+def _cookies_de(scope):
+    """Cookies de los headers del handshake de un WebSocket."""
+    cookies = {}
+    for clave, valor in scope.get('headers', ()):
+        if clave != b'cookie':
+            continue
+        for parte in valor.split(b';'):
+            k, _, v = parte.strip().partition(b'=')
+            cookies[k.decode('latin-1')] = v.decode('latin-1')
+    return cookies
+
+
+def invitado_de_scope(scope):
+    """
+    (apodo, visitante, propio) para el scope ASGI. Sin `v` en el token (o
+    con el apodo de la sesión vieja), el visitante es el token o la sesión.
+    """
+    cookies = _cookies_de(scope)
+    token = cookies.get(settings.GUEST_COOKIE_NAME)
+    datos = _cargar(token)
+    if datos and datos.get('n'):
+        return datos['n'], datos.get('v') or token, datos.get('p')
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not _migrar(datos, session_key):
+        return None, session_key, None
+    # El WebSocket no tiene request.session: la sesión vieja se abre a mano
+    engine = import_module(settings.SESSION_ENGINE)
+    return engine.SessionStore(session_key).get('guest_name') or None, session_key, None
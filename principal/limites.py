@@ -0,0 +1,249 @@
+"""
+Límite de peticiones por IP y por ruta (token bucket) en memoria compartida.
+
+La tabla de buckets vive en un archivo mapeado con mmap (LIMITE_ARCHIVO,
+por defecto en RUN_DIR: /dev/shm o el temporal del sistema): todos los
+workers de la máquina ven los mismos contadores sin depender de un
+servicio externo. El archivo se crea recién con la primera decisión.
+
+Formato del archivo:
+- cabecera: firma, cantidad de slots, slots ocupados y contadores por
+  ruta (hash de la ruta, permitidos, rechazados),
+- slots: (clave, fichas, última recarga); la clave es un hash de 64 bits
+  de (ruta, ip) y se ubica con sondeo lineal acotado.
+
+Un slot cuyo bucket ya se recargó entero equivale a uno vacío, así que
+cuando la vecindad está llena se reutiliza ese (o el más viejo).
+
+Cada decisión toma un lock entre hilos + flock entre procesos: son dos
+syscalls y unos pocos struct.pack sobre la tabla, antes de que corra la
+vista (sin sesión, sin DB).
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, el límite queda por proceso
+    fcntl = None
+
+_FIRMA = b'KCLIM002'
+_CABECERA = struct.Struct('<8sI4xQ')   # firma, slots, slots ocupados
+_RUTA = struct.Struct('<QQQ')       # hash de la ruta, permitidos, rechazados
+_SLOT = struct.Struct('<Qdd')       # clave, fichas, última recarga
+_MAX_RUTAS = 32
+_SONDEOS = 8
+
+_INICIO_RUTAS = _CABECERA.size
+_INICIO_SLOTS = _INICIO_RUTAS + _MAX_RUTAS * _RUTA.size
+
+
+def parsear_regla(texto):
+    """'20/10' -> (capacidad=20, fichas por segundo=2.0)"""
+    capacidad, _, segundos = texto.partition('/')
+    capacidad = int(capacidad)
+    segundos = float(segundos or 1)
+    if capacidad <= 0 or segundos <= 0:
+        raise ValueError(f'Regla de límite inválida: {texto!r}')
+    return capacidad, capacidad / segundos
+
+
+def _hash64(*partes):
+    digest = hashlib.blake2b('\0'.join(partes).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1  # 0 marca un slot vacío
+
+
+def ip_de(request):
+    """IP del cliente; detrás de nginx se usa el último salto de LIMITE_IP_HEADER."""
+    if settings.LIMITE_IP_HEADER:
+        reenviada = request.META.get(settings.LIMITE_IP_HEADER, '')
+        if reenviada:
+            return reenviada.rsplit(',', 1)[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class TablaLimites:
+    def __init__(self, ruta_archivo, slots):
+        self.ruta_archivo = ruta_archivo
+        self.slots = slots
+        self._mapa = None
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # Archivo compartido (se abre de nuevo en cada proceso hijo)
+    # ----------------------------
+    def _abrir(self):
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(self.ruta_archivo), exist_ok=True)
+        tamano = _INICIO_SLOTS + self.slots * _SLOT.size
+        fd = os.open(self.ruta_archivo, os.O_RDWR | os.O_CREAT, 0o600)
+        self._fd = fd
+        with self._bloqueo_archivo():
+            if os.fstat(fd).st_size != tamano:
+                os.ftruncate(fd, 0)  # otro tamaño de tabla: se descarta entera
+                os.ftruncate(fd, tamano)
+            mapa = mmap.mmap(fd, tamano)
+            if _CABECERA.unpack_from(mapa, 0)[:2] != (_FIRMA, self.slots):
+                mapa[:tamano] = bytes(tamano)
+                _CABECERA.pack_into(mapa, 0, _FIRMA, self.slots, 0)
+        self._mapa = mapa
+        self._pid = os.getpid()
+
+    def _bloqueo_archivo(self):
+        return _Flock(self._fd)
+
+    # ----------------------------
+    # Decisión
+    # ----------------------------
+    def permitir(self, ruta, ip, capacidad, tasa):
+        """True si (ruta, ip) tiene una ficha disponible (y la consume)."""
+        clave = _hash64(ruta, ip)
+        ahora = time.time()
+        with self._lock:
+            self._abrir()
+            with self._bloqueo_archivo():
+                indice = self._ubicar(clave, ahora, capacidad, tasa)
+                offset = _INICIO_SLOTS + indice * _SLOT.size
+                actual, fichas, ultimo = _SLOT.unpack_from(self._mapa, offset)
+                if actual == 0:
+                    # Los slots no se vacían (se reutilizan): contarlos acá evita recorrer la tabla
+                    firma, slots, ocupados = _CABECERA.unpack_from(self._mapa, 0)
+                    _CABECERA.pack_into(self._mapa, 0, firma, slots, ocupados + 1)
+                if actual != clave:
+                    fichas, ultimo = float(capacidad), ahora
+                fichas = min(float(capacidad), fichas + max(0.0, ahora - ultimo) * tasa)
+
+                permitido = fichas >= 1.0
+                if permitido:
+                    fichas -= 1.0
+                _SLOT.pack_into(self._mapa, offset, clave, fichas, ahora)
+                self._contar(ruta, permitido)
+        return permitido
+
+    def _ubicar(self, clave, ahora, capacidad, tasa):
+        inicio = clave % self.slots
+        reemplazo, mas_viejo = inicio, None
+        for paso in range(_SONDEOS):
+            indice = (inicio + paso) % self.slots
+            actual, fichas, ultimo = _SLOT.unpack_from(self._mapa, _INICIO_SLOTS + indice * _SLOT.size)
+            if actual == clave or actual == 0:
+                return indice
+            # Bucket ya recargado del todo: es como si estuviera vacío
+            if fichas + (ahora - ultimo) * tasa >= capacidad:
+                return indice
+            if mas_viejo is None or ultimo < mas_viejo:
+                reemplazo, mas_viejo = indice, ultimo
+        return reemplazo
+
+    def _contar(self, ruta, permitido):
+        clave = _hash64(ruta)
+        for i in range(_MAX_RUTAS):
+            offset = _INICIO_RUTAS + i * _RUTA.size
+            actual, permitidos, rechazados = _RUTA.unpack_from(self._mapa, offset)
+            if actual in (0, clave):
+                if permitido:
+                    permitidos += 1
+                else:
+                    rechazados += 1
+                _RUTA.pack_into(self._mapa, offset, clave, permitidos, rechazados)
+                return
+
+    # ----------------------------
+    # Monitoreo
+    # ----------------------------
+    def estadisticas(self):
+        """Contadores por ruta (compartidos por todos los workers de la máquina)."""
+        with self._lock:
+            self._abrir()
+            with self._bloqueo_archivo():
+                contadores = {}
+                for i in range(_MAX_RUTAS):
+                    clave, permitidos, rechazados = _RUTA.unpack_from(
+                        self._mapa, _INICIO_RUTAS + i * _RUTA.size,
+                    )
+                    if clave:
+                        contadores[clave] = (permitidos, rechazados)
+                ocupados = _CABECERA.unpack_from(self._mapa, 0)[2]
+
+        rutas = {}
+        for ruta in settings.LIMITES:
+            permitidos, rechazados = contadores.get(_hash64(ruta), (0, 0))
+            rutas[ruta] = {'permitidos': permitidos, 'rechazados': rechazados}
+        return {'rutas': rutas, 'slots_ocupados': ocupados, 'slots': self.slots}
+
+
+class _Flock:
+    __slots__ = ('fd',)
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+# Instancia única del proceso (el archivo se comparte entre procesos)
+tabla = TablaLimites(str(settings.LIMITE_ARCHIVO), settings.LIMITE_SLOTS)
+
+
+def limitar(ruta, json=False, post=None):
+    """
+    Decorador: rechaza con 429 antes de correr la vista cuando la IP agotó
+    las fichas de `ruta` (regla en settings.LIMITES, 'capacidad/segundos').
+    Con `post`, los POST gastan fichas de esa otra regla (su propio bucket).
+    """
+    reglas = {None: (ruta, *parsear_regla(settings.LIMITES[ruta]))}
+    if post is not None:
+        reglas['POST'] = (post, *parsear_regla(settings.LIMITES[post]))
+    mensaje = 'Demasiadas peticiones, probá de nuevo en unos segundos.'
+
+    def regla(request):
+        return reglas.get(request.method) or reglas[None]
+
+    def permitido(request):
+        nombre, capacidad, tasa = regla(request)
+        return not settings.LIMITE_ACTIVO or tabla.permitir(nombre, ip_de(request), capacidad, tasa)
+
+    def rechazo(request):
+        _, _, tasa = regla(request)
+        if json:
+            respuesta = JsonResponse({'success': False, 'error': mensaje}, status=429)
+        else:
+            respuesta = HttpResponse(mensaje, status=429, content_type='text/plain; charset=utf-8')
+        respuesta['Retry-After'] = str(max(1, round(1 / tasa)))
+        return respuesta
+
+    def decorador(vista):
+        # La decisión no hace I/O de red ni DB: en vistas async se toma en el loop
+        if iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envuelta_async(request, *args, **kwargs):
+                if permitido(request):
+                    return await vista(request, *args, **kwargs)
+                return rechazo(request)
+            return envuelta_async
+
+        @wraps(vista)
+        def envuelta(request, *args, **kwargs):
+            if permitido(request):
+                return vista(request, *args, **kwargs)
+            return rechazo(request)
+        return envuelta
+    return decorador
@@ -0,0 +1,155 @@
+"""
+Playlists LL-HLS con recarga bloqueante (_HLS_msn / _HLS_part), en asyncio.
+
+`setupHLS` activa `lowLatencyMode`, pero sin soporte del servidor hls.js
+termina sondeando la playlist sin parar. Con HLS_LOCAL_DIR configurado,
+las playlists se sirven desde el directorio donde el empaquetador escribe
+los segmentos, y una petición con `_HLS_msn` (y opcionalmente `_HLS_part`)
+queda estacionada hasta que ese segmento / parte aparece.
+
+Hay UN vigía por playlist (por event loop), compartido por todos los que
+esperan: revisa el mtime del archivo y, cuando cambia, la vuelve a leer y
+despierta a los que esperan. Cualquier lectura que encuentre una versión
+nueva (la del vigía o la de un request que llega) despierta a los que
+esperan. El vigía solo queda registrado mientras alguien espera: los
+requests sin _HLS_msn y las rutas inexistentes no dejan nada atrás.
+"""
+import asyncio
+import os
+import re
+
+from django.conf import settings
+
+_SECUENCIA = re.compile(r'^#EXT-X-MEDIA-SEQUENCE:(\d+)', re.MULTILINE)
+
+
+class EstadoPlaylist:
+    """Lo mínimo de una playlist para decidir si una espera se cumplió."""
+
+    __slots__ = ('cuerpo', 'ultimo_msn', 'partes')
+
+    def __init__(self, cuerpo):
+        self.cuerpo = cuerpo
+        texto = cuerpo.decode('utf-8', 'replace')
+        coincidencia = _SECUENCIA.search(texto)
+        secuencia = int(coincidencia.group(1)) if coincidencia else 0
+
+        segmentos = 0
+        partes = 0  # partes publicadas del segmento que todavía no cerró
+        for linea in texto.splitlines():
+            if linea.startswith('#EXTINF'):
+                segmentos += 1
+                partes = 0
+            elif linea.startswith('#EXT-X-PART:'):
+                partes += 1
+
+        self.ultimo_msn = secuencia + segmentos - 1
+        self.partes = partes
+
+    def cumple(self, msn, parte):
+        if msn <= self.ultimo_msn:
+            return True
+        return msn == self.ultimo_msn + 1 and parte is not None and parte < self.partes
+
+
+class Vigia:
+    """Sigue UNA playlist en disco y despierta a quienes esperan un cambio."""
+
+    def __init__(self, ruta, intervalo, clave=None, registro=None):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.clave = clave
+        self.estado = None
+        self.esperando = 0
+        self._mtime = None
+        self._cond = asyncio.Condition()
+        self._registro = registro
+        self._tarea = None
+
+    def _leer(self):
+        try:
+            estado = os.stat(self.ruta)
+        except FileNotFoundError:
+            return False
+        if estado.st_mtime_ns == self._mtime:
+            return False
+        with open(self.ruta, 'rb') as f:
+            cuerpo = f.read()
+        self._mtime = estado.st_mtime_ns
+        self.estado = EstadoPlaylist(cuerpo)
+        # Quien sea que vio la versión nueva, los que esperan se enteran ya
+        if self.esperando:
+            asyncio.get_running_loop().create_task(self._notificar())
+        return True
+
+    async def _notificar(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def actual(self):
+        self._leer()
+        return self.estado
+
+    async def esperar(self, msn, parte, limite):
+        """Estado que cumple (msn, parte), o None si se pasó el tiempo límite."""
+        self._leer()
+        if self.estado is not None and self.estado.cumple(msn, parte):
+            return self.estado
+
+        if not self.esperando and self._registro is not None:
+            self._registro._registrar(self)
+        self.esperando += 1
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.ensure_future(self._vigilar())
+        try:
+            async with self._cond:
+                await asyncio.wait_for(
+                    self._cond.wait_for(
+                        lambda: self.estado is not None and self.estado.cumple(msn, parte)
+                    ),
+                    limite,
+                )
+            return self.estado
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.esperando -= 1
+            if not self.esperando:
+                # El último en irse apaga el vigía y lo saca del registro
+                if self._tarea is not None:
+                    self._tarea.cancel()
+                    self._tarea = None
+                if self._registro is not None:
+                    self._registro._soltar(self)
+
+    async def _vigilar(self):
+        while self.esperando:
+            await asyncio.sleep(self.intervalo)
+            self._leer()
+
+
+class Vigias:
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._vigias = {}  # (loop, ruta) -> Vigia con alguien esperando
+
+    def obtener(self, ruta):
+        clave = (asyncio.get_running_loop(), ruta)
+        vigia = self._vigias.get(clave)
+        if vigia is None:
+            vigia = Vigia(ruta, self.intervalo, clave, self)
+        return vigia
+
+    def _registrar(self, vigia):
+        self._vigias.setdefault(vigia.clave, vigia)
+
+    def _soltar(self, vigia):
+        if self._vigias.get(vigia.clave) is vigia:
+            del self._vigias[vigia.clave]
+
+    def __len__(self):
+        return len(self._vigias)
+
+
+# Instancia única del proceso
+vigias = Vigias(intervalo=settings.HLS_VIGIA_INTERVALO)
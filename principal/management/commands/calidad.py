@@ -0,0 +1,127 @@
+"""
+Resume los eventos de calidad del reproductor por canal.
+
+    python manage.py calidad                  # últimas 24 horas, todos los canales
+    python manage.py calidad --horas 2 --canal juan
+    python manage.py calidad --json           # para otro script o un tablero
+    python manage.py calidad --purgar-dias 30 # además, borra archivos viejos
+
+Por canal: sesiones, percentiles del tiempo hasta el primer cuadro, cortes
+por sesión y su duración, cambios de calidad y errores fatales por tipo.
+"""
+import json
+import os
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from principal.calidad import EXTENSION, NOMBRES_TIPOS, leer
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentil(ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, -(-p * len(ordenados) // 100) - 1))
+    return ordenados[indice]
+
+
+class Canal:
+    __slots__ = ('sesiones', 'inicios', 'cortes', 'niveles', 'fatales')
+
+    def __init__(self):
+        self.sesiones = set()
+        self.inicios = []
+        self.cortes = []
+        self.niveles = 0
+        self.fatales = Counter()
+
+    def resumen(self):
+        self.inicios.sort()
+        self.cortes.sort()
+        sesiones = len(self.sesiones)
+        return {
+            'sesiones': sesiones,
+            'inicio_ms': {f'p{p}': percentil(self.inicios, p) for p in PERCENTILES},
+            'cortes': len(self.cortes),
+            'cortes_por_sesion': round(len(self.cortes) / sesiones, 3) if sesiones else 0,
+            'corte_ms': {f'p{p}': percentil(self.cortes, p) for p in PERCENTILES},
+            'cambios_nivel': self.niveles,
+            'fatales': dict(self.fatales.most_common()),
+        }
+
+
+class Command(BaseCommand):
+    help = "Percentiles de calidad de reproducción por canal (eventos de CALIDAD_DIR)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=float, default=24, help="Ventana a resumir (por defecto 24).")
+        parser.add_argument('--canal', help="Solo este canal.")
+        parser.add_argument('--json', action='store_true', help="Salida en JSON.")
+        parser.add_argument('--purgar-dias', type=float, help="Borra los archivos más viejos que esto.")
+
+    def handle(self, *args, **options):
+        directorio = str(settings.CALIDAD_DIR)
+        if not os.path.isdir(directorio):
+            raise CommandError(f"No hay eventos de calidad en {directorio}")
+
+        desde = time.time() - options['horas'] * 3600
+        rutas = sorted(
+            os.path.join(directorio, nombre)
+            for nombre in os.listdir(directorio) if nombre.endswith(EXTENSION)
+        )
+
+        canales = defaultdict(Canal)
+        total = 0
+        for ruta in rutas:
+            if os.path.getmtime(ruta) < desde:
+                continue  # nada de este archivo cae en la ventana
+            for ts, canal, sesion, tipo, valor, detalle in leer(ruta):
+                if ts < desde or (options['canal'] and canal != options['canal']):
+                    continue
+                datos = canales[canal]
+                datos.sesiones.add(sesion)
+                nombre = NOMBRES_TIPOS.get(tipo)
+                if nombre == 'inicio':
+                    datos.inicios.append(valor)
+                elif nombre == 'corte':
+                    datos.cortes.append(valor)
+                elif nombre == 'nivel':
+                    datos.niveles += 1
+                elif nombre == 'fatal':
+                    datos.fatales[detalle or '?'] += 1
+                total += 1
+
+        resumen = {canal: datos.resumen() for canal, datos in sorted(canales.items())}
+        if options['json']:
+            self.stdout.write(json.dumps({'eventos': total, 'canales': resumen}, ensure_ascii=False, indent=2))
+        else:
+            self._tabla(resumen, total)
+
+        if options['purgar_dias'] is not None:
+            limite = time.time() - options['purgar_dias'] * 86400
+            borrados = 0
+            for ruta in rutas:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+                    borrados += 1
+            self.stdout.write(f"{borrados} archivos borrados")
+
+    def _tabla(self, resumen, total):
+        self.stdout.write(f"{total} eventos, {len(resumen)} canales\n")
+        encabezado = (f"{'canal':<20} {'sesiones':>8} {'inicio p50/p95/p99 (ms)':>24} "
+                      f"{'cortes/ses':>10} {'corte p95':>9} {'niveles':>7}  fatales")
+        self.stdout.write(encabezado)
+        for canal, datos in resumen.items():
+            inicio = '/'.join('-' if v is None else str(v) for v in datos['inicio_ms'].values())
+            corte = datos['corte_ms']['p95']
+            fatales = ', '.join(f'{detalle}={n}' for detalle, n in datos['fatales'].items()) or '-'
+            self.stdout.write(
+                f"{canal[:20]:<20} {datos['sesiones']:>8} {inicio:>24} "
+                f"{datos['cortes_por_sesion']:>10} {'-' if corte is None else corte:>9} "
+                f"{datos['cambios_nivel']:>7}  {fatales}"
+            )
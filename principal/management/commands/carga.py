@@ -0,0 +1,357 @@
+"""
+Prueba de carga de las vistas principales, en el mismo proceso.
+
+    DB_ENGINE=django.db.backends.sqlite3 DB_NAME=/tmp/carga.db \\
+        python manage.py carga --canales 2000 --concurrencia 64 --salida hoy.json
+    python manage.py carga --sin-sembrar --escenarios home,canal   # reusa la base ya sembrada
+    python manage.py carga --comparar ayer.json                     # además, cambios contra otra corrida
+
+Siembra una base SQLite con N canales en las tablas espejo
+(core_canaltransmision / core_cliente, que en producción crea el panel) y
+le pega a la aplicación ASGI directamente, sin sockets: un generador con
+asyncio arma los scopes HTTP y mantiene `--concurrencia` requests en
+vuelo. Lo que se mide es Django y las vistas, no la red ni el servidor.
+
+Por escenario: requests por segundo, latencia p50/p95/p99 (ms), consultas
+a la DB por request (de las series de metricas.py) y respuestas por
+código. El JSON lleva además lo que cambia los números (VISTAS_ASYNC,
+PAGINA_CACHE, motor de la base...) y la semilla: con la misma semilla se
+piden las mismas URLs en el mismo orden.
+
+Cada request sale de una IP distinta (10.x.x.x): el limitador corre igual
+que en producción pero no rechaza. Nunca siembra sobre una base que no
+sea SQLite.
+"""
+import asyncio
+import json
+import platform
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from principal.management.commands.calidad import PERCENTILES, percentil
+from principal.metricas import series
+from principal.models import CanalTransmision, Cliente
+
+PREFIJO = 'carga'
+
+
+# ============================
+# SIEMBRA
+# ============================
+def sembrar(cantidad, en_vivo, rng):
+    """Crea las tablas espejo si faltan y deja exactamente `cantidad` canales de prueba."""
+    call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+    tablas = connection.introspection.table_names()
+    with connection.schema_editor() as editor:
+        for modelo in (CanalTransmision, Cliente):
+            if modelo._meta.db_table not in tablas:
+                editor.create_model(modelo)
+
+    Cliente.objects.all().delete()
+    CanalTransmision.objects.all().delete()
+    User.objects.filter(username__startswith=PREFIJO).delete()
+
+    usuarios = User.objects.bulk_create(
+        [User(username=f'{PREFIJO}{i:05d}', password='!') for i in range(cantidad)], batch_size=500,
+    )
+    CanalTransmision.objects.bulk_create(
+        [CanalTransmision(usuario=u, en_vivo=rng.random() < en_vivo, url_hls='') for u in usuarios],
+        batch_size=500,
+    )
+    # Como en el panel: no todos los streamers completan su ficha
+    Cliente.objects.bulk_create(
+        [Cliente(user=u, nombre='Nombre', apellido='Apellido', instagram=u.username)
+         for u in usuarios if rng.random() < 0.7],
+        batch_size=500,
+    )
+    return [u.username for u in usuarios]
+
+
+# ============================
+# ESCENARIOS
+# ============================
+# nombre -> (url_name de la serie en metricas.py, armador de la petición)
+# Cada armador devuelve (método, ruta, query, cuerpo, headers extra).
+def _home(rng, i, canales):
+    return 'GET', reverse('home'), '', b'', []
+
+
+def _busqueda(rng, i, canales):
+    # Una de cada cinco no existe: redirige a home con un mensaje flash
+    q = rng.choice(canales) if rng.random() < 0.8 else f'noexiste{i}'
+    return 'GET', reverse('search'), urlencode({'q': q}), b'', []
+
+
+def _canal(rng, i, canales):
+    return 'GET', reverse('usuario_stream', args=[rng.choice(canales)]), '', b'', []
+
+
+def _apodo(rng, i, canales):
+    token = get_random_string(32)
+    cuerpo = json.dumps({'nickname': f'invitado{i}', 'canal': rng.choice(canales)}).encode()
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'cookie', f'{settings.CSRF_COOKIE_NAME}={token}'.encode()),
+        (b'x-csrftoken', token.encode()),
+    ]
+    return 'POST', reverse('set_guest_name'), '', cuerpo, headers
+
+
+ESCENARIOS = {
+    'home': ('home', _home),
+    'busqueda': ('search', _busqueda),
+    'canal': ('usuario_stream', _canal),
+    'apodo': ('set_guest_name', _apodo),
+}
+
+
+# ============================
+# GENERADOR DE CARGA (ASGI, sin sockets)
+# ============================
+def _ip(i):
+    return f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'
+
+
+def _anfitrion():
+    for host in settings.ALLOWED_HOSTS:
+        if host and host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+async def _pedir(app, peticion, ip, anfitrion, esquema):
+    """Un request completo contra la app. Devuelve (status, segundos)."""
+    metodo, ruta, query, cuerpo, extra = peticion
+    terminado = asyncio.Event()
+    leido = False
+    estado = 0
+
+    async def receive():
+        nonlocal leido
+        if not leido:
+            leido = True
+            return {'type': 'http.request', 'body': cuerpo, 'more_body': False}
+        # Django escucha la desconexión mientras corre la vista: recién al terminar
+        await terminado.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(mensaje):
+        nonlocal estado
+        if mensaje['type'] == 'http.response.start':
+            estado = mensaje['status']
+        elif mensaje['type'] == 'http.response.body' and not mensaje.get('more_body'):
+            terminado.set()
+
+    headers = [
+        (b'host', anfitrion.encode()),
+        (b'origin', f'{esquema}://{anfitrion}'.encode()),
+        (b'content-length', str(len(cuerpo)).encode()),
+        *extra,
+    ]
+    if settings.LIMITE_IP_HEADER.startswith('HTTP_'):
+        nombre = settings.LIMITE_IP_HEADER[5:].lower().replace('_', '-')
+        headers.append((nombre.encode(), ip.encode()))
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': metodo,
+        'scheme': esquema,
+        'path': ruta,
+        'raw_path': ruta.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': headers,
+        'client': (ip, 40000),
+        'server': (anfitrion, 443 if esquema == 'https' else 80),
+    }
+    inicio = time.perf_counter()
+    try:
+        await app(scope, receive, send)
+    finally:
+        terminado.set()
+    return estado, time.perf_counter() - inicio
+
+
+async def _correr(app, peticiones, concurrencia, desde_ip):
+    """Manda todas las peticiones con `concurrencia` en vuelo. (latencias, estados, segundos)."""
+    anfitrion = _anfitrion()
+    esquema = 'https' if settings.SECURE_SSL_REDIRECT else 'http'
+    latencias = []
+    estados = Counter()
+    siguiente = 0
+
+    async def trabajador():
+        nonlocal siguiente
+        while siguiente < len(peticiones):
+            i = siguiente
+            siguiente += 1
+            estado, segundos = await _pedir(app, peticiones[i], _ip(desde_ip + i), anfitrion, esquema)
+            latencias.append(segundos)
+            estados[estado] += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(min(concurrencia, len(peticiones)))))
+    return latencias, estados, time.perf_counter() - inicio
+
+
+def _consultas(url_name):
+    serie = series.get(url_name)
+    return (serie.consultas.suma, serie.consultas.total) if serie else (0, 0)
+
+
+# ============================
+# COMANDO
+# ============================
+class Command(BaseCommand):
+    help = "Prueba de carga en proceso de home, búsqueda, canal y apodo (reporte en JSON)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canales', type=int, default=1000, help="Canales a sembrar (por defecto 1000).")
+        parser.add_argument('--en-vivo', type=float, default=0.2, help="Fracción de canales en vivo.")
+        parser.add_argument('--sin-sembrar', action='store_true', help="Usa los canales que ya hay en la base.")
+        parser.add_argument('--escenarios', default=','.join(ESCENARIOS),
+                            help=f"Separados por coma, de: {', '.join(ESCENARIOS)}.")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests medidos por escenario.")
+        parser.add_argument('--concurrencia', type=int, default=32, help="Requests en vuelo a la vez.")
+        parser.add_argument('--calentamiento', type=int, default=50,
+                            help="Requests previos por escenario que no se miden (caches, índice).")
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--salida', help="Escribe el JSON en este archivo y muestra un resumen.")
+        parser.add_argument('--comparar', help="JSON de otra corrida: agrega el cambio porcentual.")
+
+    def handle(self, *args, **options):
+        escenarios = [nombre.strip() for nombre in options['escenarios'].split(',') if nombre.strip()]
+        desconocidos = [nombre for nombre in escenarios if nombre not in ESCENARIOS]
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+        if options['requests'] <= 0 or options['concurrencia'] <= 0:
+            raise CommandError("--requests y --concurrencia tienen que ser positivos.")
+        anterior = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as f:
+                anterior = json.load(f)
+
+        semilla = options['semilla']
+        if options['sin_sembrar']:
+            canales = list(CanalTransmision.objects.values_list('usuario__username', flat=True))
+        else:
+            if connection.vendor != 'sqlite':
+                raise CommandError(
+                    f"La base es {connection.vendor}: solo se siembra SQLite "
+                    "(DB_ENGINE=django.db.backends.sqlite3 DB_NAME=...) o usá --sin-sembrar."
+                )
+            canales = sembrar(options['canales'], options['en_vivo'], random.Random(semilla))
+        if not canales:
+            raise CommandError("No hay canales en la base.")
+
+        # Se importa acá: arma la app ASGI completa (con la base ya lista)
+        from stream_general.asgi import application
+
+        resultados = asyncio.run(self._medir(application, escenarios, sorted(canales), options))
+        reporte = {
+            'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'semilla': semilla,
+            'canales': len(canales),
+            'requests': options['requests'],
+            'concurrencia': options['concurrencia'],
+            'entorno': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'db': connection.vendor,
+                'vistas_async': settings.VISTAS_ASYNC,
+                'pagina_cache': settings.PAGINA_CACHE,
+                'limites': settings.LIMITE_ACTIVO,
+                'debug': settings.DEBUG,
+            },
+            'escenarios': resultados,
+        }
+        if anterior is not None:
+            reporte['comparacion'] = _comparar(resultados, anterior.get('escenarios', {}))
+
+        texto = json.dumps(reporte, ensure_ascii=False, indent=2)
+        if not options['salida']:
+            self.stdout.write(texto)
+            return
+        with open(options['salida'], 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+        self._tabla(reporte)
+
+    async def _medir(self, app, escenarios, canales, options):
+        resultados = {}
+        desde_ip = 0
+        for nombre in escenarios:
+            url_name, armar = ESCENARIOS[nombre]
+            # Una semilla por escenario: elegir otros escenarios no cambia las URLs de este
+            rng = random.Random(f"{options['semilla']}:{nombre}")
+            calentamiento = [armar(rng, i, canales) for i in range(options['calentamiento'])]
+            peticiones = [armar(rng, i, canales) for i in range(options['calentamiento'],
+                                                                 options['calentamiento'] + options['requests'])]
+
+            await _correr(app, calentamiento, options['concurrencia'], desde_ip)
+            desde_ip += len(calentamiento)
+            suma, total = _consultas(url_name)
+            latencias, estados, segundos = await _correr(app, peticiones, options['concurrencia'], desde_ip)
+            desde_ip += len(peticiones)
+            suma_despues, total_despues = _consultas(url_name)
+
+            latencias.sort()
+            medidos = total_despues - total
+            resultados[nombre] = {
+                'requests': len(latencias),
+                'segundos': round(segundos, 3),
+                'rps': round(len(latencias) / segundos, 1),
+                'latencia_ms': {
+                    **{f'p{p}': round(percentil(latencias, p) * 1000, 2) for p in PERCENTILES},
+                    'max': round(latencias[-1] * 1000, 2),
+                },
+                'consultas_por_request': round((suma_despues - suma) / medidos, 2) if medidos else None,
+                'estados': {str(estado): n for estado, n in sorted(estados.items())},
+            }
+        return resultados
+
+    def _tabla(self, reporte):
+        entorno = ', '.join(f'{clave}={valor}' for clave, valor in reporte['entorno'].items())
+        self.stdout.write(f"{reporte['canales']} canales, concurrencia {reporte['concurrencia']} ({entorno})\n")
+        self.stdout.write(f"{'escenario':<10} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'consultas':>9}  estados")
+        comparacion = reporte.get('comparacion', {})
+        for nombre, datos in reporte['escenarios'].items():
+            latencia = datos['latencia_ms']
+            consultas = datos['consultas_por_request']
+            estados = ', '.join(f'{estado}={n}' for estado, n in datos['estados'].items())
+            linea = (f"{nombre:<10} {datos['rps']:>9} {latencia['p50']:>8} {latencia['p95']:>8} "
+                     f"{latencia['p99']:>8} {'-' if consultas is None else consultas:>9}  {estados}")
+            if nombre in comparacion:
+                cambio = {clave: '?' if valor is None else f'{valor:+}' for clave, valor in comparacion[nombre].items()
+                          if clave != 'consultas'}
+                linea += f"  (req/s {cambio['rps_%']}%, p95 {cambio['p95_%']}%)"
+            self.stdout.write(linea)
+
+
+def _comparar(actuales, anteriores):
+    """Cambio porcentual de req/s y p95 contra otra corrida, por escenario."""
+    def cambio(nuevo, viejo):
+        return round((nuevo - viejo) * 100 / viejo, 1) if viejo else None
+
+    return {
+        nombre: {
+            'rps_%': cambio(datos['rps'], anteriores[nombre]['rps']),
+            'p95_%': cambio(datos['latencia_ms']['p95'], anteriores[nombre]['latencia_ms']['p95']),
+            'consultas': (anteriores[nombre]['consultas_por_request'], datos['consultas_por_request']),
+        }
+        for nombre, datos in actuales.items() if nombre in anteriores
+    }
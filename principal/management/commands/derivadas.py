@@ -0,0 +1,46 @@
+"""
+Genera las derivadas WebP/AVIF de las imágenes estáticas y su manifest.
+
+    python manage.py derivadas
+    python manage.py collectstatic --clear
+
+Correrlo antes de collectstatic, así las derivadas también salen con hash
+y comprimidas.
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from principal import imagenes
+
+
+class Command(BaseCommand):
+    help = "Genera versiones WebP/AVIF a varios anchos de las imágenes de principal/images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anchos', help="Anchos separados por coma (por defecto IMAGENES_ANCHOS).")
+        parser.add_argument('--calidad', type=int, help="Calidad de compresión (por defecto la de cada formato).")
+
+    def handle(self, *args, **options):
+        if imagenes.Image is None:
+            raise CommandError("Para generar derivadas hace falta Pillow (pip install Pillow).")
+
+        anchos = settings.IMAGENES_ANCHOS
+        if options['anchos']:
+            try:
+                anchos = [int(ancho) for ancho in options['anchos'].split(',')]
+            except ValueError:
+                raise CommandError("--anchos debe ser una lista de enteros separados por coma.")
+
+        destino = os.path.join(settings.BASE_DIR, 'principal', 'static', *imagenes.CARPETA.split('/'))
+        manifest, generadas = imagenes.generar(
+            imagenes.origenes_por_defecto(), destino, anchos, options['calidad'],
+        )
+
+        formatos = ', '.join(imagenes.formatos_disponibles())
+        self.stdout.write(f"Formatos: {formatos}")
+        for ruta, datos in manifest.items():
+            anchos_generados = [ancho for ancho, _ in next(iter(datos['variantes'].values()), [])]
+            self.stdout.write(f"  {ruta} ({datos['ancho']}x{datos['alto']}): {anchos_generados}")
+        self.stdout.write(self.style.SUCCESS(f"{generadas} archivos generados en {destino}"))
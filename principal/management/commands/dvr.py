@@ -0,0 +1,96 @@
+"""
+Archivo DVR de los canales.
+
+    python manage.py dvr indexar             # sigue DVR_FUENTE y archiva (corre como servicio)
+    python manage.py dvr indexar --una-vez
+    python manage.py dvr podar               # borra lo más viejo que DVR_RETENCION_HORAS
+    python manage.py dvr falsos juan --minutos 30
+        # playlist y segmentos de mentira en DVR_FUENTE, para probar sin empaquetador
+
+El indexador también aplica la retención una vez por minuto: es el único
+proceso que escribe los índices.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from principal.dvr import indexar_todo, podar_todo
+
+# Paquete nulo de MPEG-TS (PID 0x1FFF): segmentos válidos sin contenido
+_PAQUETE_NULO = b'\x47\x1f\xff\x10' + b'\xff' * 184
+
+
+class Command(BaseCommand):
+    help = "Indexa, poda o simula el archivo de segmentos del DVR."
+
+    def add_arguments(self, parser):
+        parser.add_argument('accion', choices=['indexar', 'podar', 'falsos'])
+        parser.add_argument('canal', nargs='?', help="Canal (solo para 'falsos').")
+        parser.add_argument('--una-vez', action='store_true', help="Indexa una sola pasada y termina.")
+        parser.add_argument('--horas', type=float, default=None, help="Retención (por defecto DVR_RETENCION_HORAS).")
+        parser.add_argument('--minutos', type=float, default=30, help="Duración de la simulación.")
+        parser.add_argument('--duracion', type=float, default=6, help="Duración de cada segmento simulado.")
+        parser.add_argument('--corte', type=float, default=0,
+                            help="Minuto de la simulación en el que se corta la transmisión 1 minuto.")
+
+    def handle(self, *args, **options):
+        if settings.DVR_FUENTE is None and options['accion'] != 'podar':
+            raise CommandError("Falta DVR_FUENTE (o HLS_LOCAL_DIR) con las playlists a archivar.")
+        horas = options['horas'] if options['horas'] is not None else settings.DVR_RETENCION_HORAS
+
+        if options['accion'] == 'podar':
+            self.stdout.write(f"{podar_todo(horas)} segmentos borrados")
+        elif options['accion'] == 'falsos':
+            if not options['canal']:
+                raise CommandError("Indicá el canal: manage.py dvr falsos <username>")
+            self._falsos(options['canal'], options['minutos'], options['duracion'], options['corte'])
+        else:
+            self._indexar(options['una_vez'], horas)
+
+    def _indexar(self, una_vez, horas):
+        ultima_poda = 0.0
+        while True:
+            inicio = time.monotonic()
+            nuevos = {canal: n for canal, n in indexar_todo().items() if n}
+            if nuevos or una_vez:
+                resumen = ', '.join(f'{canal}={n}' for canal, n in nuevos.items()) or 'nada nuevo'
+                self.stdout.write(f"Indexados: {resumen}")
+            if una_vez:
+                return
+            if inicio - ultima_poda >= 60:
+                podar_todo(horas)
+                ultima_poda = inicio
+            time.sleep(max(0.0, settings.DVR_INDEXAR_INTERVALO - (time.monotonic() - inicio)))
+
+    def _falsos(self, canal, minutos, duracion, corte):
+        fuente = Path(settings.DVR_FUENTE)
+        fuente.mkdir(parents=True, exist_ok=True)
+        cantidad = int(minutos * 60 / duracion)
+        paquetes = max(1, int(duracion * 50))   # ~75 kbit/s de relleno
+        inicio = time.time() - cantidad * duracion
+
+        lineas = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{int(duracion + 0.999)}',
+                  '#EXT-X-MEDIA-SEQUENCE:0']
+        instante = inicio
+        for secuencia in range(cantidad):
+            if corte and secuencia == int(corte * 60 / duracion):
+                instante += 60   # un minuto sin transmisión
+                lineas.append('#EXT-X-DISCONTINUITY')
+            if secuencia == 0 or lineas[-1] == '#EXT-X-DISCONTINUITY':
+                fecha = datetime.fromtimestamp(instante, timezone.utc).isoformat(timespec='milliseconds')
+                lineas.append(f"#EXT-X-PROGRAM-DATE-TIME:{fecha.replace('+00:00', 'Z')}")
+            nombre = f'{canal}_{secuencia:06d}.ts'
+            with open(fuente / nombre, 'wb') as f:
+                f.write(_PAQUETE_NULO * paquetes)
+            lineas.append(f'#EXTINF:{duracion:.3f},')
+            lineas.append(nombre)
+            instante += duracion
+
+        temporal = fuente / f'{canal}.m3u8.tmp'
+        temporal.write_text('\n'.join(lineas) + '\n', encoding='utf-8')
+        os.replace(temporal, fuente / f'{canal}.m3u8')
+        self.stdout.write(f"{cantidad} segmentos de {duracion:g} s para '{canal}' en {fuente}")
@@ -0,0 +1,79 @@
+"""
+Une los stacks colapsados del perfilador y muestra dónde se va el tiempo.
+
+    python manage.py perfiles                      # resumen de PERFIL_DIR
+    python manage.py perfiles --salida todo.folded # además, el archivo unido
+    python manage.py perfiles --filtro principal.  # solo frames del sitio
+
+El archivo unido sirve directo para flamegraph.pl o speedscope.
+"""
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from principal.perfilador import EXTENSION
+
+
+def leer(rutas):
+    """Suma los conteos de varios archivos colapsados."""
+    stacks = Counter()
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                stack, _, cuenta = linea.rstrip('\n').rpartition(' ')
+                if stack and cuenta.isdigit():
+                    stacks[stack] += int(cuenta)
+    return stacks
+
+
+class Command(BaseCommand):
+    help = "Une los perfiles colapsados (.folded) y resume las funciones más costosas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivos', nargs='*', help="Archivos a unir (por defecto, todos los de PERFIL_DIR).")
+        parser.add_argument('--salida', help="Escribe el perfil unido en este archivo.")
+        parser.add_argument('--top', type=int, default=20, help="Cantidad de funciones a mostrar.")
+        parser.add_argument('--filtro', default='', help="Solo cuentan los frames que contienen este texto.")
+
+    def handle(self, *args, **options):
+        rutas = options['archivos']
+        if not rutas:
+            directorio = str(settings.PERFIL_DIR)
+            if not os.path.isdir(directorio):
+                raise CommandError(f"No hay perfiles en {directorio}")
+            rutas = sorted(
+                os.path.join(directorio, nombre)
+                for nombre in os.listdir(directorio) if nombre.endswith(EXTENSION)
+            )
+        if not rutas:
+            raise CommandError("No hay archivos de perfil para unir.")
+
+        stacks = leer(rutas)
+        total = sum(stacks.values())
+        if not total:
+            raise CommandError("Los archivos no tienen muestras.")
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                for stack, cuenta in stacks.most_common():
+                    f.write(f'{stack} {cuenta}\n')
+
+        filtro = options['filtro']
+        propio = Counter()      # la función era la hoja del stack (o la última que pasa el filtro)
+        inclusivo = Counter()   # la función estaba en el stack
+        for stack, cuenta in stacks.items():
+            frames = [frame for frame in stack.split(';') if filtro in frame]
+            if not frames:
+                continue
+            propio[frames[-1]] += cuenta
+            for frame in set(frames):
+                inclusivo[frame] += cuenta
+
+        self.stdout.write(f"{len(rutas)} archivos, {total} muestras, {len(stacks)} stacks distintos\n")
+        for titulo, conteo in (("Tiempo propio", propio), ("Tiempo inclusivo", inclusivo)):
+            self.stdout.write(titulo)
+            for frame, cuenta in conteo.most_common(options['top']):
+                self.stdout.write(f"  {cuenta / total:6.1%}  {cuenta:8d}  {frame}")
+            self.stdout.write('')
@@ -0,0 +1,294 @@
+"""
+Métricas por request: consultas a la DB, render de templates y latencia.
+
+`MetricasMiddleware` (el primero de MIDDLEWARE) abre una medición por
+request en un ContextVar; la envoltura de ejecución que se instala en cada
+conexión a la base y el backend de templates `PlantillasMedidas` le suman
+lo suyo. Como los ContextVar viajan a través de sync_to_async, funciona
+igual con vistas sync y async sin agregar saltos de hilo.
+
+Al terminar, la medición se vuelca en:
+- el header Server-Timing de la respuesta (db, tpl, total),
+- histogramas en memoria por vista, con buckets fijos: observar es un
+  bisect y un += sobre listas que ya existen, sin armar dicts de labels.
+  Los requests sync corren en varios hilos, así que las observaciones (y
+  el contador de requests en curso) van bajo un lock; la sección es de
+  unas pocas sumas.
+
+`/metrics` expone todo en formato de texto de Prometheus, junto con los
+contadores de las caches y las conexiones WebSocket activas.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template import TemplateDoesNotExist
+
+from .apodos import apodos
+from .calidad import cola
+from .chat import salas
+from .directorio import directorio
+from .estado_vivo import hub
+from .hls_proxy import playlists
+from .limites import tabla
+from .origenes import origenes
+from .paginas import paginas
+from .presencia import presencia
+from .replicas import replicas
+from .segmentos import segmentos
+
+# Buckets (límite superior de cada uno; el último es +Inf)
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Histograma:
+    __slots__ = ('limites', 'cuentas', 'suma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+class SerieVista:
+    """Todo lo que se acumula de UNA vista (se crea una vez, la primera vez)."""
+
+    __slots__ = ('latencia', 'db', 'plantillas', 'consultas', 'estados')
+
+    def __init__(self):
+        self.latencia = Histograma(BUCKETS_SEGUNDOS)
+        self.db = Histograma(BUCKETS_SEGUNDOS)
+        self.plantillas = Histograma(BUCKETS_SEGUNDOS)
+        self.consultas = Histograma(BUCKETS_CONSULTAS)
+        self.estados = [0] * 5   # respuestas 1xx .. 5xx
+
+
+class Medicion:
+    __slots__ = ('inicio', 'consultas', 'db', 'plantillas')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.db = 0.0
+        self.plantillas = 0.0
+
+
+_actual = ContextVar('medicion', default=None)
+
+series = {}      # nombre de la vista -> SerieVista
+en_curso = 0     # requests HTTP en proceso
+_lock = threading.Lock()   # protege series, sus histogramas y en_curso
+
+
+# ============================
+# DB: una envoltura por conexión
+# ============================
+def _envoltura(execute, sql, params, many, context):
+    medicion = _actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.db += time.perf_counter() - inicio
+        medicion.consultas += 1
+
+
+def _al_conectar(sender, connection, **kwargs):
+    # connection_created se dispara en cada reconexión del mismo wrapper
+    if _envoltura not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_envoltura)
+
+
+connection_created.connect(_al_conectar)
+
+
+# ============================
+# TEMPLATES: backend que mide el render
+# ============================
+class _PlantillaMedida(Template):
+    def render(self, context=None, request=None):
+        medicion = _actual.get()
+        if medicion is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicion.plantillas += time.perf_counter() - inicio
+
+
+class PlantillasMedidas(DjangoTemplates):
+    """DjangoTemplates que suma el tiempo de render a la medición del request."""
+
+    def from_string(self, template_code):
+        return _PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return _PlantillaMedida(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# ============================
+# MIDDLEWARE
+# ============================
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Conexiones que ya estaban abiertas antes de cargar el middleware
+        for conexion in connections.all(initialized_only=True):
+            _al_conectar(None, conexion)
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self._acall(request)
+        global en_curso
+        medicion = Medicion()
+        token = _actual.set(medicion)
+        with _lock:
+            en_curso += 1
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            with _lock:
+                en_curso -= 1
+            _actual.reset(token)
+        return self._cerrar(request, respuesta, medicion)
+
+    async def _acall(self, request):
+        global en_curso
+        medicion = Medicion()
+        token = _actual.set(medicion)
+        with _lock:
+            en_curso += 1
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            with _lock:
+                en_curso -= 1
+            _actual.reset(token)
+        return self._cerrar(request, respuesta, medicion)
+
+    @staticmethod
+    def _cerrar(request, respuesta, medicion):
+        total = time.perf_counter() - medicion.inicio
+        match = request.resolver_match
+        nombre = (match.url_name or match.view_name) if match else 'sin_ruta'
+
+        clase = min(max(respuesta.status_code // 100, 1), 5) - 1
+        with _lock:
+            serie = series.get(nombre)
+            if serie is None:
+                serie = series[nombre] = SerieVista()
+            serie.latencia.observar(total)
+            serie.db.observar(medicion.db)
+            serie.plantillas.observar(medicion.plantillas)
+            serie.consultas.observar(medicion.consultas)
+            serie.estados[clase] += 1
+
+        if settings.METRICAS_SERVER_TIMING:
+            respuesta['Server-Timing'] = (
+                f'db;dur={medicion.db * 1000:.1f};desc="{medicion.consultas} consultas", '
+                f'tpl;dur={medicion.plantillas * 1000:.1f}, '
+                f'total;dur={total * 1000:.1f}'
+            )
+        return respuesta
+
+
+# ============================
+# EXPOSICIÓN (Prometheus)
+# ============================
+def _histograma(lineas, nombre, ayuda, vistas):
+    lineas.append(f'# HELP {nombre} {ayuda}')
+    lineas.append(f'# TYPE {nombre} histogram')
+    for vista, histograma in vistas:
+        acumulado = 0
+        for limite, cuenta in zip(histograma.limites, histograma.cuentas):
+            acumulado += cuenta
+            lineas.append(f'{nombre}_bucket{{vista="{vista}",le="{limite}"}} {acumulado}')
+        lineas.append(f'{nombre}_bucket{{vista="{vista}",le="+Inf"}} {histograma.total}')
+        lineas.append(f'{nombre}_sum{{vista="{vista}"}} {histograma.suma}')
+        lineas.append(f'{nombre}_count{{vista="{vista}"}} {histograma.total}')
+
+
+def _planas(lineas, prefijo, datos, etiqueta=''):
+    """Vuelca un dict de estadisticas(); los dicts anidados pasan a ser un label."""
+    for clave, valor in datos.items():
+        if isinstance(valor, dict):
+            for sub, subvalor in valor.items():
+                if isinstance(subvalor, dict):
+                    _planas(lineas, f'{prefijo}_{clave}', subvalor, f'{{clave="{sub}"}}')
+                elif isinstance(subvalor, (bool, int, float)):
+                    lineas.append(f'{prefijo}_{clave}{{clave="{sub}"}} {float(subvalor)}')
+        elif isinstance(valor, (bool, int, float)):
+            lineas.append(f'{prefijo}_{clave}{etiqueta} {float(valor)}')
+
+
+def _metricas_http(lineas):
+    vistas = sorted(series.items())
+    _histograma(lineas, 'kaircam_request_segundos', 'Latencia total del request.',
+                [(v, s.latencia) for v, s in vistas])
+    _histograma(lineas, 'kaircam_db_segundos', 'Tiempo en consultas a la DB por request.',
+                [(v, s.db) for v, s in vistas])
+    _histograma(lineas, 'kaircam_db_consultas', 'Consultas a la DB por request.',
+                [(v, s.consultas) for v, s in vistas])
+    _histograma(lineas, 'kaircam_template_segundos', 'Tiempo de render de templates por request.',
+                [(v, s.plantillas) for v, s in vistas])
+
+    lineas.append('# TYPE kaircam_respuestas_total counter')
+    for vista, serie in vistas:
+        for clase, cuenta in enumerate(serie.estados, start=1):
+            if cuenta:
+                lineas.append(f'kaircam_respuestas_total{{vista="{vista}",clase="{clase}xx"}} {cuenta}')
+
+    lineas.append('# TYPE kaircam_requests_en_curso gauge')
+    lineas.append(f'kaircam_requests_en_curso {en_curso}')
+
+
+def exposicion():
+    """Texto de /metrics (formato de exposición de Prometheus 0.0.4)."""
+    lineas = []
+    # Los histogramas se leen de una vez, sin observaciones a medio sumar
+    with _lock:
+        _metricas_http(lineas)
+    lineas.append('# TYPE kaircam_ws_conexiones gauge')
+    lineas.append(f'kaircam_ws_conexiones{{tipo="estado"}} {hub.conexiones()}')
+    lineas.append(f'kaircam_ws_conexiones{{tipo="chat"}} {salas.conexiones()}')
+
+    for fuente, estadisticas in (
+        ('directorio', directorio.estadisticas),
+        ('paginas', paginas.estadisticas),
+        ('playlists', playlists.estadisticas),
+        ('segmentos', segmentos.estadisticas),
+        ('limites', tabla.estadisticas),
+        ('presencia', presencia.estadisticas),
+        ('replicas', replicas.estadisticas),
+        ('origenes', origenes.estadisticas),
+        ('apodos', apodos.estadisticas),
+        ('calidad', cola.estadisticas),
+    ):
+        _planas(lineas, f'kaircam_{fuente}', estadisticas())
+
+    return '\n'.join(lineas) + '\n'
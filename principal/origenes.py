@@ -0,0 +1,227 @@
+"""
+Reparto de canales entre varios orígenes HLS (hash consistente con carga acotada).
+
+HLS_BASE_URL acepta varios orígenes separados por coma. Cada canal va
+siempre al mismo origen, así sus segmentos quedan calientes en la cache de
+ese origen y no repartidos en todos:
+
+- Anillo de hash consistente con HLS_ORIGEN_VIRTUALES puntos por origen:
+  el canal va al primer origen sano que aparece recorriendo el anillo
+  desde el hash de su nombre. Si un origen cae, solo se mueven sus canales.
+- Carga acotada: un hilo de fondo reparte los canales con espectadores
+  (según presencia.py) de mayor a menor, y ningún origen recibe más de
+  HLS_ORIGEN_HOLGURA veces la carga promedio; el que se pasaría sigue de
+  largo por el anillo.
+- Un canal con espectadores conserva su origen mientras esté sano y con
+  lugar: moverlo manda a todos sus espectadores contra un origen frío.
+  Por eso el reparto anterior es una entrada más, y vive en un archivo
+  compartido (HLS_ORIGEN_ARCHIVO) junto al ranking de presencia: cada
+  pasada toma el flock, lee el reparto vigente y, si nadie lo rehízo en
+  el último medio HLS_ORIGEN_CHEQUEO, lo rehace y lo escribe. Todos los
+  workers usan el mismo reparto.
+- Con las mismas entradas (ranking, sanos, reparto anterior) sale el mismo
+  reparto: los canales se ordenan por peso redondeado a 3 bits
+  significativos y por nombre.
+- El mismo hilo pide HLS_ORIGEN_SONDA a cada origen cada
+  HLS_ORIGEN_CHEQUEO segundos; después de HLS_ORIGEN_FALLOS fallos
+  seguidos el origen sale del anillo hasta que vuelva a responder.
+
+`elegir()` no hace I/O: una búsqueda en un dict (o un bisect sobre el
+anillo para los canales sin espectadores). Con un solo origen no arranca
+ningún hilo.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .hls_proxy import ErrorOrigen, descargar
+from .limites import _Flock, _hash64
+from .presencia import presencia
+
+logger = logging.getLogger(__name__)
+
+
+def _peso(espectadores):
+    """Espectadores + 1 (un canal recién abierto también cuenta), con 3 bits significativos."""
+    peso = espectadores + 1
+    corte = max(0, peso.bit_length() - 3)
+    return (peso >> corte) << corte
+
+
+class Origenes:
+    def __init__(self, urls, sonda, chequeo, timeout, fallos, holgura, virtuales, archivo=None):
+        self.urls = list(urls)
+        self.archivo = archivo
+        self.sonda = sonda.strip('/')
+        self.chequeo = chequeo
+        self.timeout = timeout
+        self.max_fallos = fallos
+        self.holgura = holgura
+
+        anillo = sorted((_hash64(url, str(i)), url) for url in self.urls for i in range(virtuales))
+        self._puntos = [punto for punto, _ in anillo]
+        self._duenos = [url for _, url in anillo]
+
+        # Hasta el primer chequeo se confía en todos
+        self.sanos = frozenset(self.urls)
+        self.estado = {url: {'sano': True, 'fallos': 0, 'error': None} for url in self.urls}
+        self.cargas = dict.fromkeys(self.urls, 0)
+        self._asignados = {}    # canal -> origen (se reemplaza entero en cada reparto)
+        self.reasignados = 0
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # Elección (por request, sin I/O)
+    # ----------------------------
+    def elegir(self, canal):
+        """Origen (URL base, sin barra final) para los archivos de `canal`."""
+        if len(self.urls) < 2:
+            return self.urls[0] if self.urls else ''
+        self.asegurar()
+        origen = self._asignados.get(canal)
+        if origen is None or origen not in self.sanos:
+            origen = self._recorrer(canal, self.sanos or frozenset(self.urls))
+        return origen
+
+    def _recorrer(self, canal, sanos, cargas=None, tope=None, peso=0):
+        """Primer origen de `sanos` en el anillo desde el canal (con lugar, si hay tope)."""
+        inicio = bisect_left(self._puntos, _hash64(canal))
+        for paso in range(len(self._duenos)):
+            origen = self._duenos[(inicio + paso) % len(self._duenos)]
+            if origen in sanos and (cargas is None or cargas[origen] + peso <= tope):
+                return origen
+        return None
+
+    # ----------------------------
+    # Reparto con carga acotada
+    # ----------------------------
+    def repartir(self):
+        if self.archivo is None:
+            self.aplicar(presencia.ranking(presencia.canales), self._asignados)
+            return
+
+        os.makedirs(os.path.dirname(self.archivo), exist_ok=True)
+        fd = os.open(self.archivo, os.O_RDWR | os.O_CREAT, 0o600)
+        with open(fd, 'r+', encoding='utf-8') as f, _Flock(fd):
+            try:
+                vigente = json.loads(f.read() or '{}')
+            except ValueError:
+                vigente = {}
+            anteriores = vigente.get('asignados', {})
+            if time.time() - vigente.get('generado', 0) < self.chequeo / 2:
+                # Otro worker acaba de repartir: se usa el suyo
+                self._asignados = anteriores
+                return
+            self.aplicar(presencia.ranking(presencia.canales), anteriores)
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps({'generado': time.time(), 'asignados': self._asignados}))
+
+    def aplicar(self, ranking, anteriores=None):
+        """
+        Reparte [(canal, espectadores)]. Los que tienen espectadores se quedan
+        en su origen `anteriores` si sigue sano y con lugar; mismas entradas,
+        mismo reparto.
+        """
+        anteriores = anteriores or {}
+        sanos = self.sanos or frozenset(self.urls)
+        canales = sorted(((canal, espectadores, _peso(espectadores)) for canal, espectadores in ranking),
+                         key=lambda fila: (-fila[2], fila[0]))
+        total = sum(peso for _, _, peso in canales)
+        tope = self.holgura * total / len(sanos)
+
+        cargas = dict.fromkeys(sorted(sanos), 0)   # ordenado: los empates se desempatan igual
+        asignados = {}
+        pendientes = []
+        # Primero se quedan donde estaban los que tienen gente mirando...
+        for canal, espectadores, peso in canales:   # de mayor a menor: los grandes eligen primero
+            origen = anteriores.get(canal)
+            if espectadores and origen in cargas and cargas[origen] + peso <= max(tope, peso):
+                cargas[origen] += peso
+                asignados[canal] = origen
+            else:
+                pendientes.append((canal, peso))
+
+        # ...y después se ubican el resto por el anillo
+        reasignados = 0
+        for canal, peso in pendientes:
+            origen = (self._recorrer(canal, sanos, cargas, max(tope, peso), peso)
+                      or min(cargas, key=cargas.get))
+            if anteriores.get(canal, origen) != origen:
+                reasignados += 1
+            cargas[origen] += peso
+            asignados[canal] = origen
+
+        self._asignados = asignados
+        self.cargas = {url: cargas.get(url, 0) for url in self.urls}
+        self.reasignados += reasignados
+
+    # ----------------------------
+    # Chequeos (un hilo por proceso, arranque perezoso)
+    # ----------------------------
+    def asegurar(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='chequeo-origenes', daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            inicio = time.monotonic()
+            try:
+                self.revisar()
+                self.repartir()
+            except Exception:
+                logger.exception("Error revisando los orígenes HLS")
+            time.sleep(max(0.0, self.chequeo - (time.monotonic() - inicio)))
+
+    def revisar(self):
+        for url in self.urls:
+            estado = self.estado[url]
+            try:
+                descargar(f'{url}/{self.sonda}', self.timeout)
+            except ErrorOrigen as e:
+                fallos = estado['fallos'] + 1
+                sano = fallos < self.max_fallos
+                if estado['sano'] and not sano:
+                    logger.warning("Origen HLS %s fuera del anillo: %s", url, e)
+                self.estado[url] = {'sano': sano, 'fallos': fallos, 'error': str(e)}
+                continue
+            if not estado['sano']:
+                logger.info("Origen HLS %s de vuelta en el anillo", url)
+            self.estado[url] = {'sano': True, 'fallos': 0, 'error': None}
+
+        self.sanos = frozenset(url for url in self.urls if self.estado[url]['sano'])
+        if not self.sanos:
+            logger.error("Ningún origen HLS responde: se reparte entre todos")
+
+    def estadisticas(self):
+        return {
+            'origenes': {
+                url: {'sano': estado['sano'], 'fallos': estado['fallos'], 'carga': self.cargas.get(url, 0)}
+                for url, estado in self.estado.items()
+            },
+            'canales_asignados': len(self._asignados),
+            'reasignados': self.reasignados,
+        }
+
+
+# Instancia única del proceso
+origenes = Origenes(
+    settings.HLS_ORIGENES,
+    sonda=settings.HLS_ORIGEN_SONDA,
+    chequeo=settings.HLS_ORIGEN_CHEQUEO,
+    timeout=settings.HLS_ORIGEN_TIMEOUT,
+    fallos=settings.HLS_ORIGEN_FALLOS,
+    holgura=settings.HLS_ORIGEN_HOLGURA,
+    virtuales=settings.HLS_ORIGEN_VIRTUALES,
+    archivo=str(settings.HLS_ORIGEN_ARCHIVO),
+)
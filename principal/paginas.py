@@ -0,0 +1,113 @@
+"""
+Cache en memoria de páginas de canal ya renderizadas.
+
+Con PAGINA_CACHE=True la página de un canal no lleva nada del visitante
+(apodo, alertas flash): es idéntica para todos, se renderiza sin request
+y se guarda por canal. La clave de versión es un hash de los datos que
+entran al template (en_vivo, url_hls, datos del Cliente...): si alguno
+cambia, la versión cambia y la página se vuelve a renderizar una vez.
+La parte personal la trae el navegador desde /api/yo/.
+
+La versión también es el ETag, y ese sobrevive al proceso (navegadores,
+CDN): por eso lleva además una huella de lo que cambia el HTML sin tocar
+el contexto, es decir el contenido de los templates y los manifests de
+estáticos y de imágenes derivadas. Un deploy que cambia cualquiera de
+ellos cambia todos los ETag.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+from .estado_vivo import hub
+from .imagenes import manifest as manifest_imagenes
+
+_TEMPLATES = Path(__file__).resolve().parent / 'templates'
+_huella = None
+
+
+class PaginaRenderizada:
+    __slots__ = ('version', 'contenido', 'etag', 'generada')
+
+    def __init__(self, version, contenido, generada):
+        self.version = version
+        self.contenido = contenido
+        self.etag = f'"{version}"'
+        self.generada = generada
+
+
+def _calcular_huella():
+    suma = hashlib.sha1()
+    for ruta in sorted(_TEMPLATES.rglob('*.html')):
+        suma.update(ruta.relative_to(_TEMPLATES).as_posix().encode('utf-8'))
+        suma.update(ruta.read_bytes())
+    # Nombres con hash de collectstatic (None sin ManifestStaticFilesStorage o sin collectstatic)
+    leer = getattr(staticfiles_storage, 'read_manifest', None)
+    suma.update(((leer() if leer else None) or '').encode('utf-8'))
+    suma.update(repr(sorted(manifest_imagenes().items())).encode('utf-8'))
+    return suma.hexdigest()
+
+
+def huella():
+    """Huella de templates y manifests: una vez por proceso (en DEBUG, en cada llamada)."""
+    global _huella
+    if _huella is None or settings.DEBUG:
+        _huella = _calcular_huella()
+    return _huella
+
+
+def version_de(contexto):
+    """Hash estable de los datos que determinan el HTML de la página."""
+    datos = repr(sorted(contexto.items())) + huella()
+    return hashlib.sha1(datos.encode('utf-8')).hexdigest()[:20]
+
+
+class CachePaginas:
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._paginas = OrderedDict()  # clave -> PaginaRenderizada
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+
+    def obtener(self, clave, version):
+        with self._lock:
+            pagina = self._paginas.get(clave)
+            if pagina is None or pagina.version != version:
+                return None
+            self._paginas.move_to_end(clave)
+            self.hits += 1
+            return pagina
+
+    def guardar(self, clave, version, contenido):
+        pagina = PaginaRenderizada(version, contenido, time.time())
+        with self._lock:
+            self.renders += 1
+            self._paginas[clave] = pagina
+            self._paginas.move_to_end(clave)
+            while len(self._paginas) > self.max_entradas:
+                self._paginas.popitem(last=False)
+        return pagina
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._paginas.pop(clave, None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {'hits': self.hits, 'renders': self.renders, 'entradas': len(self._paginas)}
+
+
+# Instancia única del proceso
+paginas = CachePaginas(max_entradas=settings.PAGINA_CACHE_MAX)
+
+
+async def _al_cambiar_estado(username, anterior, nuevo):
+    paginas.invalidar(username)
+
+
+hub.agregar_oyente(_al_cambiar_estado)
@@ -0,0 +1,193 @@
+"""
+Perfilador por muestreo (opt-in) con salida en stacks colapsados.
+
+Se perfila un request cuando:
+- PERFIL_ACTIVO=True y sale sorteado (fracción PERFIL_FRACCION), o
+- trae el header X-Kaircam-Perfil desde una IP de PERFIL_IPS.
+
+Mientras haya algún request perfilado en curso, un hilo muestrea
+PERFIL_HZ veces por segundo los stacks de todos los hilos
+(sys._current_frames) y se queda con los que pasan por un handler de
+Django (el hilo del event loop con las vistas async, o el del worker WSGI)
+o están corriendo algo de sync_to_async: el hilo del ejecutor de asgiref
+donde corre una vista sync no tiene ningún frame de los handlers, solo el
+de SyncToAsync.thread_handler. Los hilos ociosos quedan afuera.
+Con varios requests a la vez también se muestrean los no sorteados; para
+ver UN request aislado, usar el header con poco tráfico.
+
+Los conteos se vuelcan cada PERFIL_VOLCADO segundos a PERFIL_DIR en
+formato colapsado ("frame;frame;frame cuenta", el de flamegraph.pl y
+speedscope), conservando los últimos PERFIL_MAX_ARCHIVOS archivos.
+`manage.py perfiles` los une y resume.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .limites import ip_de
+
+HEADER = 'X-Kaircam-Perfil'
+EXTENSION = '.folded'
+
+# Un stack cuenta si pasa por acá (requests HTTP de Django)...
+_MARCA_REQUEST = os.sep + os.path.join('django', 'core', 'handlers') + os.sep
+# ...o si es un hilo del ejecutor de asgiref ocupado (vistas sync bajo ASGI)
+_MARCA_EJECUTOR = SyncToAsync.thread_handler.__code__
+
+
+def _nombre_frame(frame):
+    codigo = frame.f_code
+    modulo = frame.f_globals.get('__name__', '?')
+    return f"{modulo}.{getattr(codigo, 'co_qualname', codigo.co_name)}"
+
+
+def colapsar(frame):
+    """Stack de un frame en formato colapsado (raíz primero), o None si no es de un request."""
+    nombres = []
+    de_request = False
+    while frame is not None:
+        if frame.f_code is _MARCA_EJECUTOR or _MARCA_REQUEST in frame.f_code.co_filename:
+            de_request = True
+        nombres.append(_nombre_frame(frame))
+        frame = frame.f_back
+    if not de_request:
+        return None
+    nombres.reverse()
+    # ';' separa frames en el formato: no puede aparecer dentro de un nombre
+    return ';'.join(nombre.replace(';', ':') for nombre in nombres)
+
+
+class Perfilador:
+    def __init__(self, directorio, hz, volcado, max_archivos):
+        self.directorio = directorio
+        self.intervalo = 1.0 / hz
+        self.volcado = volcado
+        self.max_archivos = max_archivos
+        self.activos = 0
+        self.muestras = 0
+        self._conteos = Counter()
+        self._hay_trabajo = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    # ----------------------------
+    # Requests perfilados
+    # ----------------------------
+    def empezar(self):
+        with self._lock:
+            self.activos += 1
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='perfilador', daemon=True)
+                self._hilo.start()
+        self._hay_trabajo.set()
+
+    def terminar(self):
+        with self._lock:
+            self.activos -= 1
+            if not self.activos:
+                self._hay_trabajo.clear()
+
+    # ----------------------------
+    # Muestreo
+    # ----------------------------
+    def _bucle(self):
+        propio = threading.get_ident()
+        ultimo_volcado = time.monotonic()
+        while True:
+            if not self._hay_trabajo.wait(timeout=self.volcado):
+                # Sin requests perfilados: si quedó algo pendiente, se vuelca
+                if self._conteos:
+                    self.volcar()
+                ultimo_volcado = time.monotonic()
+                continue
+
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                stack = colapsar(frame)
+                if stack is not None:
+                    self._conteos[stack] += 1
+                    self.muestras += 1
+            del frame
+
+            if time.monotonic() - ultimo_volcado >= self.volcado:
+                self.volcar()
+                ultimo_volcado = time.monotonic()
+            time.sleep(self.intervalo)
+
+    def volcar(self):
+        """Escribe las muestras acumuladas a un archivo nuevo y rota los viejos."""
+        conteos, self._conteos = self._conteos, Counter()
+        if not conteos:
+            return None
+
+        os.makedirs(self.directorio, exist_ok=True)
+        nombre = f"perfil-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{EXTENSION}"
+        ruta = os.path.join(self.directorio, nombre)
+        with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+            for stack, cuenta in conteos.most_common():
+                f.write(f'{stack} {cuenta}\n')
+        os.replace(ruta + '.tmp', ruta)
+
+        archivos = sorted(
+            (os.path.join(self.directorio, n) for n in os.listdir(self.directorio) if n.endswith(EXTENSION)),
+            key=os.path.getmtime,
+        )
+        for viejo in archivos[:-self.max_archivos]:
+            try:
+                os.remove(viejo)
+            except FileNotFoundError:
+                pass
+        return ruta
+
+
+# Instancia única del proceso
+perfilador = Perfilador(
+    directorio=str(settings.PERFIL_DIR),
+    hz=settings.PERFIL_HZ,
+    volcado=settings.PERFIL_VOLCADO,
+    max_archivos=settings.PERFIL_MAX_ARCHIVOS,
+)
+
+
+def _elegido(request):
+    if HEADER in request.headers and ip_de(request) in settings.PERFIL_IPS:
+        return True
+    return settings.PERFIL_ACTIVO and random.random() < settings.PERFIL_FRACCION
+
+
+class PerfilMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self._acall(request)
+        if not _elegido(request):
+            return self.get_response(request)
+        perfilador.empezar()
+        try:
+            return self.get_response(request)
+        finally:
+            perfilador.terminar()
+
+    async def _acall(self, request):
+        if not _elegido(request):
+            return await self.get_response(request)
+        perfilador.empezar()
+        try:
+            return await self.get_response(request)
+        finally:
+            perfilador.terminar()
@@ -0,0 +1,264 @@
+"""
+Espectadores aproximados por canal a partir de latidos del reproductor.
+
+Mientras el video se reproduce, el navegador manda cada PRESENCIA_TRAMO/2
+segundos un latido con un id de visor al azar (guardado en localStorage).
+Acá no se guarda una entrada por visor: cada canal tiene un HyperLogLog
+(2^PRESENCIA_PRECISION registros de un byte; con p=10, ~3% de error)
+por tramo de PRESENCIA_TRAMO segundos, en un anillo de PRESENCIA_TRAMOS
+tramos. Los espectadores de un canal son la unión (máximo registro a
+registro) de los tramos vigentes: quienes mandaron algún latido en los
+últimos PRESENCIA_TRAMO .. PRESENCIA_TRAMO * PRESENCIA_TRAMOS segundos.
+
+El ranking (todos los canales, de mayor a menor) recorre la tabla entera:
+se calcula a lo sumo una vez cada PRESENCIA_RANKING_SEGUNDOS por proceso y
+lo comparten /api/presencia/ y el reparto de orígenes.
+
+Como en limites.py, la tabla vive en un archivo mapeado (PRESENCIA_ARCHIVO)
+que comparten todos los workers de la máquina; unir HyperLogLogs es
+idempotente, así que da igual qué worker recibió cada latido. Con varias
+máquinas, los registros de cada una se pueden unir de la misma forma.
+
+Formato del archivo:
+- cabecera: firma, parámetros de la tabla y total de latidos,
+- un slot por canal: (hash del canal, último latido, nombre) y por cada
+  tramo (número de tramo, registros). El canal se ubica con sondeo
+  lineal acotado; un slot sin latidos dentro de la ventana vale como vacío.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+from .limites import _Flock, _hash64
+
+_FIRMA = b'KCPRE001'
+_CABECERA = struct.Struct('<8sIIIIQ')   # firma, canales, precisión, tramos, segundos por tramo, latidos
+_CANAL = struct.Struct('<Qd160s')       # hash del canal, último latido, nombre (utf-8)
+_TRAMO = struct.Struct('<q')            # número de tramo (tiempo // segundos por tramo)
+_SONDEOS = 8
+
+# 2^-k para cada valor posible de un registro
+_POTENCIAS = [2.0 ** -k for k in range(65)]
+
+# Cuánto se reutiliza un conteo ya calculado en este proceso
+_MEMO_SEGUNDOS = 1.0
+
+
+def _hash_visor(visor):
+    digest = hashlib.blake2b(visor.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def estimar(registros):
+    """Cardinalidad estimada de un HyperLogLog (con la corrección para pocos elementos)."""
+    m = len(registros)
+    alfa = 0.7213 / (1 + 1.079 / m)
+    estimado = alfa * m * m / sum(map(_POTENCIAS.__getitem__, registros))
+    ceros = registros.count(0)
+    if estimado <= 2.5 * m and ceros:
+        estimado = m * math.log(m / ceros)
+    return round(estimado)
+
+
+def unir(*registros):
+    """Unión de varios HyperLogLogs del mismo tamaño (máximo registro a registro)."""
+    return bytes(map(max, *registros)) if len(registros) > 1 else bytes(registros[0])
+
+
+class Presencia:
+    def __init__(self, ruta_archivo, canales, precision, segundos_tramo, tramos, ranking_segundos=0):
+        self.ruta_archivo = ruta_archivo
+        self.canales = canales
+        self.precision = precision
+        self.registros = 1 << precision
+        self.segundos_tramo = segundos_tramo
+        self.tramos = tramos
+        self.ventana = segundos_tramo * tramos
+        self._tamano_tramo = _TRAMO.size + self.registros
+        self._tamano_slot = _CANAL.size + tramos * self._tamano_tramo
+        self._memo = {}    # hash del canal -> (vence, espectadores)
+        self.ranking_segundos = ranking_segundos
+        self._ranking = (0.0, None, [])   # (vence, pid, [(canal, espectadores)] completo)
+        self._lock_ranking = threading.Lock()
+        self._mapa = None
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # Archivo compartido (se abre de nuevo en cada proceso hijo)
+    # ----------------------------
+    def _abrir(self):
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(self.ruta_archivo), exist_ok=True)
+        tamano = _CABECERA.size + self.canales * self._tamano_slot
+        parametros = (_FIRMA, self.canales, self.precision, self.tramos, self.segundos_tramo)
+        fd = os.open(self.ruta_archivo, os.O_RDWR | os.O_CREAT, 0o600)
+        self._fd = fd
+        with _Flock(fd):
+            if os.fstat(fd).st_size != tamano:
+                os.ftruncate(fd, 0)  # otra configuración: se descarta entera
+                os.ftruncate(fd, tamano)
+            mapa = mmap.mmap(fd, tamano)
+            if _CABECERA.unpack_from(mapa, 0)[:5] != parametros:
+                mapa[:tamano] = bytes(tamano)
+                _CABECERA.pack_into(mapa, 0, *parametros, 0)
+        self._mapa = mapa
+        self._memo = {}
+        self._pid = os.getpid()
+
+    def _offset(self, indice):
+        return _CABECERA.size + indice * self._tamano_slot
+
+    def _ubicar(self, clave, ahora, crear):
+        """Índice del slot del canal; con `crear`, uno libre (o el más viejo) si no tiene."""
+        inicio = clave % self.canales
+        libre, reemplazo, mas_viejo = None, inicio, None
+        for paso in range(_SONDEOS):
+            indice = (inicio + paso) % self.canales
+            actual, ultimo, _ = _CANAL.unpack_from(self._mapa, self._offset(indice))
+            if actual == clave:
+                return indice
+            if libre is None and (actual == 0 or ahora - ultimo > self.ventana):
+                libre = indice
+            if mas_viejo is None or ultimo < mas_viejo:
+                reemplazo, mas_viejo = indice, ultimo
+        if not crear:
+            return None
+        return libre if libre is not None else reemplazo
+
+    # ----------------------------
+    # Latidos
+    # ----------------------------
+    def latido(self, canal, visor):
+        """Registra que `visor` está mirando `canal`."""
+        clave = _hash64(canal)
+        valor = _hash_visor(visor)
+        bits = 64 - self.precision
+        registro = valor >> bits
+        rango = bits - (valor & ((1 << bits) - 1)).bit_length() + 1
+
+        ahora = time.time()
+        tramo = int(ahora // self.segundos_tramo)
+        with self._lock:
+            self._abrir()
+            with _Flock(self._fd):
+                indice = self._ubicar(clave, ahora, crear=True)
+                offset = self._offset(indice)
+                if _CANAL.unpack_from(self._mapa, offset)[0] != clave:
+                    # Slot nuevo (o de otro canal que ya no tiene espectadores)
+                    self._mapa[offset:offset + self._tamano_slot] = bytes(self._tamano_slot)
+                _CANAL.pack_into(self._mapa, offset, clave, ahora, canal.encode('utf-8')[:160])
+
+                inicio_tramo = offset + _CANAL.size + (tramo % self.tramos) * self._tamano_tramo
+                if _TRAMO.unpack_from(self._mapa, inicio_tramo)[0] != tramo:
+                    # El anillo dio la vuelta: el tramo que estaba acá ya salió de la ventana
+                    self._mapa[inicio_tramo:inicio_tramo + self._tamano_tramo] = bytes(self._tamano_tramo)
+                    _TRAMO.pack_into(self._mapa, inicio_tramo, tramo)
+
+                posicion = inicio_tramo + _TRAMO.size + registro
+                if self._mapa[posicion] < rango:
+                    self._mapa[posicion] = rango
+
+                firma, *parametros, latidos = _CABECERA.unpack_from(self._mapa, 0)
+                _CABECERA.pack_into(self._mapa, 0, firma, *parametros, latidos + 1)
+
+    # ----------------------------
+    # Conteo
+    # ----------------------------
+    def _vigentes(self, offset, tramo_actual):
+        """Registros de los tramos de un slot que siguen dentro de la ventana."""
+        vigentes = []
+        for i in range(self.tramos):
+            inicio = offset + _CANAL.size + i * self._tamano_tramo
+            numero = _TRAMO.unpack_from(self._mapa, inicio)[0]
+            if tramo_actual - self.tramos < numero <= tramo_actual:
+                vigentes.append(self._mapa[inicio + _TRAMO.size:inicio + self._tamano_tramo])
+        return vigentes
+
+    def contar(self, canal):
+        """Espectadores aproximados de `canal` en la ventana."""
+        clave = _hash64(canal)
+        ahora = time.time()
+        memo = self._memo.get(clave)
+        if memo is not None and memo[0] > ahora and self._pid == os.getpid():
+            return memo[1]
+
+        tramo = int(ahora // self.segundos_tramo)
+        with self._lock:
+            self._abrir()
+            with _Flock(self._fd):
+                indice = self._ubicar(clave, ahora, crear=False)
+                vigentes = self._vigentes(self._offset(indice), tramo) if indice is not None else []
+
+        # La cuenta (unos miles de operaciones) se hace fuera del flock
+        espectadores = estimar(unir(*vigentes)) if vigentes else 0
+        self._memo[clave] = (ahora + _MEMO_SEGUNDOS, espectadores)
+        return espectadores
+
+    def ranking(self, limite):
+        """[(canal, espectadores)] de los canales con más espectadores."""
+        vence, pid, conteos = self._ranking
+        if time.monotonic() >= vence or pid != os.getpid():
+            # Un solo hilo recalcula; los demás esperan y usan el mismo
+            with self._lock_ranking:
+                vence, pid, conteos = self._ranking
+                if time.monotonic() >= vence or pid != os.getpid():
+                    conteos = self._calcular_ranking()
+                    self._ranking = (time.monotonic() + self.ranking_segundos, os.getpid(), conteos)
+        return conteos[:limite]
+
+    def _calcular_ranking(self):
+        ahora = time.time()
+        tramo = int(ahora // self.segundos_tramo)
+        canales = []
+        with self._lock:
+            self._abrir()
+            with _Flock(self._fd):
+                for indice in range(self.canales):
+                    offset = self._offset(indice)
+                    clave, ultimo, nombre = _CANAL.unpack_from(self._mapa, offset)
+                    if clave and ahora - ultimo <= self.ventana:
+                        vigentes = self._vigentes(offset, tramo)
+                        if vigentes:
+                            nombre = nombre.rstrip(b'\0').decode('utf-8', 'ignore')
+                            canales.append((nombre, vigentes))
+
+        conteos = [(nombre, estimar(unir(*vigentes))) for nombre, vigentes in canales]
+        conteos.sort(key=lambda par: (-par[1], par[0]))
+        return conteos
+
+    # ----------------------------
+    # Monitoreo
+    # ----------------------------
+    def estadisticas(self):
+        """Latidos recibidos y canales con espectadores (compartido por los workers)."""
+        ahora = time.time()
+        with self._lock:
+            self._abrir()
+            with _Flock(self._fd):
+                latidos = _CABECERA.unpack_from(self._mapa, 0)[-1]
+                activos = 0
+                for indice in range(self.canales):
+                    clave, ultimo, _ = _CANAL.unpack_from(self._mapa, self._offset(indice))
+                    if clave and ahora - ultimo <= self.ventana:
+                        activos += 1
+        return {'latidos': latidos, 'canales_activos': activos, 'canales': self.canales}
+
+
+# Instancia única del proceso (el archivo se comparte entre procesos)
+presencia = Presencia(
+    str(settings.PRESENCIA_ARCHIVO),
+    canales=settings.PRESENCIA_CANALES,
+    precision=settings.PRESENCIA_PRECISION,
+    segundos_tramo=settings.PRESENCIA_TRAMO,
+    tramos=settings.PRESENCIA_TRAMOS,
+    ranking_segundos=settings.PRESENCIA_RANKING_SEGUNDOS,
+)
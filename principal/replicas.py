@@ -0,0 +1,158 @@
+"""
+Lecturas de las tablas espejo (managed=False) desde réplicas.
+
+CanalTransmision y Cliente son copias de solo lectura de las tablas core_*
+del panel: este sitio nunca las escribe, así que sus lecturas pueden ir a
+réplicas en lugar de cargar la base principal. Sesiones, auth y todo lo
+que se escribe sigue en 'default'.
+
+Las réplicas se declaran en DB_REPLICAS (ver settings) con un peso cada
+una. Un hilo de fondo las revisa cada DB_REPLICA_CHEQUEO segundos
+(SELECT 1 y, en Postgres, el retraso de replicación): la que falla o se
+atrasa más de DB_REPLICA_LAG_MAX segundos sale del sorteo hasta que un
+chequeo posterior la encuentre sana. Si no queda ninguna, se lee de
+'default'. Hasta el primer chequeo también se lee de 'default'.
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Retraso de una réplica de Postgres en segundos (0 si está al día o es primaria)
+_SQL_LAG_POSTGRES = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+def soltar_conexiones(fallo=False):
+    """
+    Fin de una consulta de un hilo de fondo (ahí no hay request_finished que
+    cierre nada). Con DB_POOL la conexión vuelve al pool. Sin pool el hilo se
+    la queda para la vuelta siguiente, porque abrir una cada pocos segundos
+    cuesta más que la consulta; si falló se cierra y la próxima abre otra.
+    El hilo tiene que ser siempre el mismo (un executor de un solo hilo):
+    cada hilo que consulta se queda con su conexión.
+    """
+    if fallo or settings.DB_POOL:
+        connections.close_all()
+
+
+def es_espejo(model):
+    return model._meta.app_label == 'principal' and not model._meta.managed
+
+
+class Replicas:
+    def __init__(self, pesos, chequeo, lag_max):
+        self.pesos = pesos          # alias -> peso
+        self.chequeo = chequeo
+        self.lag_max = lag_max
+        self._sanas = ((), ())      # (aliases, pesos) en sorteo; se reemplaza entera
+        self.estado = {alias: {'sana': False, 'lag': None, 'error': 'sin chequear'} for alias in pesos}
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.lecturas = dict.fromkeys(list(pesos) + ['default'], 0)
+
+    # ----------------------------
+    # Sorteo
+    # ----------------------------
+    def elegir(self):
+        """Alias para una lectura de tabla espejo: réplica sana por peso, o 'default'."""
+        self.asegurar()
+        aliases, pesos = self._sanas
+        alias = random.choices(aliases, pesos)[0] if aliases else 'default'
+        self.lecturas[alias] += 1
+        return alias
+
+    # ----------------------------
+    # Chequeos (un hilo por proceso, arranque perezoso)
+    # ----------------------------
+    def asegurar(self):
+        if self._hilo is not None or not self.pesos:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='chequeo-replicas', daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            inicio = time.monotonic()
+            self.revisar()
+            time.sleep(max(0.0, self.chequeo - (time.monotonic() - inicio)))
+
+    def revisar(self):
+        for alias in self.pesos:
+            try:
+                lag = self._medir(alias)
+            except DatabaseError as e:
+                self._marcar(alias, sana=False, lag=None, error=str(e).strip()[:200])
+                continue
+            finally:
+                connections[alias].close()
+
+            if lag > self.lag_max:
+                self._marcar(alias, sana=False, lag=lag, error='atrasada')
+            else:
+                self._marcar(alias, sana=True, lag=lag, error=None)
+
+        sanas = [alias for alias in self.pesos if self.estado[alias]['sana']]
+        self._sanas = (tuple(sanas), tuple(self.pesos[alias] for alias in sanas))
+
+    def _medir(self, alias):
+        conexion = connections[alias]
+        with conexion.cursor() as cursor:
+            if conexion.vendor == 'postgresql':
+                cursor.execute(_SQL_LAG_POSTGRES)
+            else:
+                cursor.execute('SELECT 0')
+            return float(cursor.fetchone()[0] or 0)
+
+    def _marcar(self, alias, sana, lag, error):
+        if self.estado[alias]['sana'] and not sana:
+            logger.warning("Réplica %s fuera del sorteo: %s", alias, error)
+        elif sana and not self.estado[alias]['sana'] and self.estado[alias]['error'] != 'sin chequear':
+            logger.info("Réplica %s de vuelta en el sorteo", alias)
+        self.estado[alias] = {'sana': sana, 'lag': lag, 'error': error}
+
+    def estadisticas(self):
+        return {
+            'replicas': {alias: dict(estado, peso=self.pesos[alias]) for alias, estado in self.estado.items()},
+            'lecturas': dict(self.lecturas),
+        }
+
+
+# Instancia única del proceso
+replicas = Replicas(
+    pesos=settings.DB_REPLICAS_PESOS,
+    chequeo=settings.DB_REPLICA_CHEQUEO,
+    lag_max=settings.DB_REPLICA_LAG_MAX,
+)
+
+
+class RouterReplicas:
+    """Router de DATABASE_ROUTERS: lecturas de tablas espejo a las réplicas."""
+
+    def db_for_read(self, model, **hints):
+        if es_espejo(model):
+            return replicas.elegir()
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas y principal tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas no se migran desde acá
+        return db == 'default'
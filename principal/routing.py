@@ -0,0 +1,26 @@
+"""
+Ruteo de WebSockets del sitio público.
+
+Django atiende el HTTP; las conexiones WebSocket que llegan por daphne
+(stream_general/asgi.py) se despachan acá según el path.
+"""
+import re
+
+from . import chat, estado_vivo
+
+websocket_urlpatterns = [
+    (re.compile(r'^/ws/estado/(?P<username>[^/]+)/$'), estado_vivo.estado_ws),
+    (re.compile(r'^/ws/chat/(?P<username>[^/]+)/$'), chat.chat_ws),
+]
+
+
+async def websocket_application(scope, receive, send):
+    for patron, consumidor in websocket_urlpatterns:
+        coincidencia = patron.match(scope['path'])
+        if coincidencia:
+            return await consumidor(scope, receive, send, **coincidencia.groupdict())
+
+    # Path desconocido: rechazamos el handshake
+    mensaje = await receive()
+    if mensaje['type'] == 'websocket.connect':
+        await send({'type': 'websocket.close', 'code': 4404})
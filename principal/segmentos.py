@@ -0,0 +1,315 @@
+"""
+Cache en disco de segmentos HLS (.ts / .m4s / ...), LRU con tope de bytes.
+
+Va detrás del mismo esquema de URL que arma `build_hls_url` (/hls/...,
+con HLS_PROXY=True) y complementa al proxy de playlists:
+
+- un acierto se sirve con FileResponse desde el archivo, sin cargarlo
+  entero en memoria. Bajo WSGI el servidor puede usar sendfile; bajo ASGI
+  Django lo lee y lo manda en bloques desde Python (para evitarlo, que los
+  sirva nginx directo del directorio de la cache),
+- un fallo descarga el segmento del origen UNA sola vez, a un archivo
+  .part, y todos los que lo piden mientras tanto van leyendo lo que ya
+  se escribió (no esperan a que termine la descarga),
+- se respetan los Range de HTTP (un solo rango por petición).
+
+Cada proceso lleva su propia cuenta LRU del directorio y el tope de bytes
+es por worker: con N workers sobre el mismo directorio el disco puede
+llegar a N veces el tope. Los .part llevan el pid del
+proceso que los llena, así al arrancar solo se borran los propios o los
+de procesos que ya no existen, nunca los que otro worker está llenando.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TIPOS_SEGMENTO = {
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.aac': 'audio/aac',
+    '.vtt': 'text/vtt',
+}
+
+_BLOQUE = 64 * 1024
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _pid_de_parcial(nombre):
+    """Pid de '<clave>.<pid>.part' (None para los de antes, sin pid)."""
+    partes = nombre.split('.')
+    return int(partes[-2]) if len(partes) >= 3 and partes[-2].isdigit() else None
+
+
+def _proceso_vivo(pid):
+    if pid is None or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True   # existe, es de otro usuario
+    return True
+
+
+def es_segmento(ruta):
+    return os.path.splitext(ruta)[1].lower() in TIPOS_SEGMENTO
+
+
+def parsear_rango(cabecera, total):
+    """
+    (inicio, fin) inclusivo para un header Range de un solo rango, None si no
+    hay rango (o no se entiende) y ValueError si no se puede satisfacer.
+    """
+    if not cabecera or total is None:
+        return None
+    coincidencia = _RANGO.match(cabecera.strip())
+    if not coincidencia:
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # bytes=-N: los últimos N bytes
+        largo = int(fin)
+        if largo == 0:
+            raise ValueError('Rango vacío')
+        return max(0, total - largo), total - 1
+    inicio = int(inicio)
+    fin = min(int(fin), total - 1) if fin else total - 1
+    if inicio >= total or inicio > fin:
+        raise ValueError('Rango fuera del archivo')
+    return inicio, fin
+
+
+class ArchivoAcotado:
+    """Lectura de [inicio, fin] de un archivo abierto, para FileResponse."""
+
+    def __init__(self, archivo, inicio, fin):
+        self._archivo = archivo
+        self._restante = fin - inicio + 1
+        archivo.seek(inicio)
+
+    def read(self, n=-1):
+        if self._restante <= 0:
+            return b''
+        n = self._restante if n is None or n < 0 else min(n, self._restante)
+        datos = self._archivo.read(n)
+        self._restante -= len(datos)
+        return datos
+
+    def close(self):
+        self._archivo.close()
+
+
+class Relleno:
+    """Descarga en curso de un segmento hacia su archivo .part."""
+
+    def __init__(self, ruta_parcial):
+        self.ruta_parcial = ruta_parcial
+        self.escritos = 0
+        self.total = None          # Content-Length del origen, si vino
+        self.status = None         # status de error del origen
+        self.terminado = False
+        self.cond = threading.Condition()
+        self.cabeceras = threading.Event()
+
+    def leer(self, archivo, inicio, fin, espera):
+        """Generador con los bytes [inicio, fin] a medida que se van escribiendo."""
+        pos = inicio
+        try:
+            while fin is None or pos <= fin:
+                with self.cond:
+                    while self.escritos <= pos and not self.terminado:
+                        if not self.cond.wait(espera):
+                            return
+                    disponibles = self.escritos
+                    if self.status is not None:
+                        return
+                if disponibles <= pos:
+                    return
+                hasta = disponibles if fin is None else min(disponibles, fin + 1)
+                archivo.seek(pos)
+                while pos < hasta:
+                    datos = archivo.read(min(_BLOQUE, hasta - pos))
+                    if not datos:
+                        return
+                    pos += len(datos)
+                    yield datos
+        finally:
+            archivo.close()
+
+
+class CacheSegmentos:
+    def __init__(self, directorio, max_bytes, origen, timeout):
+        self.directorio = Path(directorio)
+        self.max_bytes = max_bytes
+        self.origen = origen.rstrip('/')
+        self.timeout = timeout
+        self._lru = OrderedDict()   # clave -> bytes
+        self._bytes = 0
+        self._rellenos = {}         # clave -> Relleno
+        self._lock = threading.Lock()
+        self._cargado = False
+        self.hits = 0
+        self.misses = 0
+        self.coalescidas = 0
+
+    def _ruta(self, clave):
+        return self.directorio / clave
+
+    @staticmethod
+    def clave(ruta):
+        extension = os.path.splitext(ruta)[1].lower()
+        return hashlib.sha1(ruta.encode('utf-8')).hexdigest() + extension
+
+    def _cargar(self):
+        """Arma la cuenta LRU con lo que haya en disco (más viejo primero)."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        archivos = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.name.endswith('.part'):
+                # Descargas que quedaron a medias en una corrida anterior
+                if not _proceso_vivo(_pid_de_parcial(entrada.name)):
+                    try:
+                        os.unlink(entrada.path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            estado = entrada.stat()
+            archivos.append((estado.st_mtime, entrada.name, estado.st_size))
+        for _, nombre, tamano in sorted(archivos):
+            self._lru[nombre] = tamano
+            self._bytes += tamano
+        self._cargado = True
+        self._desalojar()
+
+    def _desalojar(self):
+        while self._bytes > self.max_bytes and self._lru:
+            nombre, tamano = self._lru.popitem(last=False)
+            self._bytes -= tamano
+            try:
+                os.unlink(self._ruta(nombre))
+            except FileNotFoundError:
+                pass
+
+    def obtener(self, ruta):
+        """
+        ('archivo', archivo_abierto) si está en cache, o ('relleno', Relleno)
+        si hay (o arranca) una descarga.
+        """
+        clave = self.clave(ruta)
+        with self._lock:
+            if not self._cargado:
+                self._cargar()
+
+            if clave in self._lru:
+                try:
+                    archivo = open(self._ruta(clave), 'rb')
+                except FileNotFoundError:
+                    # Lo borró otro worker: lo sacamos de la cuenta y lo bajamos de nuevo
+                    self._bytes -= self._lru.pop(clave)
+                else:
+                    self._lru.move_to_end(clave)
+                    self.hits += 1
+                    return 'archivo', archivo
+
+            relleno = self._rellenos.get(clave)
+            if relleno is not None:
+                self.coalescidas += 1
+                return 'relleno', relleno
+
+            self.misses += 1
+            relleno = Relleno(self._ruta(f'{clave}.{os.getpid()}.part'))
+            open(relleno.ruta_parcial, 'wb').close()
+            self._rellenos[clave] = relleno
+
+        hilo = threading.Thread(target=self._llenar, args=(clave, ruta, relleno), daemon=True)
+        hilo.start()
+        return 'relleno', relleno
+
+    def _llenar(self, clave, ruta, relleno):
+        url = f'{self.origen}/{quote(ruta)}'
+        completo = False
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as respuesta, \
+                    open(relleno.ruta_parcial, 'r+b') as destino:
+                largo = respuesta.headers.get('Content-Length')
+                relleno.total = int(largo) if largo and largo.isdigit() else None
+                relleno.cabeceras.set()
+                while True:
+                    datos = respuesta.read(_BLOQUE)
+                    if not datos:
+                        break
+                    destino.write(datos)
+                    destino.flush()
+                    with relleno.cond:
+                        relleno.escritos += len(datos)
+                        relleno.cond.notify_all()
+            if relleno.total is not None and relleno.escritos != relleno.total:
+                # Un cuerpo cortado no puede quedar en cache como si fuera el segmento
+                logger.warning("Segmento %s incompleto: %d de %d bytes", url, relleno.escritos, relleno.total)
+                relleno.status = 502
+            else:
+                os.replace(relleno.ruta_parcial, self._ruta(clave))
+                completo = True
+        except urllib.error.HTTPError as e:
+            relleno.status = e.code
+        except (urllib.error.URLError, OSError):
+            logger.warning("No se pudo descargar el segmento %s", url)
+            relleno.status = 502
+        except Exception:
+            logger.exception("Error inesperado descargando el segmento %s", url)
+            relleno.status = 502
+        finally:
+            if not completo and relleno.status is None:
+                relleno.status = 502
+            # Pase lo que pase el relleno se suelta: si no, la clave queda trabada
+            with self._lock:
+                self._rellenos.pop(clave, None)
+                if completo:
+                    self._lru[clave] = relleno.escritos
+                    self._bytes += relleno.escritos
+                    self._desalojar()
+            if not completo:
+                try:
+                    os.unlink(relleno.ruta_parcial)
+                except FileNotFoundError:
+                    pass
+
+            relleno.cabeceras.set()
+            with relleno.cond:
+                relleno.terminado = True
+                relleno.cond.notify_all()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalescidas': self.coalescidas,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'archivos': len(self._lru),
+            }
+
+
+# Instancia única del proceso
+segmentos = CacheSegmentos(
+    directorio=settings.HLS_SEGMENT_CACHE_DIR,
+    max_bytes=settings.HLS_SEGMENT_CACHE_BYTES,
+    origen=settings.HLS_ORIGIN_URL or '',
+    timeout=settings.HLS_PROXY_TIMEOUT,
+)
@@ -0,0 +1,229 @@
+"""
+Sondeo de vida de los streams y foto (snapshot) del estado en memoria.
+
+`CanalTransmision.en_vivo` lo escribe el panel y puede quedar viejo: un
+canal figura en vivo aunque su .m3u8 dejó de avanzar. Un hilo de fondo
+corre un loop asyncio que, cada SONDEO_INTERVALO segundos:
+
+1. lee (una consulta) los canales marcados en vivo,
+2. pide sus playlists con concurrencia acotada y peticiones condicionales
+   (If-None-Match / If-Modified-Since), en el mismo lugar de donde las
+   toman los espectadores: la url_hls del canal, el origen que le asigna
+   build_hls_url, el que usa el proxy o el archivo que sirve llhls,
+3. mira si EXT-X-MEDIA-SEQUENCE avanzó; si no avanza hace más de
+   SONDEO_ESTANCADO segundos, el canal se marca como estancado,
+4. publica una foto inmutable que las vistas leen sin ir a la base.
+
+La consulta del paso 1 va siempre al mismo hilo, que conserva su conexión
+entre ciclos (ver replicas.soltar_conexiones).
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .models import CanalTransmision
+from .replicas import soltar_conexiones
+
+logger = logging.getLogger(__name__)
+
+_SECUENCIA = re.compile(rb'#EXT-X-MEDIA-SEQUENCE:(\d+)')
+
+OK = 'ok'
+ESTANCADO = 'estancado'
+CAIDO = 'caido'
+TERMINADO = 'terminado'
+
+
+class Foto:
+    """Estado de todos los canales marcados en vivo en un instante dado."""
+
+    __slots__ = ('generada', 'canales')
+
+    def __init__(self, generada, canales):
+        self.generada = generada
+        self.canales = canales  # username -> dict
+
+    def en_vivo(self, username):
+        canal = self.canales.get(username)
+        return canal is not None and canal['estado'] == OK
+
+
+class _Seguimiento:
+    """Lo que se recuerda de cada playlist entre sondeos."""
+
+    __slots__ = ('etag', 'modificada', 'secuencia', 'avanzo', 'terminada')
+
+    def __init__(self):
+        self.etag = None
+        self.modificada = None
+        self.secuencia = None
+        self.avanzo = time.monotonic()
+        self.terminada = False
+
+
+def url_playlist(username, url_hls):
+    """URL de donde sale la playlist que ven los espectadores del canal."""
+    if url_hls:
+        return url_hls
+    archivo = f"{settings.HLS_PROGRAM_PATH.strip('/')}/{username}.m3u8"
+    if settings.HLS_LOCAL_DIR:
+        # La sirve llhls desde el disco: se lee el mismo archivo
+        return (settings.HLS_LOCAL_DIR / archivo).resolve().as_uri()
+    if settings.HLS_PROXY:
+        # Lo que le pide el proxy al origen
+        return f"{(settings.HLS_ORIGIN_URL or '').rstrip('/')}/{archivo}"
+    # Import diferido: views importa este módulo
+    from .views import build_hls_url
+    return build_hls_url(f'{username}.m3u8', username)
+
+
+class Sondeador:
+    def __init__(self, intervalo, concurrencia, estancado, timeout):
+        self.intervalo = intervalo
+        self.concurrencia = concurrencia
+        self.estancado = estancado
+        self.timeout = timeout
+        self.foto = None
+        self._seguimientos = {}  # url -> _Seguimiento
+        self._hilo = None
+        self._lock = threading.Lock()
+        # Un solo hilo para la consulta: se queda con su conexión
+        self._consultas = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sondeo-db')
+        self.sondeos = 0
+        self.no_modificados = 0
+
+    # ----------------------------
+    # Arranque (perezoso, un hilo por proceso)
+    # ----------------------------
+    def asegurar(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(
+                    target=lambda: asyncio.run(self._bucle()), name='sondeo-hls', daemon=True,
+                )
+                self._hilo.start()
+
+    def instantanea(self):
+        """Última foto publicada, o None si todavía no hay (o el sondeo está apagado)."""
+        if not settings.SONDEO_ACTIVO:
+            return None
+        self.asegurar()
+        return self.foto
+
+    # ----------------------------
+    # Ciclo
+    # ----------------------------
+    async def _bucle(self):
+        semaforo = asyncio.Semaphore(self.concurrencia)
+        while True:
+            inicio = time.monotonic()
+            try:
+                await self.ciclo(semaforo)
+            except Exception:
+                logger.exception("Error en el sondeo de streams")
+            await asyncio.sleep(max(0.0, self.intervalo - (time.monotonic() - inicio)))
+
+    @staticmethod
+    def _canales_marcados():
+        try:
+            canales = list(
+                CanalTransmision.objects.filter(en_vivo=True)
+                .values_list('usuario__username', 'url_hls')
+            )
+        except Exception:
+            soltar_conexiones(fallo=True)
+            raise
+        soltar_conexiones()
+        return canales
+
+    async def ciclo(self, semaforo):
+        canales = await asyncio.get_running_loop().run_in_executor(self._consultas, self._canales_marcados)
+        resultados = await asyncio.gather(*(
+            self._sondear(semaforo, username, url_playlist(username, url_hls))
+            for username, url_hls in canales
+        ))
+
+        urls = set()
+        foto = {}
+        for username, url, datos in resultados:
+            urls.add(url)
+            foto[username] = datos
+        # Olvidamos las playlists de canales que ya no figuran en vivo
+        for url in [u for u in self._seguimientos if u not in urls]:
+            del self._seguimientos[url]
+
+        self.foto = Foto(time.time(), foto)
+
+    async def _sondear(self, semaforo, username, url):
+        seguimiento = self._seguimientos.get(url)
+        if seguimiento is None:
+            seguimiento = self._seguimientos[url] = _Seguimiento()
+
+        async with semaforo:
+            status, cuerpo, etag, modificada = await asyncio.to_thread(
+                self._pedir, url, seguimiento.etag, seguimiento.modificada,
+            )
+        self.sondeos += 1
+        ahora = time.monotonic()
+
+        if status == 200:
+            seguimiento.etag, seguimiento.modificada = etag, modificada
+            coincidencia = _SECUENCIA.search(cuerpo)
+            secuencia = int(coincidencia.group(1)) if coincidencia else None
+            if secuencia != seguimiento.secuencia:
+                seguimiento.secuencia = secuencia
+                seguimiento.avanzo = ahora
+            seguimiento.terminada = b'#EXT-X-ENDLIST' in cuerpo
+        elif status == 304:
+            self.no_modificados += 1
+
+        if status not in (200, 304):
+            estado = CAIDO
+        elif seguimiento.terminada:
+            estado = TERMINADO
+        elif ahora - seguimiento.avanzo > self.estancado:
+            estado = ESTANCADO
+        else:
+            estado = OK
+
+        return username, url, {
+            'estado': estado,
+            'secuencia': seguimiento.secuencia,
+            'sin_avanzar': round(ahora - seguimiento.avanzo, 1),
+        }
+
+    def _pedir(self, url, etag, modificada):
+        peticion = urllib.request.Request(url)
+        if etag:
+            peticion.add_header('If-None-Match', etag)
+        if modificada:
+            peticion.add_header('If-Modified-Since', modificada)
+        try:
+            with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+                return (
+                    # file:// (HLS_LOCAL_DIR) no tiene status
+                    respuesta.status or 200, respuesta.read(),
+                    respuesta.headers.get('ETag'), respuesta.headers.get('Last-Modified'),
+                )
+        except urllib.error.HTTPError as e:
+            return e.code, b'', None, None
+        except (urllib.error.URLError, OSError, ValueError):
+            return 0, b'', None, None
+
+
+# Instancia única del proceso
+sondeador = Sondeador(
+    intervalo=settings.SONDEO_INTERVALO,
+    concurrencia=settings.SONDEO_CONCURRENCIA,
+    estancado=settings.SONDEO_ESTANCADO,
+    timeout=settings.SONDEO_TIMEOUT,
+)
@@ -5,8 +5,11 @@
 const Utils = {
     // Formatear tiempo (HH:MM)
     getTime() {
-        const now = new Date();
-        return `${now.getHours().toString().padStart(2, '0')}:${now.getMinutes().toString().padStart(2, '0')}`;
+        return this.formatTime(new Date());
+    },
+
+    formatTime(date) {
+        return `${date.getHours().toString().padStart(2, '0')}:${date.getMinutes().toString().padStart(2, '0')}`;
     },
 
     // Escapar HTML para prevenir XSS
@@ -16,6 +19,26 @@ const Utils = {
         return div.innerHTML;
     },
 
+    // Pintar notificaciones (mismo markup que base.html)
+    showNotifications(mensajes) {
+        if (!mensajes || !mensajes.length) return;
+
+        const container = document.createElement('div');
+        container.id = 'notification-container';
+        container.className = 'fixed top-24 right-5 z-[9999] flex flex-col gap-3';
+        container.innerHTML = mensajes.map(texto => `
+            <div class="notification min-w-[300px] px-5 py-4 bg-white/90 dark:bg-card-dark/95 backdrop-blur-md border-l-4 border-primary rounded-xl shadow-2xl flex items-center gap-3 animate-slideIn">
+                <span class="material-icons text-primary">info</span>
+                <span class="flex-1 text-sm font-medium">${this.escapeHtml(texto)}</span>
+                <button class="opacity-60 hover:opacity-100" onclick="this.parentElement.remove()">
+                    <span class="material-icons text-sm">close</span>
+                </button>
+            </div>
+        `).join('');
+        document.body.prepend(container);
+        this.autoRemoveNotifications();
+    },
+
     // Auto-eliminar notificaciones
     autoRemoveNotifications() {
         const container = document.getElementById('notification-container');
@@ -29,6 +52,31 @@ const Utils = {
     }
 };
 
+// ============================================
+// PERSONALIZACIÓN - Datos del visitante en páginas cacheadas
+// ============================================
+
+class Personalizacion {
+    constructor() {
+        this.url = window.KAIRCAM_PERSONALIZACION;
+        if (this.url) this.cargar();
+    }
+
+    async cargar() {
+        try {
+            const response = await fetch(this.url, { credentials: 'same-origin' });
+            if (!response.ok) return;
+            const datos = await response.json();
+
+            Utils.showNotifications(datos.mensajes);
+            // Apodo y demás datos para quien los necesite (chat)
+            document.dispatchEvent(new CustomEvent('kaircam:personalizacion', { detail: datos }));
+        } catch (error) {
+            console.warn('No se pudieron cargar los datos del visitante:', error);
+        }
+    }
+}
+
 // ============================================
 // NAVBAR - Efectos de Scroll
 // ============================================
@@ -59,27 +107,94 @@ class NavbarController {
 
 class SearchController {
     constructor() {
-        this.input = document.getElementById('searchInput');
+        this.inputs = document.querySelectorAll('input[name="q"]');
+        this.sugerencias = null;
+        this.timer = null;
+        this.ultimaConsulta = '';
         this.init();
     }
 
     init() {
-        if (!this.input) return;
+        if (!this.inputs.length) return;
 
-        // Enter para buscar
-        this.input.addEventListener('keypress', (e) => {
-            if (e.key === 'Enter') {
-                this.performSearch();
-            }
+        // Un <datalist> compartido por los buscadores (escritorio y móvil)
+        this.sugerencias = document.createElement('datalist');
+        this.sugerencias.id = 'sugerenciasCanales';
+        document.body.appendChild(this.sugerencias);
+
+        this.inputs.forEach(input => {
+            input.setAttribute('list', this.sugerencias.id);
+
+            // Autocompletado con un pequeño debounce para no disparar un fetch por tecla
+            input.addEventListener('input', () => {
+                clearTimeout(this.timer);
+                this.timer = setTimeout(() => this.autocompletar(input.value.trim()), 150);
+            });
         });
     }
 
-    performSearch() {
-        const query = this.input.value.trim();
-        if (!query) return;
+    autocompletar(query) {
+        if (!query || query === this.ultimaConsulta) return;
+        this.ultimaConsulta = query;
+
+        fetch(`/api/autocompletar/?q=${encodeURIComponent(query)}`)
+            .then(res => res.ok ? res.json() : { resultados: [] })
+            .then(data => {
+                this.sugerencias.innerHTML = '';
+                data.resultados.forEach(canal => {
+                    const option = document.createElement('option');
+                    option.value = canal.username;
+                    if (canal.en_vivo) option.label = `${canal.username} · EN VIVO`;
+                    this.sugerencias.appendChild(option);
+                });
+            })
+            .catch(() => {
+                // Sin sugerencias: el formulario de búsqueda sigue funcionando igual
+            });
+    }
+}
+
+// ============================================
+// CALIDAD DE REPRODUCCIÓN - Beacons de QoS
+// ============================================
+
+class Calidad {
+    constructor(config) {
+        this.url = config.calidadUrl;
+        this.canal = config.streamId;
+        this.sesion = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+        this.eventos = [];
+        this.maximo = 20;
+        this.timer = null;
+
+        if (!this.url || !navigator.sendBeacon) return;
+        this.timer = setInterval(() => this.enviar(), 30000);
+        // Lo pendiente sale al ocultar o cerrar la pestaña
+        this.alOcultar = () => {
+            if (document.visibilityState === 'hidden') this.enviar();
+        };
+        document.addEventListener('visibilitychange', this.alOcultar);
+    }
+
+    registrar(tipo, valor = 0, detalle = '') {
+        if (!this.timer) return;
+        this.eventos.push({ tipo, valor: Math.round(valor), detalle });
+        if (this.eventos.length >= this.maximo) this.enviar();
+    }
 
-        // Redirigir a la búsqueda
-        window.location.href = `/search/?q=${encodeURIComponent(query)}`;
+    enviar() {
+        if (!this.eventos.length) return;
+        const cuerpo = JSON.stringify({ canal: this.canal, sesion: this.sesion, eventos: this.eventos });
+        this.eventos = [];
+        navigator.sendBeacon(this.url, cuerpo);
+    }
+
+    destroy() {
+        if (!this.timer) return;
+        this.enviar();
+        clearInterval(this.timer);
+        this.timer = null;
+        document.removeEventListener('visibilitychange', this.alOcultar);
     }
 }
 
@@ -88,17 +203,29 @@ class SearchController {
 // ============================================
 
 class VideoPlayer {
-    constructor() {
+    constructor(calidad) {
         this.video = document.getElementById('videoPlayer');
         this.statusOverlay = document.getElementById('streamStatus');
         this.config = window.STREAM_CONFIG || {};
+        this.calidad = calidad;
         this.hls = null;
+        this.inicio = null;      // cuándo arrancó la carga (para el tiempo al primer cuadro)
+        this.arranco = false;
+        this.corteDesde = null;  // cuándo se quedó sin buffer
+        this.fuente = null;      // playlist DVR cuando se está mirando hacia atrás
         this.init();
     }
 
     init() {
         if (!this.video || !this.config.hlsUrl) return;
 
+        // Reiniciar el reproductor cuando el servidor avisa un cambio de estado
+        document.addEventListener('kaircam:estado', () => this.reiniciar());
+        this.medirCalidad();
+
+        const dvr = document.getElementById('dvrSelect');
+        if (dvr) dvr.addEventListener('change', () => this.rebobinar(Number(dvr.value)));
+
         // Si no está en vivo, mostrar offline
         if (!this.config.isLive) {
             this.setStatus('offline', 'Transmisión no disponible');
@@ -110,12 +237,55 @@ class VideoPlayer {
         this.setupPlayer();
     }
 
+    reiniciar() {
+        this.destroy();
+        this.video.removeAttribute('src');
+        this.video.load();
+
+        if (!this.config.isLive) {
+            this.setStatus('offline', 'Transmisión no disponible');
+            return;
+        }
+
+        this.setStatus('connecting', 'Conectando al stream...');
+        this.setupPlayer();
+    }
+
+    // DVR: mirar desde hace `minutos` (sin minutos, vuelve al vivo)
+    rebobinar(minutos) {
+        if (!this.config.dvrUrl) return;
+        this.fuente = minutos ? `${this.config.dvrUrl}?atras=${encodeURIComponent(minutos)}` : null;
+        this.reiniciar();
+    }
+
+    medirCalidad() {
+        this.video.addEventListener('playing', () => {
+            const ahora = performance.now();
+            if (!this.arranco && this.inicio !== null) {
+                this.arranco = true;
+                this.calidad.registrar('inicio', ahora - this.inicio);
+            } else if (this.corteDesde !== null) {
+                this.calidad.registrar('corte', ahora - this.corteDesde);
+            }
+            this.corteDesde = null;
+        });
+
+        // Sin datos para seguir reproduciendo (solo cuenta después del primer cuadro)
+        this.video.addEventListener('waiting', () => {
+            if (this.arranco && this.corteDesde === null) this.corteDesde = performance.now();
+        });
+    }
+
     setupPlayer() {
+        this.inicio = performance.now();
+        this.arranco = false;
+        this.corteDesde = null;
+
         if (Hls.isSupported()) {
             this.setupHLS();
         } else if (this.video.canPlayType('application/vnd.apple.mpegurl')) {
             // Safari nativo
-            this.video.src = this.config.hlsUrl;
+            this.video.src = this.fuente || this.config.hlsUrl;
             this.video.addEventListener('loadedmetadata', () => {
                 this.hideStatus();
             });
@@ -137,7 +307,7 @@ class VideoPlayer {
             levelLoadingMaxRetry: 4
         });
 
-        this.hls.loadSource(this.config.hlsUrl);
+        this.hls.loadSource(this.fuente || this.config.hlsUrl);
         this.hls.attachMedia(this.video);
 
         // Eventos HLS
@@ -148,6 +318,11 @@ class VideoPlayer {
             });
         });
 
+        this.hls.on(Hls.Events.LEVEL_SWITCHED, (event, data) => {
+            const nivel = this.hls.levels[data.level];
+            if (this.arranco && nivel) this.calidad.registrar('nivel', nivel.bitrate / 1000);
+        });
+
         this.hls.on(Hls.Events.ERROR, (event, data) => {
             this.handleError(data);
         });
@@ -157,6 +332,7 @@ class VideoPlayer {
         if (!data.fatal) return;
 
         console.error('HLS Error:', data);
+        this.calidad.registrar('fatal', 0, `${data.type}:${data.details}`);
 
         switch (data.type) {
             case Hls.ErrorTypes.NETWORK_ERROR:
@@ -220,6 +396,147 @@ class VideoPlayer {
     }
 }
 
+// ============================================
+// ESTADO EN VIVO (WEBSOCKET)
+// ============================================
+
+class EstadoEnVivo {
+    constructor() {
+        this.config = window.STREAM_CONFIG || {};
+        this.socket = null;
+        this.reintento = 1000;
+        this.cerrado = false;
+        this.init();
+    }
+
+    init() {
+        // El canal oficial no tiene fila en la base: no hay nada que escuchar
+        if (!this.config.streamId || this.config.esOficial) return;
+        if (!('WebSocket' in window)) return;
+        this.conectar();
+    }
+
+    conectar() {
+        const protocolo = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const url = `${protocolo}://${window.location.host}/ws/estado/${encodeURIComponent(this.config.streamId)}/`;
+
+        this.socket = new WebSocket(url);
+
+        this.socket.addEventListener('open', () => {
+            this.reintento = 1000;
+        });
+
+        this.socket.addEventListener('message', (e) => {
+            const data = JSON.parse(e.data);
+            if (data.tipo === 'estado') this.aplicar(data);
+        });
+
+        this.socket.addEventListener('close', (e) => {
+            // 4404 = canal inexistente, no tiene sentido reintentar
+            if (this.cerrado || e.code === 4404) return;
+            setTimeout(() => this.conectar(), this.reintento);
+            this.reintento = Math.min(this.reintento * 2, 30000);
+        });
+    }
+
+    aplicar(data) {
+        const cambio = data.en_vivo !== this.config.isLive || data.hls_url !== this.config.hlsUrl;
+        if (!cambio) return;
+
+        const anterior = { isLive: this.config.isLive, hlsUrl: this.config.hlsUrl };
+        this.config.isLive = data.en_vivo;
+        this.config.hlsUrl = data.hls_url;
+
+        document.dispatchEvent(new CustomEvent('kaircam:estado', {
+            detail: { anterior, isLive: data.en_vivo, hlsUrl: data.hls_url }
+        }));
+    }
+
+    destroy() {
+        this.cerrado = true;
+        if (this.socket) {
+            this.socket.close();
+            this.socket = null;
+        }
+    }
+}
+
+// ============================================
+// ESPECTADORES - Latidos del reproductor
+// ============================================
+
+class Presencia {
+    constructor() {
+        this.config = window.STREAM_CONFIG || {};
+        this.video = document.getElementById('videoPlayer');
+        this.badge = document.getElementById('viewerBadge');
+        this.contador = document.getElementById('viewerCount');
+        this.latido = 15;  // segundos; lo corrige la primera respuesta del servidor
+        this.timer = null;
+        this.init();
+    }
+
+    init() {
+        if (!this.config.presenciaUrl) return;
+        this.visor = this.idVisor();
+        // En páginas cacheadas el número no viene en el HTML: se pide enseguida
+        this.tick();
+    }
+
+    idVisor() {
+        // Id al azar por navegador: el servidor solo lo usa para no contar dos veces
+        const clave = 'kaircam_visor';
+        let visor = null;
+        try {
+            visor = localStorage.getItem(clave);
+        } catch (error) {
+            // Sin localStorage (modo privado): un id por página
+        }
+        if (!visor) {
+            visor = window.crypto && crypto.randomUUID
+                ? crypto.randomUUID()
+                : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+            try {
+                localStorage.setItem(clave, visor);
+            } catch (error) {}
+        }
+        return visor;
+    }
+
+    reproduciendo() {
+        return this.video && !this.video.paused && !this.video.ended && this.video.readyState > 2;
+    }
+
+    async tick() {
+        try {
+            // Late solo quien está mirando; el resto solo consulta el número
+            const opciones = this.reproduciendo()
+                ? { method: 'POST', body: this.visor, keepalive: true, credentials: 'same-origin' }
+                : { credentials: 'same-origin' };
+            const response = await fetch(this.config.presenciaUrl, opciones);
+            if (response.ok) {
+                const datos = await response.json();
+                this.latido = datos.latido || this.latido;
+                this.mostrar(datos.espectadores);
+            }
+        } catch (error) {
+            console.warn('No se pudo actualizar la presencia:', error);
+        }
+        this.timer = setTimeout(() => this.tick(), this.latido * 1000);
+    }
+
+    mostrar(espectadores) {
+        this.config.viewers = espectadores;
+        if (this.contador) this.contador.textContent = espectadores.toLocaleString('es-AR');
+        if (this.badge) this.badge.classList.toggle('hidden', !espectadores);
+    }
+
+    destroy() {
+        clearTimeout(this.timer);
+        this.timer = null;
+    }
+}
+
 // ============================================
 // CHAT EN VIVO
 // ============================================
@@ -231,6 +548,10 @@ class ChatManager {
         this.sendBtn = document.getElementById('chatSendBtn');
         this.charCount = document.getElementById('charCount');
         this.config = window.STREAM_CONFIG || {};
+        this.socket = null;
+        this.reintento = 1000;
+        this.cerrado = false;
+        this.ultimoId = 0;
         this.init();
     }
 
@@ -242,36 +563,69 @@ class ChatManager {
         this.input.addEventListener('keydown', (e) => this.handleKeyPress(e));
         this.sendBtn.addEventListener('click', () => this.sendMessage());
 
-        // Auto-resize del textarea
-        this.input.addEventListener('input', () => {
-            this.input.style.height = 'auto';
-            this.input.style.height = Math.min(this.input.scrollHeight, 120) + 'px';
+        // Mensaje de bienvenida (local, no viaja al servidor)
+        this.addMessage({
+            author: 'Sistema',
+            text: this.config.esOficial
+                ? '¡Bienvenido al chat oficial de Kaircam!'
+                : `¡Bienvenido al chat de ${this.config.streamId}!`,
+            isAdmin: true
         });
 
-        // Mensaje de bienvenida
-        setTimeout(() => {
-            const welcomeMsg = this.config.isHome 
-                ? '¡Bienvenido al chat oficial de Kaircam!'
-                : `¡Bienvenido al chat de ${this.config.streamName}!`;
-            
-            this.addMessage({
-                author: 'Sistema',
-                text: welcomeMsg,
-                isAdmin: true
-            });
-        }, 500);
+        if ('WebSocket' in window && window.MessagePack) {
+            this.conectar();
+        }
+    }
+
+    conectar() {
+        const protocolo = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const url = `${protocolo}://${window.location.host}/ws/chat/${encodeURIComponent(this.config.streamId)}/`;
+
+        this.socket = new WebSocket(url);
+        this.socket.binaryType = 'arraybuffer';
+
+        this.socket.addEventListener('open', () => {
+            this.reintento = 1000;
+        });
+
+        this.socket.addEventListener('message', (e) => {
+            // El servidor siempre manda msgpack: {t: tipo, m: [[id, autor, texto, ts], ...]}
+            const frame = MessagePack.decode(new Uint8Array(e.data));
+            if (frame.t === 'historial' || frame.t === 'lote') {
+                frame.m.forEach(m => this.recibir(m));
+            } else if (frame.t === 'error') {
+                // El servidor no reconoce nuestro apodo: que el modal lo vuelva a pedir
+                this.config.guestName = '';
+                this.addMessage({ author: 'Sistema', text: frame.e, isAdmin: true });
+            }
+        });
+
+        this.socket.addEventListener('close', (e) => {
+            if (this.cerrado || e.code === 4404) return;
+            setTimeout(() => this.conectar(), this.reintento);
+            this.reintento = Math.min(Math.max(this.reintento * 2, 1000), 30000);
+        });
+    }
+
+    // El apodo viaja en una cookie que el servidor lee al conectar:
+    // después de elegirlo hay que abrir un socket nuevo
+    reconectar() {
+        if (!this.socket) return;
+        this.reintento = 0;
+        this.socket.close();
+    }
+
+    recibir([id, author, text, ts]) {
+        // Al reconectar llega de nuevo el historial: no repetimos lo ya mostrado
+        if (id <= this.ultimoId) return;
+        this.ultimoId = id;
+        this.addMessage({ author, text, time: Utils.formatTime(new Date(ts)), isAdmin: false });
     }
 
     updateCharCount() {
         const length = this.input.value.length;
-        this.charCount.textContent = length;
-        
-        // Cambiar color si se acerca al límite
-        if (length > 450) {
-            this.charCount.style.color = 'var(--accent-red)';
-        } else {
-            this.charCount.style.color = 'var(--text-muted)';
-        }
+        this.charCount.textContent = `${length} / 500`;
+        this.charCount.classList.toggle('text-primary', length > 450);
     }
 
     handleKeyPress(e) {
@@ -284,35 +638,32 @@ class ChatManager {
 
     sendMessage() {
         const text = this.input.value.trim();
-        
-        // Validaciones
+
+        // Validaciones (sin apodo, el modal de invitado se encarga)
         if (!text || text.length > 500) return;
+        if (!this.config.guestName) return;
+        if (!this.socket || this.socket.readyState !== WebSocket.OPEN) return;
 
-        // Añadir mensaje
-        this.addMessage({
-            author: 'Tú',
-            text: text,
-            isAdmin: false
-        });
+        // El mensaje se muestra cuando vuelve del servidor, igual que para el resto
+        this.socket.send(text);
 
         // Limpiar input
         this.input.value = '';
-        this.input.style.height = 'auto';
         this.updateCharCount();
     }
 
     addMessage(data) {
         const messageDiv = document.createElement('div');
-        messageDiv.className = `chat-message${data.isAdmin ? ' admin-message' : ''}`;
-        
-        const time = Utils.getTime();
-        
+        messageDiv.className = 'message-item p-3 rounded-lg bg-slate-50/50 dark:bg-white/[0.02] border border-slate-200/50 dark:border-white/5';
+
+        const time = data.time || Utils.getTime();
+
         messageDiv.innerHTML = `
-            <div class="message-header">
-                <span class="message-author">${Utils.escapeHtml(data.author)}</span>
-                <span class="message-time">${time}</span>
+            <div class="flex items-start justify-between gap-2 mb-1">
+                <span class="font-bold text-xs ${data.isAdmin ? 'text-primary' : 'text-slate-700 dark:text-slate-300'}">${Utils.escapeHtml(data.author)}</span>
+                <span class="text-[10px] text-slate-400 font-medium">${time}</span>
             </div>
-            <p class="message-text">${Utils.escapeHtml(data.text)}</p>
+            <p class="text-xs text-slate-600 dark:text-slate-400 leading-relaxed">${Utils.escapeHtml(data.text)}</p>
         `;
 
         this.messagesContainer.appendChild(messageDiv);
@@ -322,6 +673,14 @@ class ChatManager {
     scrollToBottom() {
         this.messagesContainer.scrollTop = this.messagesContainer.scrollHeight;
     }
+
+    destroy() {
+        this.cerrado = true;
+        if (this.socket) {
+            this.socket.close();
+            this.socket = null;
+        }
+    }
 }
 
 // ============================================
@@ -332,7 +691,11 @@ class App {
     constructor() {
         this.navbar = null;
         this.search = null;
+        this.personalizacion = null;
         this.videoPlayer = null;
+        this.estado = null;
+        this.presencia = null;
+        this.calidad = null;
         this.chat = null;
         this.init();
     }
@@ -350,13 +713,17 @@ class App {
         // Inicializar componentes globales
         this.navbar = new NavbarController();
         this.search = new SearchController();
+        this.personalizacion = new Personalizacion();
 
         // Auto-eliminar notificaciones
         Utils.autoRemoveNotifications();
 
         // Componentes específicos de la página de stream
         if (window.STREAM_CONFIG) {
-            this.videoPlayer = new VideoPlayer();
+            this.calidad = new Calidad(window.STREAM_CONFIG);
+            this.videoPlayer = new VideoPlayer(this.calidad);
+            this.estado = new EstadoEnVivo();
+            this.presencia = new Presencia();
             this.chat = new ChatManager();
         }
 
@@ -367,6 +734,18 @@ class App {
         if (this.videoPlayer) {
             this.videoPlayer.destroy();
         }
+        if (this.estado) {
+            this.estado.destroy();
+        }
+        if (this.presencia) {
+            this.presencia.destroy();
+        }
+        if (this.calidad) {
+            this.calidad.destroy();
+        }
+        if (this.chat) {
+            this.chat.destroy();
+        }
     }
 }
 
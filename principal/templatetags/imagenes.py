@@ -0,0 +1,46 @@
+"""
+{% imagen %}: <picture> con las derivadas WebP/AVIF de una imagen estática.
+
+    {% load imagenes %}
+    {% imagen 'principal/images/avatar.png' alt="Avatar" sizes="64px" class="w-full h-full" %}
+
+El <picture> lleva display:contents para que el <img> se acomode como si
+fuera hijo directo del contenedor (las clases de Tailwind siguen igual).
+Sin derivadas generadas sale solo el <img> original.
+
+{% icono 32 %}: URL del ícono cuadrado de ese tamaño (favicon), o la del
+original si no se generó.
+"""
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..imagenes import FORMATOS, ICONO, manifest
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagen(ruta, alt='', sizes='100vw', loading=None, **atributos):
+    datos = manifest().get(ruta)
+    extra = format_html_join('', ' {}="{}"', sorted(atributos.items()))
+    if loading:
+        extra = format_html('{} loading="{}"', extra, loading)
+
+    if datos is None:
+        return format_html('<img src="{}" alt="{}"{}>', static(ruta), alt, extra)
+
+    fuentes = format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+        (FORMATOS[formato][1], ', '.join(f'{static(url)} {ancho}w' for ancho, url in variantes), sizes)
+        for formato, variantes in datos['variantes'].items() if variantes
+    ))
+    return format_html(
+        '<picture style="display:contents">{}<img src="{}" alt="{}" width="{}" height="{}" decoding="async"{}></picture>',
+        fuentes, static(ruta), alt, datos['ancho'], datos['alto'], extra,
+    )
+
+
+@register.simple_tag
+def icono(tamano):
+    datos = manifest().get(ICONO) or {}
+    return static(datos.get('iconos', {}).get(str(tamano), ICONO))
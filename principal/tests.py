@@ -1,3 +1,1351 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.templatetags.static import static
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+
+from . import chat, dvr, imagenes, invitado, limites, metricas, paginas, replicas, views, vistas_async
+from .apodos import ApodoInvalido, Apodos
+from .calidad import ColaCalidad, leer, validar
+from .catalogo import Catalogo, decodificar_cursor
+from .chatlog import RegistroCanal
+from .directorio import CanalInfo, DirectorioCanales
+from .estado_vivo import ConexionWS, HubEstado
+from .hls_proxy import CachePlaylists, ErrorOrigen, Playlist
+from .indice import IndiceCanales
+from .limites import TablaLimites, limitar, parsear_regla
+from .management.commands.calidad import percentil
+from .llhls import Vigias
+from .models import CanalTransmision, Cliente
+from .origenes import Origenes
+from .presencia import Presencia
+from .perfilador import colapsar
+from .replicas import Replicas, RouterReplicas
+from .segmentos import CacheSegmentos
+from .sondeo import ESTANCADO, OK, Sondeador, url_playlist
+from .templatetags.imagenes import icono
+
+
+class OrigenLocal:
+    """Origen HTTP de prueba en un hilo: `rutas` es {ruta: (cuerpo, content_length)}."""
+
+    def __init__(self, rutas):
+        rutas_ = rutas
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in rutas_:
+                    self.send_error(404)
+                    return
+                cuerpo, largo = rutas_[self.path]
+                self.send_response(200)
+                self.send_header('Content-Length', str(largo))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = f'http://127.0.0.1:{self.servidor.server_address[1]}'
+        threading.Thread(target=self.servidor.serve_forever, args=(0.05,), daemon=True).start()
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+# ============================
+# PROXY DE PLAYLISTS (single-flight)
+# ============================
+class CachePlaylistsTests(SimpleTestCase):
+    def _cache(self, descargador):
+        return CachePlaylists('http://origen', ttl=5, ttl_error=1, timeout=2, descargador=descargador)
+
+    def test_concurrentes_hacen_una_sola_descarga(self):
+        liberar = threading.Event()
+        llamadas = []
+
+        def descargador(url, timeout):
+            llamadas.append(url)
+            liberar.wait(2)
+            return b'#EXTM3U\n'
+
+        cache = self._cache(descargador)
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(cache.obtener('p/a.m3u8'))) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        while cache.estadisticas()['coalescidas'] < 7:
+            pass
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(llamadas, ['http://origen/p/a.m3u8'])
+        self.assertEqual({p.cuerpo for p in resultados}, {b'#EXTM3U\n'})
+        # Dentro del TTL ni siquiera hay vuelo
+        cache.obtener('p/a.m3u8')
+        self.assertEqual(cache.estadisticas()['hits'], 1)
+
+    def test_error_del_origen_se_recuerda(self):
+        def descargador(url, timeout):
+            raise ErrorOrigen(404)
+
+        playlist = self._cache(descargador).obtener('p/a.m3u8')
+        self.assertEqual(playlist.error.status, 404)
+
+    def test_error_inesperado_del_lider_no_traba_la_ruta(self):
+        intentos = []
+
+        def descargador(url, timeout):
+            intentos.append(url)
+            if len(intentos) == 1:
+                raise ValueError('unknown url type')
+            return b'#EXTM3U\n'
+
+        cache = self._cache(descargador)
+        with self.assertLogs('principal.hls_proxy', 'ERROR'):
+            playlist = cache.obtener('p/a.m3u8')
+        self.assertEqual(playlist.error.status, 502)
+        self.assertEqual(cache._vuelos, {})
+
+        cache._cache.clear()   # como si hubiera vencido el TTL de error
+        self.assertEqual(cache.obtener('p/a.m3u8').cuerpo, b'#EXTM3U\n')
+        self.assertEqual(len(intentos), 2)
+
+    @override_settings(HLS_SEGMENT_CACHE=False)
+    def test_vista_responde_304_con_lista_y_etag_debil(self):
+        playlist = Playlist(b'#EXTM3U\n', time.time(), time.monotonic() + 5)
+        with mock.patch.object(views.playlists, 'obtener', return_value=playlist):
+            for valor in (f'"otro", {playlist.etag}', f'W/{playlist.etag}', '*'):
+                pedido = RequestFactory().get('/hls/p/a.m3u8', HTTP_IF_NONE_MATCH=valor)
+                self.assertEqual(views.hls_proxy_view(pedido, 'p/a.m3u8').status_code, 304, valor)
+            pedido = RequestFactory().get('/hls/p/a.m3u8', HTTP_IF_NONE_MATCH='"otro"')
+            self.assertEqual(views.hls_proxy_view(pedido, 'p/a.m3u8').status_code, 200)
+
+
+# ============================
+# CACHE DE SEGMENTOS
+# ============================
+class CacheSegmentosTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.origen = OrigenLocal({
+            '/p/ok.ts': (b'x' * 1000, 1000),
+            '/p/cortado.ts': (b'x' * 500, 1000),
+        })
+        self.cache = CacheSegmentos(self.directorio.name, 10_000, self.origen.url, timeout=2)
+
+    def tearDown(self):
+        self.origen.cerrar()
+        self.directorio.cleanup()
+
+    def _esperar(self, ruta):
+        tipo, relleno = self.cache.obtener(ruta)
+        self.assertEqual(tipo, 'relleno')
+        with relleno.cond:
+            relleno.cond.wait_for(lambda: relleno.terminado, 5)
+        return relleno
+
+    def test_segmento_completo_queda_en_cache(self):
+        relleno = self._esperar('p/ok.ts')
+        self.assertIsNone(relleno.status)
+        tipo, archivo = self.cache.obtener('p/ok.ts')
+        with archivo:
+            self.assertEqual((tipo, len(archivo.read())), ('archivo', 1000))
+
+    def test_cuerpo_cortado_no_se_guarda(self):
+        with self.assertLogs('principal.segmentos', 'WARNING'):
+            relleno = self._esperar('p/cortado.ts')
+        self.assertEqual(relleno.status, 502)
+        self.assertEqual(os.listdir(self.directorio.name), [])
+        self.assertEqual(self.cache._rellenos, {})
+
+    def test_error_inesperado_suelta_la_clave(self):
+        with mock.patch('principal.segmentos.urllib.request.urlopen', side_effect=ValueError('url')), \
+                self.assertLogs('principal.segmentos', 'ERROR'):
+            relleno = self._esperar('p/ok.ts')
+        self.assertEqual(relleno.status, 502)
+        self.assertEqual(self.cache._rellenos, {})
+        self.assertIsNone(self._esperar('p/ok.ts').status)
+
+    def test_al_arrancar_no_borra_parciales_de_otro_worker(self):
+        ajeno = os.path.join(self.directorio.name, f'abc.ts.{os.getppid()}.part')
+        huerfano = os.path.join(self.directorio.name, 'def.ts.999999999.part')
+        viejo = os.path.join(self.directorio.name, 'ghi.ts.part')
+        for ruta in (ajeno, huerfano, viejo):
+            open(ruta, 'wb').close()
+        self.cache._cargar()
+        self.assertEqual(os.listdir(self.directorio.name), [os.path.basename(ajeno)])
+
+
+# ============================
+# LL-HLS (recarga bloqueante)
+# ============================
+def _playlist_llhls(secuencia, segmentos, partes=0):
+    lineas = ['#EXTM3U', f'#EXT-X-MEDIA-SEQUENCE:{secuencia}']
+    for _ in range(segmentos):
+        lineas += ['#EXTINF:2.0,', 'seg.ts']
+    lineas += ['#EXT-X-PART:DURATION=0.5,URI="p.ts"'] * partes
+    return ('\n'.join(lineas) + '\n').encode()
+
+
+class VigiaTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.directorio.name, 'a.m3u8')
+        self.version = 0
+        self._escribir(_playlist_llhls(10, 3))   # último msn = 12
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def _escribir(self, cuerpo):
+        with open(self.ruta, 'wb') as f:
+            f.write(cuerpo)
+        # mtime explícito: no depender de la resolución del sistema de archivos
+        self.version += 1
+        os.utime(self.ruta, ns=(self.version * 10**9, self.version * 10**9))
+
+    def test_el_vigia_despierta_al_aparecer_el_segmento(self):
+        async def prueba():
+            vigias = Vigias(intervalo=0.01)
+            espera = asyncio.ensure_future(vigias.obtener(self.ruta).esperar(13, None, 2))
+            await asyncio.sleep(0.05)
+            self._escribir(_playlist_llhls(10, 4))
+            estado = await espera
+            self.assertEqual(estado.ultimo_msn, 13)
+            self.assertEqual(len(vigias), 0)
+
+        asyncio.run(prueba())
+
+    def test_otro_request_que_ve_la_version_nueva_despierta_a_los_que_esperan(self):
+        async def prueba():
+            # Intervalo largo: solo la lectura del otro request puede despertarlo
+            vigias = Vigias(intervalo=60)
+            espera = asyncio.ensure_future(vigias.obtener(self.ruta).esperar(13, 1, 2))
+            await asyncio.sleep(0.01)
+            self._escribir(_playlist_llhls(10, 3, partes=2))
+            self.assertEqual(vigias.obtener(self.ruta).actual().partes, 2)
+            inicio = time.monotonic()
+            self.assertIsNotNone(await espera)
+            self.assertLess(time.monotonic() - inicio, 0.5)
+
+        asyncio.run(prueba())
+
+    def test_sin_esperas_no_queda_nada_registrado(self):
+        async def prueba():
+            vigias = Vigias(intervalo=0.01)
+            self.assertIsNotNone(vigias.obtener(self.ruta).actual())
+            self.assertIsNone(vigias.obtener(self.ruta + '.no').actual())
+            self.assertEqual(len(vigias), 0)
+
+            vigia = vigias.obtener(self.ruta)
+            self.assertIsNone(await vigia.esperar(14, None, 0.05))
+            self.assertEqual(len(vigias), 0)
+            self.assertIsNone(vigia._tarea)
+
+        asyncio.run(prueba())
+
+
+# ============================
+# SALAS DEL CHAT
+# ============================
+class SalasChatTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        self.registro = RegistroCanal(os.path.join(temporal.name, 'c_juan'), max_bytes_segmento=1 << 20)
+        self.hilos = []
+        agregar = self.registro.agregar
+
+        def agregar_y_anotar(lote):
+            self.hilos.append(threading.current_thread().name)
+            return agregar(lote)
+
+        self.registro.agregar = agregar_y_anotar
+        parche = mock.patch.object(chat.registros, 'obtener', return_value=self.registro)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.salas = chat.GestorSalas(tamano_historial=10, espera_lote=0.01)
+        self.frames = []
+
+    async def _send(self, mensaje):
+        self.frames.append(mensaje['bytes'])
+
+    def test_el_lote_se_escribe_fuera_del_event_loop_y_en_orden(self):
+        async def prueba():
+            conexion = chat.ConexionChat(self._send, 'ana', 'v1')
+            sala = self.salas.entrar('juan', conexion)
+            for texto in ('uno', 'dos'):
+                sala.publicar('ana', texto)
+            await asyncio.sleep(0.05)
+            sala.publicar('ana', 'tres')
+            await asyncio.sleep(0.05)
+            return threading.current_thread().name, sala
+
+        hilo_loop, sala = asyncio.run(prueba())
+        self.assertEqual(len(self.hilos), 2)
+        self.assertNotIn(hilo_loop, self.hilos)
+        self.assertEqual([m[0] for m in sala.historial], [1, 2, 3])
+        self.assertEqual(len(self.frames), 2)
+
+    def test_la_sala_se_suelta_al_vaciar_el_ultimo_lote(self):
+        async def prueba():
+            conexion = chat.ConexionChat(self._send, 'ana', 'v1')
+            sala = self.salas.entrar('juan', conexion)
+            sala.publicar('ana', 'chau')
+            self.salas.salir(sala, conexion)
+            # Con el lote pendiente todavía no se suelta...
+            self.assertIn('juan', self.salas.salas)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(prueba())
+        # ...y al escribirlo sí
+        self.assertNotIn('juan', self.salas.salas)
+        self.assertEqual([m[2] for m in self.registro.pagina()[0]], ['chau'])
+
+    def test_un_usuario_llamado_home_no_es_la_sala_oficial(self):
+        canal = mock.Mock(username='home')
+        with mock.patch.object(chat.directorio, 'obtener', return_value=canal) as obtener:
+            self.assertEqual(chat.nombre_sala('home'), 'home')
+            self.assertEqual(chat.nombre_sala(chat.SALA_OFICIAL), chat.SALA_OFICIAL)
+        obtener.assert_called_once_with('home')
+        self.assertNotEqual(chat.SALA_OFICIAL, 'home')
+        self.assertTrue(chat.es_sala(chat.SALA_OFICIAL))
+
+
+# ============================
+# REGISTRO DEL CHAT
+# ============================
+class RegistroCanalTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.directorio.name, 'c_juan')
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def _lote(self, *textos):
+        return [[None, 'ana', texto, 0] for texto in textos]
+
+    def test_paginacion_hacia_atras_entre_segmentos(self):
+        registro = RegistroCanal(self.ruta, max_bytes_segmento=200)
+        for i in range(0, 100, 10):
+            registro.agregar(self._lote(*(f'm{j}' for j in range(i, i + 10))))
+        self.assertGreater(len(registro._segmentos()), 1)
+        self.assertEqual(registro.ultimo_id(), 100)
+
+        mensajes, cursor = registro.pagina(limite=30)
+        self.assertEqual([m[0] for m in mensajes], list(range(71, 101)))
+        self.assertEqual(cursor, 71)
+
+        vistos = [m[0] for m in mensajes]
+        while cursor is not None:
+            mensajes, cursor = registro.pagina(antes=cursor, limite=30)
+            vistos = [m[0] for m in mensajes] + vistos
+        self.assertEqual(vistos, list(range(1, 101)))
+        self.assertEqual(registro.pagina(antes=5, limite=10)[0][-1][2], 'm3')
+
+    def test_dos_escritores_no_repiten_ids(self):
+        # Dos instancias sobre el mismo directorio = dos workers con su propia sala
+        uno = RegistroCanal(self.ruta, max_bytes_segmento=10_000)
+        otro = RegistroCanal(self.ruta, max_bytes_segmento=10_000)
+        lotes = []
+
+        def escribir(registro, prefijo):
+            for i in range(50):
+                lote = self._lote(f'{prefijo}{i}a', f'{prefijo}{i}b')
+                registro.agregar(lote)
+                lotes.append(lote)
+
+        hilos = [threading.Thread(target=escribir, args=(r, p)) for r, p in ((uno, 'x'), (otro, 'y'))]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        ids = sorted(m[0] for lote in lotes for m in lote)
+        self.assertEqual(ids, list(range(1, 201)))
+        mensajes, _ = uno.pagina(limite=500)
+        self.assertEqual([m[0] for m in mensajes], ids)
+        # id = base + posición: lo que se lee es lo que se escribió con ese id
+        escritos = {m[0]: m[2] for lote in lotes for m in lote}
+        self.assertTrue(all(escritos[m[0]] == m[2] for m in mensajes))
+
+    def test_la_rotacion_pedida_en_dos_procesos_abre_un_solo_segmento(self):
+        uno = RegistroCanal(self.ruta, max_bytes_segmento=10_000)
+        otro = RegistroCanal(self.ruta, max_bytes_segmento=10_000)
+        uno.agregar(self._lote('a', 'b'))
+        uno.rotar()
+        otro.rotar()
+        otro.agregar(self._lote('c'))
+        uno.agregar(self._lote('d'))
+        self.assertEqual(uno._segmentos(), [1, 3])
+        self.assertEqual([m[2] for m in otro.pagina()[0]], ['a', 'b', 'c', 'd'])
+
+
+class DvrTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        self.raiz = temporal.name
+        self.fuente = os.path.join(self.raiz, 'fuente')
+        os.mkdir(self.fuente)
+        ajustes = override_settings(DVR_DIR=os.path.join(self.raiz, 'dvr'))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        dvr._fuentes.clear()
+
+    def _playlist(self, secuencia, inicio, cantidad, prefijo='s', duracion=2.0):
+        lineas = ['#EXTM3U', '#EXT-X-TARGETDURATION:2', f'#EXT-X-MEDIA-SEQUENCE:{secuencia}',
+                  f'#EXT-X-PROGRAM-DATE-TIME:{dvr._fecha(inicio)}']
+        for i in range(cantidad):
+            nombre = f'{prefijo}{secuencia + i}.ts'
+            with open(os.path.join(self.fuente, nombre), 'wb') as f:
+                f.write(prefijo.encode() * (i + 1))
+            lineas += [f'#EXTINF:{duracion:.3f},', nombre]
+        ruta = os.path.join(self.fuente, 'juan.m3u8')
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lineas) + '\n')
+        return ruta
+
+    def _indice(self):
+        return dvr.IndiceCanal(dvr.directorio_canal('juan'))
+
+    def test_indexa_solo_lo_nuevo_y_ubica_por_instante(self):
+        self.assertEqual(dvr.indexar_playlist('juan', self._playlist(10, 1000.0, 3)), 3)
+        # La ventana en vivo avanzó un segmento
+        self.assertEqual(dvr.indexar_playlist('juan', self._playlist(11, 1002.0, 3)), 1)
+        indice = self._indice()
+        self.assertEqual([r[0] for r in indice.rango(0, None, 100)], [0, 1, 2, 3])
+        self.assertEqual([r[0] for r in indice.rango(1003.0, 1005.0, 100)], [1, 2])
+        self.assertEqual([r[0] for r in indice.rango(1003.0, None, 2)], [1, 2])
+
+    def test_reinicio_del_empaquetador_no_pisa_ni_saltea(self):
+        dvr.indexar_playlist('juan', self._playlist(500, 1000.0, 3, prefijo='a'))
+        # Reinicio: la numeración vuelve a 0, con segmentos posteriores
+        self.assertEqual(dvr.indexar_playlist('juan', self._playlist(0, 1010.0, 2, prefijo='b')), 2)
+
+        registros = self._indice().rango(0, None, 100)
+        self.assertEqual([r[0] for r in registros], [0, 1, 2, 4, 5])
+        with open(dvr.directorio_canal('juan') / dvr.nombre_segmento(0), 'rb') as f:
+            self.assertEqual(f.read(), b'a')
+        with open(dvr.directorio_canal('juan') / dvr.nombre_segmento(4), 'rb') as f:
+            self.assertEqual(f.read(), b'b')
+        texto = dvr.armar_playlist(registros, terminada=True).decode()
+        self.assertEqual(texto.count('#EXT-X-DISCONTINUITY'), 1)
+
+    def test_playlist_vod_y_en_vivo(self):
+        dvr.indexar_playlist('juan', self._playlist(0, 1000.0, 3))
+        registros = self._indice().rango(1000.0, 1006.0, 100)
+        vod = dvr.armar_playlist(registros, terminada=True).decode().splitlines()
+        self.assertIn('#EXT-X-PLAYLIST-TYPE:VOD', vod)
+        self.assertEqual(vod[-1], '#EXT-X-ENDLIST')
+        self.assertEqual([l for l in vod if l.endswith('.ts')], [dvr.nombre_segmento(i) for i in range(3)])
+        vivo = dvr.armar_playlist(registros, terminada=False).decode()
+        self.assertNotIn('#EXT-X-PLAYLIST-TYPE', vivo)
+        self.assertNotIn('#EXT-X-ENDLIST', vivo)
+
+    def test_el_comienzo_avanza_con_la_ventana_y_la_poda(self):
+        ahora = time.time()
+        dvr.indexar_playlist('juan', self._playlist(0, ahora - 20, 10))
+        canal = mock.Mock(username='juan')
+        factory = RequestFactory()
+        with mock.patch.object(views, '_canal_dvr', return_value=canal), \
+                override_settings(DVR_VENTANA_MAX=30):
+            respuesta = views.dvr_playlist_view(factory.get('/', {'atras': '1'}), 'juan')
+            self.assertEqual(respuesta.status_code, 302)
+            url = respuesta['Location']
+            desde = url.split('desde=')[1]
+            respuesta = views.dvr_playlist_view(factory.get('/', {'desde': desde}), 'juan')
+            self.assertIn(b'#EXT-X-MEDIA-SEQUENCE:0\n', respuesta.content)
+
+            # La recarga llega cuando `desde` ya quedó fuera de la ventana: se corre con ella
+            with mock.patch.object(views.time, 'time', return_value=ahora + 15):
+                respuesta = views.dvr_playlist_view(factory.get('/', {'desde': desde}), 'juan')
+            self.assertIn(b'#EXT-X-MEDIA-SEQUENCE:2\n', respuesta.content)
+
+            # La retención borra el comienzo: la playlist sigue siendo válida (no es EVENT)
+            self._indice().podar(ahora - 5)
+            respuesta = views.dvr_playlist_view(factory.get('/', {'desde': desde}), 'juan')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn(b'#EXT-X-MEDIA-SEQUENCE:8\n', respuesta.content)
+        self.assertNotIn(b'#EXT-X-PLAYLIST-TYPE', respuesta.content)
+
+
+class CalidadTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        self.directorio = temporal.name
+        self.cola = ColaCalidad(self.directorio, capacidad=4, volcado=60)
+        self.cola._hilo = True   # sin hilo de volcado
+
+    def _beacon(self, canal, *eventos):
+        return {'canal': canal, 'sesion': 's1', 'eventos': [{'tipo': t, 'valor': v} for t, v in eventos]}
+
+    def test_valida_el_canal_contra_el_indice(self):
+        canales = {'juan': 'juan', 'JUAN': 'juan'}.get
+        eventos = validar(self._beacon('JUAN', ('inicio', 800)), 10, canales)
+        self.assertEqual(eventos, [('juan', 's1', 1, 800, '')])
+        with self.assertRaises(ValueError):
+            validar(self._beacon('nadie', ('inicio', 800)), 10, canales)
+
+    def test_la_vista_descarta_canales_desconocidos(self):
+        factory = RequestFactory()
+        with mock.patch.object(views, 'cola', self.cola), \
+                mock.patch.object(views.indice, 'exacto', {'juan': 'juan'}.get):
+            for canal, estado in (('nadie', 400), ('juan', 204), (chat.SALA_OFICIAL, 204)):
+                request = factory.post('/api/calidad/', json.dumps(self._beacon(canal, ('corte', 5))),
+                                       content_type='application/json')
+                self.assertEqual(views.calidad_view(request).status_code, estado)
+        self.assertEqual(self.cola.estadisticas()['recibidos'], 2)
+
+    def test_la_cola_acepta_lotes_enteros_y_vuelca_en_un_append(self):
+        self.assertTrue(self.cola.agregar([('juan', 's1', 1, 100, '')] * 3))
+        self.assertFalse(self.cola.agregar([('ana', 's2', 2, 50, '')] * 2))   # no entra entero
+        self.assertTrue(self.cola.agregar([('ana', 's2', 2, 50, '')]))
+        self.assertEqual(self.cola.volcar(), 4)
+        self.assertEqual(self.cola.volcar(), 0)
+        self.assertEqual(self.cola.estadisticas(),
+                         {'recibidos': 4, 'descartados': 2, 'escritos': 4, 'pendientes': 0})
+
+        (nombre,) = os.listdir(self.directorio)
+        eventos = list(leer(os.path.join(self.directorio, nombre)))
+        self.assertEqual([e[1:] for e in eventos], [('juan', 's1', 1, 100, '')] * 3 + [('ana', 's2', 2, 50, '')])
+
+    def test_el_comando_resume_percentiles_por_canal(self):
+        self.assertEqual(percentil([10, 20, 30, 40], 50), 20)
+        self.assertEqual(percentil([10, 20, 30, 40], 99), 40)
+        self.assertIsNone(percentil([], 50))
+
+        self.cola.capacidad = 1000
+        self.cola.agregar([('juan', f's{i}', 1, (i + 1) * 100, '') for i in range(10)])
+        self.cola.agregar([('juan', 's0', 2, 300, ''), ('ana', 's9', 4, 0, 'networkError')])
+        self.cola.volcar()
+
+        salida = io.StringIO()
+        with override_settings(CALIDAD_DIR=self.directorio):
+            call_command('calidad', json=True, stdout=salida)
+        reporte = json.loads(salida.getvalue())
+        self.assertEqual(reporte['eventos'], 12)
+        juan = reporte['canales']['juan']
+        self.assertEqual(juan['sesiones'], 10)
+        self.assertEqual(juan['inicio_ms'], {'p50': 500, 'p95': 1000, 'p99': 1000})
+        self.assertEqual((juan['cortes'], juan['cortes_por_sesion']), (1, 0.1))
+        self.assertEqual(reporte['canales']['ana']['fatales'], {'networkError': 1})
+
+
+class OrigenesTests(SimpleTestCase):
+    URLS = ['http://a', 'http://b', 'http://c']
+
+    def _origenes(self):
+        origenes = Origenes(self.URLS, sonda='sonda', chequeo=5, timeout=1, fallos=3, holgura=1.25, virtuales=64)
+        origenes._hilo = True   # sin hilo de chequeos
+        return origenes
+
+    def _ranking(self, extra=0):
+        return [(f'canal{i}', 40 - i + extra) for i in range(30)]
+
+    def test_el_reparto_no_depende_de_la_historia_del_proceso(self):
+        uno, otro = self._origenes(), self._origenes()
+        # `otro` ya repartió antes con otro ranking y otro orden
+        otro.aplicar(list(reversed(self._ranking(extra=500))))
+        uno.aplicar(self._ranking())
+        otro.aplicar(list(reversed(self._ranking())))
+        self.assertEqual(uno._asignados, otro._asignados)
+        self.assertEqual(uno.cargas, otro.cargas)
+
+    def test_la_carga_queda_acotada_y_el_canal_no_se_mueve_por_poco(self):
+        origenes = self._origenes()
+        origenes.aplicar(self._ranking())
+        total = sum(origenes.cargas.values())
+        self.assertLessEqual(max(origenes.cargas.values()), 1.25 * total / 3 + 41)
+
+        ranking = [(f'canal{i}', 64 * (i % 4 + 1) - 1) for i in range(30)]
+        origenes.aplicar(ranking)
+        antes, reasignados = dict(origenes._asignados), origenes.reasignados
+        origenes.aplicar([(canal, n + 5) for canal, n in ranking])
+        self.assertEqual(origenes._asignados, antes)
+        self.assertEqual(origenes.reasignados, reasignados)
+
+    def test_los_canales_con_espectadores_no_se_mueven(self):
+        origenes = self._origenes()
+        origenes.aplicar([('canal0', 0), ('canal1', 0)])
+        anillo = dict(origenes._asignados)
+        # Cada uno en un origen que no es el del anillo
+        anteriores = {'canal0': next(u for u in self.URLS if u != anillo['canal0'])}
+        anteriores['canal1'] = next(u for u in self.URLS if u not in (anillo['canal1'], anteriores['canal0']))
+
+        origenes.aplicar([('canal0', 10), ('canal1', 10)], anteriores)
+        self.assertEqual(origenes._asignados, anteriores)
+        self.assertEqual(origenes.reasignados, 0)
+        # Sin espectadores no hay a quién cortar: vuelven a su lugar en el anillo
+        origenes.aplicar([('canal0', 0), ('canal1', 0)], anteriores)
+        self.assertEqual(origenes._asignados, anillo)
+
+    def test_los_workers_comparten_el_reparto(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            archivo = os.path.join(carpeta, 'origenes.json')
+            uno, otro = self._origenes(), self._origenes()
+            uno.archivo = otro.archivo = archivo
+            with mock.patch('principal.origenes.presencia.ranking', return_value=self._ranking()):
+                uno.repartir()
+            # Otro ranking, pero dentro del mismo intervalo: usa el reparto de `uno`
+            with mock.patch('principal.origenes.presencia.ranking', return_value=self._ranking(extra=500)):
+                otro.repartir()
+            self.assertEqual(otro._asignados, uno._asignados)
+
+    def test_sin_el_origen_caido(self):
+        origenes = self._origenes()
+        origenes.sanos = frozenset(self.URLS[:2])
+        origenes.aplicar(self._ranking())
+        self.assertNotIn('http://c', set(origenes._asignados.values()))
+        self.assertIn(origenes.elegir('sin-espectadores'), self.URLS[:2])
+
+
+class PerfiladorTests(SimpleTestCase):
+    def _stack_de_otro_hilo(self, correr):
+        """Stack colapsado de `correr(listo, seguir)` tomado desde otro hilo."""
+        listo, seguir = threading.Event(), threading.Event()
+        hilos = []
+
+        def vista():
+            hilos.append(threading.get_ident())
+            listo.set()
+            seguir.wait(5)
+
+        hilo = threading.Thread(target=correr, args=(vista,))
+        hilo.start()
+        try:
+            self.assertTrue(listo.wait(5))
+            return colapsar(sys._current_frames()[hilos[0]])
+        finally:
+            seguir.set()
+            hilo.join()
+
+    def test_muestrea_la_vista_sync_en_el_ejecutor_de_asgiref(self):
+        stack = self._stack_de_otro_hilo(lambda vista: asyncio.run(sync_to_async(vista)()))
+        self.assertIsNotNone(stack)
+        self.assertIn('_stack_de_otro_hilo.<locals>.vista', stack)
+
+    def test_ignora_hilos_que_no_atienden_requests(self):
+        self.assertIsNone(self._stack_de_otro_hilo(lambda vista: vista()))
+
+
+class ApodosTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        archivo = Path(temporal.name) / 'prohibidos.txt'
+        archivo.write_text('# comentario\ngrosero\n', encoding='utf-8')
+        self.apodos = Apodos(archivo, recarga=3600, largo_max=20, canal_min=5,
+                             reservas_max=3, reserva_segundos=60)
+        usernames = mock.patch('principal.apodos.indice.usernames', return_value=['Juanito', 'ana'])
+        usernames.start()
+        self.addCleanup(usernames.stop)
+
+    def rechaza(self, texto, propio=None):
+        with self.assertRaises(ApodoInvalido):
+            self.apodos.validar(texto, propio)
+
+    def test_pliega_ancho_homoglifos_y_leetspeak(self):
+        asyncio.run(self.apodos.aasegurar())
+        for texto in ('ＡＤＭＩＮ', 'аdmin', 'Ad_M1n', 'ádmín', 'GR0SER0', 'el grosero'):
+            self.rechaza(texto)
+        self.assertEqual(self.apodos.validar('  Pepe   Luis '), 'Pepe Luis')
+        self.rechaza('a\u202eb')
+        self.rechaza('x' * 21)
+
+    def test_el_primer_armado_ya_tiene_los_canales(self):
+        asyncio.run(self.apodos.aasegurar())
+        self.rechaza('Juan1to')
+        self.rechaza('xX_juanito_Xx')
+        self.assertEqual(self.apodos.validar('juanito', propio='Juanito'), 'juanito')
+        # Los usernames cortos solo chocan enteros
+        self.rechaza('Ana')
+        self.assertEqual(self.apodos.validar('mariana'), 'mariana')
+
+    def test_reservados_y_canales_solo_como_palabra_entera(self):
+        asyncio.run(self.apodos.aasegurar())
+        for texto in ('Admin_Pepe', 'AdminPepe', 'a.d.m.i.n', '4dm1n 2', 'Juanito TV', 'JuanitoOficial'):
+            self.rechaza(texto)
+        for texto in ('badminton', 'Juanitos', 'Ana Paula', 'sysadmins'):
+            self.assertEqual(self.apodos.validar(texto), texto)
+        # Los del archivo siguen chocando en cualquier parte
+        self.rechaza('supergrosero')
+
+    def test_reserva_por_canal_con_vencimiento_y_tope(self):
+        with mock.patch('principal.apodos.time.monotonic', return_value=1000.0) as reloj:
+            self.assertTrue(self.apodos.reservar('Juanito', 'Pepe', 'v1'))
+            self.assertTrue(self.apodos.reservar('Juanito', 'pepe', 'v1'))
+            self.assertFalse(self.apodos.reservar('Juanito', 'P3pe', 'v2'))
+            # "juanito" es otro canal
+            self.assertTrue(self.apodos.reservar('juanito', 'Pepe', 'v2'))
+
+            reloj.return_value = 1061.0
+            self.assertTrue(self.apodos.reservar('Juanito', 'pepe', 'v2'))
+
+            # El tope saca primero a las que llevan más tiempo sin tocarse
+            for i in range(3):
+                self.apodos.reservar('sala', f'nombre{i}', 'v3')
+            self.assertEqual(self.apodos.desalojadas, 1)
+            self.assertTrue(self.apodos.reservar('Juanito', 'pepe', 'v4'))
+
+
+class IndiceCanalesTests(SimpleTestCase):
+    def setUp(self):
+        self.indice = IndiceCanales(refresco=3600)
+        self.indice._aplicar({
+            ('juan', 'juan'): ('juan', False),
+            ('juan', 'Juan'): ('Juan', True),
+            ('juana', 'juana'): ('juana', False),
+            ('pedro', 'Pedro'): ('Pedro', True),
+        })
+
+    def test_exacto_distingue_mayusculas_y_si_no_pliega(self):
+        self.assertEqual(self.indice.exacto('juan'), 'juan')
+        self.assertEqual(self.indice.exacto('Juan'), 'Juan')
+        self.assertEqual(self.indice.exacto(' JUAN '), 'Juan')
+        self.assertEqual(self.indice.exacto('pedro'), 'Pedro')
+        self.assertIsNone(self.indice.exacto('ped'))
+
+    def test_prefijo_con_los_en_vivo_primero(self):
+        self.assertEqual(self.indice.prefijo('JU'), [('Juan', True), ('juan', False), ('juana', False)])
+        self.indice.actualizar('juana', True)
+        self.assertEqual(self.indice.prefijo('ju', k=2), [('Juan', True), ('juana', True)])
+        self.assertEqual(self.indice.en_vivo(), ['Juan', 'juana', 'Pedro'])
+
+
+class DirectorioCanalesTests(SimpleTestCase):
+    def setUp(self):
+        self.cuentas = ['juan', 'Ana', 'ana']   # en orden de antigüedad
+        self.consultas = []
+        self.directorio = DirectorioCanales(ttl=60, ttl_negativo=60, max_entradas=10,
+                                            cargador=self._cargar)
+
+    def _cargar(self, clave):
+        # Misma regla que _cargar_canal: exacto y si no, sin mayúsculas
+        self.consultas.append(clave)
+        if clave in self.cuentas:
+            return CanalInfo(clave, 1, False, '', None), False
+        parecidas = [c for c in self.cuentas if c.lower() == clave.lower()]
+        info = CanalInfo(parecidas[0], 1, False, '', None) if parecidas else None
+        return info, len(parecidas) <= 1
+
+    def test_las_otras_grafias_usan_el_alias(self):
+        self.assertEqual(self.directorio.obtener('JUAN').username, 'juan')
+        self.assertEqual(self.directorio.obtener('Juan').username, 'juan')
+        self.assertEqual(self.directorio.obtener('juan').username, 'juan')
+        self.assertIsNone(self.directorio.obtener('Pedro'))
+        self.assertIsNone(self.directorio.obtener('PEDRO'))
+        self.assertEqual(self.consultas, ['JUAN', 'Pedro'])
+
+        self.directorio.invalidar('juan')
+        self.assertEqual(self.directorio.estadisticas()['entradas'], 1)
+        self.directorio.obtener('JuAn')
+        self.assertEqual(self.consultas[-1], 'JuAn')
+
+    def test_sin_alias_si_hay_varias_cuentas_con_el_mismo_nombre(self):
+        self.assertEqual(self.directorio.obtener('ANA').username, 'Ana')
+        self.assertEqual(self.directorio.obtener('ana').username, 'ana')
+        self.assertEqual(self.directorio.obtener('Ana').username, 'Ana')
+        self.assertEqual(self.consultas, ['ANA', 'ana', 'Ana'])
+
+        self.directorio.invalidar('Ana')
+        self.assertEqual(self.directorio.estadisticas()['entradas'], 0)
+
+
+class VersionPaginaTests(SimpleTestCase):
+    def test_cambiar_un_template_cambia_la_version(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            template = Path(carpeta) / 'principal' / 'home.html'
+            template.parent.mkdir()
+            template.write_text('<p>{{ stream.name }}</p>', encoding='utf-8')
+            with mock.patch.object(paginas, '_TEMPLATES', Path(carpeta)), \
+                    mock.patch.object(paginas, '_huella', None):
+                contexto = {'stream': {'name': 'x'}, 'es_home': True}
+                antes = paginas.version_de(contexto)
+                self.assertEqual(paginas.version_de(dict(contexto)), antes)
+                template.write_text('<h1>{{ stream.name }}</h1>', encoding='utf-8')
+                paginas._huella = None   # lo que hace un proceso nuevo después del deploy
+                self.assertNotEqual(paginas.version_de(contexto), antes)
+
+
+class ImagenesTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(imagenes._cache.update, dict(imagenes._cache))
+        imagenes._cache.update(ruta=None, mtime=None, datos={}, buscado=None)
+
+    @skipIf(imagenes.Image is None, "sin Pillow")
+    def test_el_icono_sale_en_png_cuadrado(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            original = os.path.join(carpeta, 'icono.png')
+            imagenes.Image.new('RGBA', (300, 200), (255, 0, 0, 255)).save(original)
+            manifest, _ = imagenes.generar([(imagenes.ICONO, original)], os.path.join(carpeta, 'd'), [64])
+            iconos = manifest[imagenes.ICONO]['iconos']
+            self.assertEqual(sorted(iconos), ['180', '32'])
+            with imagenes.Image.open(os.path.join(carpeta, 'd', os.path.basename(iconos['32']))) as chico:
+                self.assertEqual((chico.format, chico.size), ('PNG', (32, 32)))
+
+            imagenes._cache.update(ruta=os.path.join(carpeta, 'd', 'manifest.json'))
+            self.assertTrue(icono(32).endswith(iconos['32']))
+            self.assertEqual(icono(48), static(imagenes.ICONO))
+
+    def test_sin_manifest_no_recorre_los_finders_en_cada_render(self):
+        with mock.patch.object(imagenes.finders, 'find', return_value=None) as find:
+            for _ in range(5):
+                self.assertEqual(imagenes.manifest(), {})
+        self.assertEqual(find.call_count, 1)
+
+
+class PresenciaTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        self.presencia = Presencia(os.path.join(temporal.name, 'presencia.bin'), canales=64, precision=6,
+                                   segundos_tramo=30, tramos=2, ranking_segundos=5)
+
+    def test_el_ranking_se_calcula_una_vez_por_intervalo(self):
+        for visor in ('a', 'b', 'c'):
+            self.presencia.latido('juan', visor)
+        self.presencia.latido('ana', 'a')
+        with mock.patch('principal.presencia.time.monotonic', return_value=1000.0) as reloj, \
+                mock.patch.object(self.presencia, '_calcular_ranking', wraps=self.presencia._calcular_ranking) as calcular:
+            self.assertEqual(self.presencia.ranking(10), [('juan', 3), ('ana', 1)])
+            self.presencia.latido('pedro', 'a')
+            # El reparto de orígenes pide todos; /api/presencia/ unos pocos: el mismo cálculo
+            self.assertEqual(self.presencia.ranking(64), [('juan', 3), ('ana', 1)])
+            self.assertEqual(self.presencia.ranking(1), [('juan', 3)])
+            self.assertEqual(calcular.call_count, 1)
+
+            reloj.return_value = 1005.0
+            self.assertEqual(self.presencia.ranking(10), [('juan', 3), ('ana', 1), ('pedro', 1)])
+            self.assertEqual(calcular.call_count, 2)
+
+    @override_settings(LIMITE_ACTIVO=True)
+    def test_api_presencia_tiene_limite(self):
+        # La regla se lee al decorar la vista: la de settings ('ranking')
+        capacidad, _ = parsear_regla(settings.LIMITES['ranking'])
+        tabla = TablaLimites(os.path.join(os.path.dirname(self.presencia.ruta_archivo), 'limites.bin'), slots=64)
+        with mock.patch.object(limites, 'tabla', tabla), mock.patch.object(views, 'presencia', self.presencia), \
+                mock.patch('principal.limites.time.time', return_value=1000.0):
+            codigos = {views.presencia_ranking_view(RequestFactory().get('/api/presencia/')).status_code
+                       for _ in range(capacidad)}
+            self.assertEqual(codigos, {200})
+            self.assertEqual(views.presencia_ranking_view(RequestFactory().get('/api/presencia/')).status_code, 429)
+
+
+class LimitesTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        self.archivo = os.path.join(temporal.name, 'limites.bin')
+        self.tabla = TablaLimites(self.archivo, slots=64)
+
+    def test_parsear_regla(self):
+        self.assertEqual(parsear_regla('20/10'), (20, 2.0))
+        self.assertEqual(parsear_regla('5'), (5, 5.0))
+        self.assertEqual(parsear_regla('3/0.5'), (3, 6.0))
+        for invalida in ('0/60', '5/0', '-1/60', 'x/60', ''):
+            with self.assertRaises(ValueError, msg=invalida):
+                parsear_regla(invalida)
+
+    def test_permitir_recarga_de_a_fracciones_sin_pasar_la_capacidad(self):
+        with mock.patch('principal.limites.time.time', return_value=1000.0) as reloj:
+            self.assertTrue(self.tabla.permitir('r', 'ip', 2, 0.5))
+            self.assertTrue(self.tabla.permitir('r', 'ip', 2, 0.5))
+            self.assertFalse(self.tabla.permitir('r', 'ip', 2, 0.5))
+            # Medio segundo = un cuarto de ficha: todavía no alcanza
+            reloj.return_value = 1000.5
+            self.assertFalse(self.tabla.permitir('r', 'ip', 2, 0.5))
+            reloj.return_value = 1002.5
+            self.assertTrue(self.tabla.permitir('r', 'ip', 2, 0.5))
+            # Una hora después la ráfaga vuelve a ser la capacidad, no más
+            reloj.return_value = 5000.0
+            self.assertEqual([self.tabla.permitir('r', 'ip', 2, 0.5) for _ in range(3)], [True, True, False])
+
+    def test_el_archivo_por_defecto_no_queda_en_el_proyecto(self):
+        self.assertFalse(settings.LIMITE_ARCHIVO.is_relative_to(settings.BASE_DIR))
+        self.assertFalse(os.path.exists(self.archivo))   # nada hasta la primera decisión
+        self.tabla.permitir('r', 'ip', 1, 1)
+        self.assertTrue(os.path.exists(self.archivo))
+
+    def test_bucket_por_ip_y_ruta_que_se_recarga(self):
+        capacidad, tasa = parsear_regla('3/30')
+        with mock.patch('principal.limites.time.time', return_value=1000.0) as reloj:
+            self.assertEqual([self.tabla.permitir('r', '1.1.1.1', capacidad, tasa) for _ in range(4)],
+                             [True, True, True, False])
+            # Otra IP y otra ruta tienen su propio bucket
+            self.assertTrue(self.tabla.permitir('r', '2.2.2.2', capacidad, tasa))
+            self.assertTrue(self.tabla.permitir('otra', '1.1.1.1', capacidad, tasa))
+            # 0.1 fichas por segundo: a los 10 s hay una más
+            reloj.return_value = 1010.0
+            self.assertTrue(self.tabla.permitir('r', '1.1.1.1', capacidad, tasa))
+            self.assertFalse(self.tabla.permitir('r', '1.1.1.1', capacidad, tasa))
+        self.assertEqual(self.tabla.estadisticas()['slots_ocupados'], 3)
+
+    def test_otro_proceso_ve_los_mismos_buckets(self):
+        otra = TablaLimites(self.archivo, slots=64)
+        self.assertTrue(self.tabla.permitir('r', 'ip', 1, 0.001))
+        self.assertFalse(otra.permitir('r', 'ip', 1, 0.001))
+
+    @override_settings(LIMITE_ACTIVO=True, LIMITES={'consulta': '1/60', 'latido': '2/60'})
+    def test_los_post_gastan_su_propio_bucket(self):
+        vista = limitar('consulta', json=True, post='latido')(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+        with mock.patch.object(limites, 'tabla', self.tabla):
+            self.assertEqual(vista(factory.get('/')).status_code, 200)
+            self.assertEqual(vista(factory.get('/')).status_code, 429)
+            self.assertEqual([vista(factory.post('/')).status_code for _ in range(3)], [200, 200, 429])
+            self.assertEqual(vista(factory.post('/'))['Retry-After'], '30')
+
+
+class ChannelsViewTests(SimpleTestCase):
+    def test_if_none_match_con_lista_y_etag_debil(self):
+        foto = mock.Mock(version='v1', generada=1000.0)
+        foto.etag.return_value = '"v1-abc"'
+        foto.pagina.return_value = ([], None)
+        factory = RequestFactory()
+        with mock.patch.object(views.catalogo, 'obtener', return_value=foto):
+            for valor in ('"otro", "v1-abc"', 'W/"v1-abc"', '*'):
+                respuesta = views.channels_view(factory.get('/', HTTP_IF_NONE_MATCH=valor))
+                self.assertEqual(respuesta.status_code, 304, valor)
+                self.assertEqual(respuesta['ETag'], '"v1-abc"')
+            respuesta = views.channels_view(factory.get('/', HTTP_IF_NONE_MATCH='"v0-abc"'))
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_canales_que_solo_difieren_en_mayusculas_no_se_saltan(self):
+        # 'juan' y 'Juan' quedan a los dos lados del corte de la primera página
+        filas = [('juan',), ('Ana',), ('Juan',)]
+        with mock.patch('principal.catalogo.CanalTransmision.objects.values_list', return_value=filas), \
+             mock.patch('principal.catalogo.canal_desde_fila', side_effect=self._canal), \
+             mock.patch('principal.catalogo.sondeador.instantanea', return_value=None):
+            foto = Catalogo(ttl=60)._armar()
+
+        vistos, despues = [], None
+        while True:
+            canales, siguiente = foto.pagina(despues, limite=2)
+            vistos += [canal['username'] for canal in canales]
+            if siguiente is None:
+                break
+            despues = decodificar_cursor(siguiente)
+        self.assertEqual(vistos, ['Ana', 'Juan', 'juan'])
+
+    @staticmethod
+    def _canal(fila):
+        return mock.Mock(username=fila[0], en_vivo=False, url_hls='x', cliente=None)
+
+
+class ReplicasTests(SimpleTestCase):
+    def setUp(self):
+        self.replicas = Replicas({'replica1': 3, 'replica2': 1}, chequeo=5, lag_max=10)
+        self.replicas._hilo = True   # sin hilo de chequeos
+        self.lags = {'replica1': 0.0, 'replica2': 0.0}
+        for parche in (
+            mock.patch.object(replicas, 'replicas', self.replicas),
+            mock.patch.object(replicas, 'connections', mock.MagicMock()),
+            mock.patch.object(Replicas, '_medir', lambda _, alias: self._medir(alias)),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.router = RouterReplicas()
+
+    def _medir(self, alias):
+        lag = self.lags[alias]
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+    def _lecturas(self, n=200):
+        return {self.router.db_for_read(CanalTransmision) for _ in range(n)}
+
+    def test_lee_espejos_de_replicas_y_escribe_en_default(self):
+        # Hasta el primer chequeo, todo a 'default'
+        self.assertEqual(self._lecturas(), {'default'})
+        self.replicas.revisar()
+        self.assertEqual(self._lecturas(), {'replica1', 'replica2'})
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_write(CanalTransmision), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'principal'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'principal'))
+
+    def test_la_replica_caida_o_atrasada_queda_afuera_hasta_recuperarse(self):
+        self.lags['replica1'] = DatabaseError('conexión rechazada')
+        self.lags['replica2'] = 30.0
+        self.replicas.revisar()
+        self.assertEqual(self._lecturas(), {'default'})
+        self.assertEqual(self.replicas.estado['replica2']['error'], 'atrasada')
+
+        # Sigue afuera mientras el chequeo siguiente la vea mal
+        self.lags['replica2'] = 0.5
+        self.replicas.revisar()
+        self.assertEqual(self._lecturas(), {'replica2'})
+
+        self.lags['replica1'] = 0.0
+        self.replicas.revisar()
+        self.assertEqual(self._lecturas(), {'replica1', 'replica2'})
+
+
+class HubEstadoTests(SimpleTestCase):
+    def setUp(self):
+        self.hub = HubEstado(intervalo=3600)
+        self.enviados = []
+        self.fila = ('juan', True, None)
+
+        async def send(mensaje):
+            self.enviados.append(mensaje)
+
+        self.conexion = ConexionWS(send)
+        self.hub._suscriptores['juan'] = {self.conexion}
+        self.hub._estados['juan'] = (True, '')
+        parche = mock.patch.object(HubEstado, '_consultar', staticmethod(lambda usernames: [self.fila]))
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    @override_settings(HLS_LOCAL_DIR=None, HLS_PROXY=False)
+    def test_un_reparto_de_origenes_no_reinicia_a_los_espectadores(self):
+        with mock.patch.object(views.origenes, 'elegir', side_effect=['http://a', 'http://b']):
+            asyncio.run(self.hub._sondear())
+            asyncio.run(self.hub._sondear())
+        self.assertEqual(self.enviados, [])
+
+    @override_settings(HLS_LOCAL_DIR=None, HLS_PROXY=False)
+    def test_una_transicion_se_manda_una_vez(self):
+        oyente = mock.AsyncMock()
+        self.hub.agregar_oyente(oyente)
+        with mock.patch.object(views.origenes, 'elegir', return_value='http://a'):
+            asyncio.run(self.hub._sondear())
+            self.fila = ('juan', False, None)
+            for _ in range(3):
+                asyncio.run(self.hub._sondear())
+        self.assertEqual(len(self.enviados), 1)
+        self.assertIn('"en_vivo": false', self.enviados[0]['text'])
+        oyente.assert_awaited_once_with('juan', (True, ''), (False, ''))
+
+    def test_el_bucle_termina_sin_suscriptores(self):
+        async def prueba():
+            self.hub.intervalo = 0
+            self.hub.suscribir('juan', self.conexion, (True, ''))
+            await asyncio.sleep(0.01)
+            self.hub.desuscribir('juan', self.conexion)
+            await asyncio.wait_for(self.hub._tarea, 1)
+
+        asyncio.run(prueba())
+        self.assertTrue(self.hub._tarea.done())
+
+
+class SoltarConexionesTests(SimpleTestCase):
+    def test_el_hilo_de_fondo_conserva_su_conexion_sin_pool(self):
+        with mock.patch.object(replicas, 'connections') as conexiones:
+            with override_settings(DB_POOL=False):
+                replicas.soltar_conexiones()
+                conexiones.close_all.assert_not_called()
+                replicas.soltar_conexiones(fallo=True)
+                conexiones.close_all.assert_called_once()
+            with override_settings(DB_POOL=True):
+                replicas.soltar_conexiones()
+            self.assertEqual(conexiones.close_all.call_count, 2)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache', GUEST_MIGRAR_SESION=True)
+class InvitadoTests(SimpleTestCase):
+    def _sesion(self, **datos):
+        from django.contrib.sessions.backends.cache import SessionStore
+        sesion = SessionStore()
+        sesion.update(datos)
+        sesion.save()
+        return sesion
+
+    def _request(self, sesion, respuesta=None):
+        request = RequestFactory().get('/api/yo/')
+        request.COOKIES['sessionid'] = sesion.session_key
+        if respuesta is not None:
+            request.COOKIES['kaircam_invitado'] = respuesta.cookies['kaircam_invitado'].value
+        # Sesión sin cargar, como la deja SessionMiddleware
+        request.session = type(sesion)(sesion.session_key)
+        return request
+
+    def test_el_apodo_de_la_sesion_vieja_pasa_a_la_cookie(self):
+        sesion = self._sesion(guest_name='pepe')
+        apodo, migrar = invitado.apodo_de(self._request(sesion))
+        self.assertEqual((apodo, migrar), ('pepe', True))
+
+        respuesta = HttpResponse()
+        invitado.guardar(respuesta, apodo)
+        request = self._request(sesion, respuesta)
+        with mock.patch.object(type(sesion), 'load', side_effect=AssertionError('no debería leer la sesión')):
+            self.assertEqual(invitado.apodo_de(request), ('pepe', False))
+
+    def test_sin_apodo_en_la_sesion_no_se_vuelve_a_consultar(self):
+        sesion = self._sesion(otra='cosa')
+        apodo, migrar = invitado.apodo_de(self._request(sesion))
+        self.assertEqual((apodo, migrar), (None, True))
+
+        respuesta = HttpResponse()
+        invitado.guardar(respuesta, apodo)
+        request = self._request(sesion, respuesta)
+        with mock.patch.object(type(sesion), 'load', side_effect=AssertionError('no debería leer la sesión')):
+            self.assertEqual(invitado.apodo_de(request), (None, False))
+            self.assertEqual(asyncio.run(invitado.aapodo_de(request)), (None, False))
+        # La marca no es un apodo ni un visitante
+        self.assertIsNone(invitado.visitante_de(request))
+
+    def test_la_migracion_apagada_vale_para_sync_async_y_websocket(self):
+        sesion = self._sesion(guest_name='pepe')
+        request = self._request(sesion)
+        scope = {'headers': [(b'cookie', f'sessionid={sesion.session_key}'.encode())]}
+        with override_settings(GUEST_MIGRAR_SESION=False):
+            self.assertEqual(invitado.apodo_de(request), (None, False))
+            self.assertEqual(asyncio.run(invitado.aapodo_de(request)), (None, False))
+            self.assertIsNone(invitado.invitado_de_scope(scope)[0])
+        self.assertEqual(asyncio.run(invitado.aapodo_de(request)), ('pepe', True))
+        self.assertEqual(invitado.invitado_de_scope(scope)[0], 'pepe')
+
+
+class SondeoTests(SimpleTestCase):
+    def setUp(self):
+        self.sondeador = Sondeador(intervalo=5, concurrencia=2, estancado=20, timeout=1)
+        self.sondeador._hilo = True   # sin hilo de sondeo
+
+    def _sondear(self, url='http://origen/program/juan.m3u8'):
+        return asyncio.run(self.sondeador._sondear(asyncio.Semaphore(1), 'juan', url))[2]
+
+    def test_playlist_que_no_avanza_queda_estancada_aunque_responda_304(self):
+        respuestas = [
+            (200, b'#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:7\n', '"e1"', None),
+            (304, b'', None, None),
+            (304, b'', None, None),
+        ]
+        with mock.patch.object(Sondeador, '_pedir', side_effect=respuestas) as pedir, \
+                mock.patch('principal.sondeo.time.monotonic', return_value=1000.0) as reloj:
+            self.assertEqual(self._sondear()['estado'], OK)
+            reloj.return_value = 1010.0
+            self.assertEqual(self._sondear()['estado'], OK)
+            reloj.return_value = 1021.0
+            datos = self._sondear()
+        self.assertEqual(datos, {'estado': ESTANCADO, 'secuencia': 7, 'sin_avanzar': 21.0})
+        # La segunda y la tercera van condicionales
+        self.assertEqual(pedir.call_args_list[1].args, ('http://origen/program/juan.m3u8', '"e1"', None))
+        self.assertEqual(self.sondeador.no_modificados, 2)
+
+    @override_settings(HLS_PROXY=False, HLS_PROGRAM_PATH='program')
+    def test_sondea_donde_la_buscan_los_espectadores(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            (Path(carpeta) / 'program').mkdir()
+            (Path(carpeta) / 'program' / 'juan.m3u8').write_bytes(b'#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:3\n')
+            with override_settings(HLS_LOCAL_DIR=Path(carpeta)):
+                datos = self._sondear(url_playlist('juan', None))
+            self.assertEqual((datos['estado'], datos['secuencia']), (OK, 3))
+
+        with override_settings(HLS_LOCAL_DIR=None), \
+                mock.patch.object(views.origenes, 'elegir', return_value='http://b'):
+            self.assertEqual(url_playlist('juan', None), 'http://b/program/juan.m3u8')
+            self.assertEqual(url_playlist('juan', 'http://propia/x.m3u8'), 'http://propia/x.m3u8')
+        with override_settings(HLS_LOCAL_DIR=None, HLS_PROXY=True, HLS_ORIGIN_URL='http://interno/'):
+            self.assertEqual(url_playlist('juan', None), 'http://interno/program/juan.m3u8')
+
+    @override_settings(SONDEO_ACTIVO=False)
+    def test_sin_sondeo_api_live_usa_lo_que_marca_la_base(self):
+        with mock.patch.object(views.indice, 'en_vivo', return_value=['ana', 'juan']):
+            respuesta = views.live_view(RequestFactory().get('/api/live/'))
+        self.assertEqual(respuesta.status_code, 200)
+        datos = json.loads(respuesta.content)
+        self.assertEqual(datos['fuente'], 'base')
+        self.assertEqual([c['username'] for c in datos['canales']], ['ana', 'juan'])
+
+
+class MetricasTests(SimpleTestCase):
+    def setUp(self):
+        parche = mock.patch.object(metricas, 'series', {})
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _request(self, nombre):
+        request = RequestFactory().get('/')
+        request.resolver_match = mock.Mock(url_name=nombre)
+        return request
+
+    def _vista(self, request):
+        # Dos "consultas" por la envoltura que se instala en cada conexión
+        for _ in range(2):
+            metricas._envoltura(lambda *args: None, 'SELECT 1', None, False, {})
+        return HttpResponse('ok', status=201)
+
+    def test_el_middleware_mide_consultas_y_arma_server_timing(self):
+        middleware = metricas.MetricasMiddleware(self._vista)
+        respuesta = middleware(self._request('home'))
+        self.assertIn('desc="2 consultas"', respuesta['Server-Timing'])
+        serie = metricas.series['home']
+        self.assertEqual(serie.consultas.total, 1)
+        self.assertEqual(serie.consultas.suma, 2)
+        self.assertEqual(serie.estados, [0, 1, 0, 0, 0])
+        self.assertEqual(metricas.en_curso, 0)
+        # Fuera de un request la envoltura no cuenta nada
+        self.assertEqual(metricas._envoltura(lambda *args: 'fila', 'SELECT 1', None, False, {}), 'fila')
+
+    def test_hilos_concurrentes_no_pierden_observaciones(self):
+        middleware = metricas.MetricasMiddleware(lambda request: HttpResponse('ok'))
+
+        def golpear():
+            for _ in range(500):
+                middleware(self._request('home'))
+
+        hilos = [threading.Thread(target=golpear) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        serie = metricas.series['home']
+        self.assertEqual(serie.latencia.total, 4000)
+        self.assertEqual(sum(serie.latencia.cuentas), 4000)
+        self.assertEqual(serie.estados[1], 4000)
+
+    def test_exposicion_en_formato_prometheus(self):
+        serie = metricas.series['home'] = metricas.SerieVista()
+        for valor in (0.002, 0.002, 3.0):
+            serie.latencia.observar(valor)
+        serie.estados[1] = 3
+        with tempfile.TemporaryDirectory() as carpeta:
+            tabla = TablaLimites(os.path.join(carpeta, 'limites.bin'), slots=64)
+            presencia = Presencia(os.path.join(carpeta, 'presencia.bin'), canales=8, precision=4,
+                                  segundos_tramo=30, tramos=2)
+            with mock.patch.object(metricas, 'tabla', tabla), mock.patch.object(metricas, 'presencia', presencia):
+                texto = metricas.exposicion()
+
+        lineas = texto.splitlines()
+        self.assertIn('# TYPE kaircam_request_segundos histogram', lineas)
+        # Buckets acumulados, +Inf = count
+        self.assertIn('kaircam_request_segundos_bucket{vista="home",le="0.001"} 0', lineas)
+        self.assertIn('kaircam_request_segundos_bucket{vista="home",le="0.0025"} 2', lineas)
+        self.assertIn('kaircam_request_segundos_bucket{vista="home",le="2.5"} 2', lineas)
+        self.assertIn('kaircam_request_segundos_bucket{vista="home",le="+Inf"} 3', lineas)
+        self.assertIn('kaircam_request_segundos_count{vista="home"} 3', lineas)
+        self.assertIn('kaircam_respuestas_total{vista="home",clase="2xx"} 3', lineas)
+        self.assertIn('kaircam_limites_slots_ocupados 0.0', lineas)
+        # Cada línea de muestra es "nombre{labels} valor"
+        for linea in lineas:
+            if not linea.startswith('#'):
+                nombre, valor = linea.rsplit(' ', 1)
+                float(valor)
+                self.assertRegex(nombre, r'^[a-z_]+(\{.*\})?$')
+
+
+
+@skipIf(connection.vendor != 'sqlite', "carga solo siembra SQLite")
+class CargaTests(TransactionTestCase):
+    def _borrar_tablas_espejo(self):
+        # Las tablas espejo no son de Django: el flush del final no las vacía
+        # y sus claves foráneas le impedirían borrar los usuarios
+        tablas = connection.introspection.table_names()
+        with connection.schema_editor() as editor:
+            for modelo in (Cliente, CanalTransmision):
+                if modelo._meta.db_table in tablas:
+                    editor.delete_model(modelo)
+
+    def test_una_corrida_corta_arma_el_reporte(self):
+        self.addCleanup(self._borrar_tablas_espejo)
+        salida = io.StringIO()
+        call_command('carga', canales=20, escenarios='busqueda', requests=6, calentamiento=2,
+                     concurrencia=3, stdout=salida)
+        reporte = json.loads(salida.getvalue())
+        self.assertEqual((reporte['canales'], reporte['entorno']['db']), (20, 'sqlite'))
+        busqueda = reporte['escenarios']['busqueda']
+        self.assertEqual(busqueda['requests'], 6)
+        self.assertEqual(sum(busqueda['estados'].values()), 6)
+        self.assertEqual(set(busqueda['estados']), {'302'})
+        self.assertLessEqual(busqueda['latencia_ms']['p50'], busqueda['latencia_ms']['p99'])
+        self.assertIsNotNone(busqueda['consultas_por_request'])
+
+# URLconf de VistasAsyncTests: las vistas async delante del resto de las rutas
+urlpatterns = [
+    path('', vistas_async.home_view, name='home'),
+    path('search/', vistas_async.search_view, name='search'),
+    path('stream/<str:username>/', vistas_async.usuario_stream_view, name='usuario_stream'),
+    path('api/set-guest-name/', vistas_async.set_guest_name, name='set_guest_name'),
+    path('', include('principal.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF='principal.tests')
+class VistasAsyncTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        archivo = Path(temporal.name) / 'prohibidos.txt'
+        archivo.write_text('grosero\n', encoding='utf-8')
+        self.apodos = Apodos(archivo, recarga=3600, largo_max=20, canal_min=5,
+                             reservas_max=3, reserva_segundos=60)
+        parches = [
+            mock.patch('principal.apodos.indice.usernames', return_value=['juan']),
+            mock.patch.object(views, 'apodos', self.apodos),
+            mock.patch.object(vistas_async, 'apodos', self.apodos),
+            mock.patch.object(views.sondeador, 'instantanea', return_value=None),
+            mock.patch.object(vistas_async, 'paginas', paginas.CachePaginas(max_entradas=10)),
+        ]
+        for parche in parches:
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.client = AsyncClient()
+
+    def test_home_renderiza_la_pagina_publica_fuera_del_loop(self):
+        hilos = []
+
+        def render_to_string(*args, **kwargs):
+            hilos.append(threading.get_ident())
+            return 'pagina'
+
+        async def pedir():
+            loop = threading.get_ident()
+            with override_settings(PAGINA_CACHE=True), \
+                    mock.patch.object(vistas_async, 'render_to_string', render_to_string):
+                primera = await self.client.get('/')
+                segunda = await self.client.get('/')
+            return loop, primera, segunda
+
+        loop, primera, segunda = asyncio.run(pedir())
+        self.assertEqual((primera.status_code, segunda.status_code), (200, 200))
+        self.assertEqual(segunda.content, b'pagina')
+        self.assertEqual(len(hilos), 1)   # la segunda sale de la cache
+        self.assertNotEqual(hilos[0], loop)
+
+    def test_busqueda_redirige_al_canal_exacto(self):
+        async def pedir(texto):
+            with mock.patch.object(vistas_async.indice, 'aexacto', mock.AsyncMock(return_value=texto and 'juan')):
+                return await self.client.get('/search/', {'q': texto})
+
+        self.assertEqual(asyncio.run(pedir('JUAN'))['Location'], '/stream/juan/')
+        self.assertEqual(asyncio.run(pedir(''))['Location'], '/')
+
+    def test_el_apodo_guardado_llega_a_la_pagina_del_canal(self):
+        canal = CanalInfo('juan', 1, True, '', None)
+
+        async def pedir():
+            respuesta = await self.client.post('/api/set-guest-name/', json.dumps({'nickname': 'Pepe'}),
+                                               content_type='application/json')
+            with mock.patch.object(vistas_async.directorio, 'aobtener', mock.AsyncMock(return_value=canal)):
+                return respuesta, await self.client.get('/stream/juan/')
+
+        respuesta, pagina = asyncio.run(pedir())
+        self.assertEqual(json.loads(respuesta.content), {'success': True, 'nickname': 'Pepe'})
+        self.assertEqual(pagina.status_code, 200)
+        self.assertIn(b'guestName: "Pepe"', pagina.content)
@@ -1,9 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, vistas_async
+
+# Bajo daphne las vistas más visitadas corren directo en el event loop
+rapidas = vistas_async if settings.VISTAS_ASYNC else views
 
 urlpatterns = [
-    path('', views.home_view, name='home'),
-    path('search/', views.search_view, name='search'),
-    path('stream/<str:username>/', views.usuario_stream_view, name='usuario_stream'),
-    path('api/set-guest-name/', views.set_guest_name, name='set_guest_name'),
+    path('', rapidas.home_view, name='home'),
+    path('search/', rapidas.search_view, name='search'),
+    path('api/autocompletar/', views.autocompletar_view, name='autocompletar'),
+    path('api/live/', views.live_view, name='live'),
+    path('api/channels/', views.channels_view, name='channels'),
+    path('stream/<str:username>/', rapidas.usuario_stream_view, name='usuario_stream'),
+    path('api/presencia/', views.presencia_ranking_view, name='presencia_ranking'),
+    path('api/presencia/<str:username>/', views.presencia_view, name='presencia'),
+    path('api/calidad/', views.calidad_view, name='calidad'),
+    path('api/yo/', views.yo_view, name='yo'),
+    path('api/set-guest-name/', rapidas.set_guest_name, name='set_guest_name'),
+    path('api/chat/<str:username>/historial/', views.chat_historial, name='chat_historial'),
+    path('hls/<path:ruta>', views.hls_proxy_view, name='hls_proxy'),
+    path('llhls/<path:ruta>', views.llhls_view, name='llhls'),
+    path('dvr/<str:username>/playlist.m3u8', views.dvr_playlist_view, name='dvr_playlist'),
+    path('dvr/<str:username>/<str:archivo>', views.dvr_segmento_view, name='dvr_segmento'),
+    path('metrics', views.metricas_view, name='metricas'),
 ]
\ No newline at end of file
@@ -1,65 +1,171 @@
 import json
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+import math
+import os
+import time
+from django.http import (
+    FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse,
+)
+from django.views.decorators.http import require_POST, require_http_methods, require_safe
 from django.views.decorators.csrf import csrf_exempt 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.conf import settings
 from django.contrib.auth.models import User # Importamos User por si acaso
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
-from .models import CanalTransmision, Cliente
+from .apodos import ApodoInvalido, apodos
+from .calidad import cola, validar
+from .catalogo import catalogo, decodificar_cursor
+from .chat import APODO_OCUPADO, SALA_OFICIAL, es_sala, nombre_sala
+from .chatlog import registros
+from .directorio import directorio
+from .dvr import IndiceCanal, armar_playlist, directorio_canal, es_nombre_segmento
+from .hls_proxy import TIPO_PLAYLIST, playlists
+from .indice import indice
+from . import invitado
+from .limites import ip_de, limitar
+from .llhls import vigias
+from .metricas import exposicion
+from .origenes import origenes
+from .paginas import paginas, version_de
+from .presencia import presencia
+from .segmentos import TIPOS_SEGMENTO, ArchivoAcotado, es_segmento, parsear_rango, segmentos
+from .sondeo import OK, sondeador
 
 # ============================
 # UTIL
 # ============================
-def build_hls_url(filename: str) -> str:
-    """Construye la URL final del stream HLS"""
-    base = settings.HLS_BASE_URL.rstrip("/")
+def build_hls_url(filename: str, canal: str) -> str:
+    """Construye la URL final del stream HLS (el origen depende del canal)"""
     program = settings.HLS_PROGRAM_PATH.strip("/")
+    if settings.HLS_LOCAL_DIR:
+        # LL-HLS servido desde el directorio local, con recarga bloqueante
+        return reverse('llhls', args=[f"{program}/{filename}"])
+    if settings.HLS_PROXY:
+        # Mismo esquema de URL, pero servido por el proxy de este sitio
+        return reverse('hls_proxy', args=[f"{program}/{filename}"])
+    base = origenes.elegir(canal)
     return f"{base}/{program}/{filename}"
 
+
+def render_publico(request, clave, contexto):
+    """
+    Renderiza home.html sin nada del visitante (ni request, ni sesión, ni
+    mensajes) y lo reutiliza mientras no cambien los datos del contexto.
+    """
+    version = version_de(contexto)
+    pagina = paginas.obtener(clave, version)
+    if pagina is None:
+        contenido = render_to_string('principal/home.html', {**contexto, 'pagina_publica': True})
+        pagina = paginas.guardar(clave, version, contenido.encode('utf-8'))
+    return respuesta_pagina(request, pagina)
+
+def respuesta_pagina(request, pagina):
+    """Respuesta (o 304) con una página pública ya renderizada."""
+    respuesta = get_conditional_response(
+        request, etag=pagina.etag, last_modified=int(pagina.generada),
+    )
+    if respuesta is None:
+        respuesta = HttpResponse(pagina.contenido)
+    respuesta['ETag'] = pagina.etag
+    respuesta['Last-Modified'] = http_date(pagina.generada)
+    respuesta['Cache-Control'] = f"public, max-age={settings.PAGINA_CACHE_MAX_AGE}"
+    return respuesta
+
 # ============================
 # HOME / CANAL OFICIAL
 # ============================
-def home_view(request):
+def contexto_home():
     stream_data = {
         'name': "Kaircam Oficial",
-        'hls_url': build_hls_url("publicidad.m3u8"),
+        'hls_url': build_hls_url("publicidad.m3u8", SALA_OFICIAL),
         'en_vivo': True,
     }
 
-    return render(request, 'principal/home.html', {
+    return {
         'stream': stream_data,
         'es_home': True,
+        'sala': SALA_OFICIAL,
         'cliente': None
-    })
+    }
+
+def home_view(request):
+    contexto = contexto_home()
+    if settings.PAGINA_CACHE:
+        return render_publico(request, SALA_OFICIAL, contexto)
+    contexto['espectadores'] = presencia.contar(SALA_OFICIAL)
+    return render(request, 'principal/home.html', contexto)
 
 # ============================
 # BÚSQUEDA DE CANALES
 # ============================
+@limitar('busqueda')
 def search_view(request):
     query = request.GET.get('q', '').strip()
 
     if not query:
         return redirect('home')
 
-    # Buscamos si existe el canal
-    canal = CanalTransmision.objects.filter(usuario__username__iexact=query).first()
+    # Buscamos si existe el canal (índice en memoria, sin distinguir mayúsculas)
+    username = indice.exacto(query)
 
-    if canal:
+    if username:
         # Si existe, vamos a su perfil
-        return redirect('usuario_stream', username=canal.usuario.username)
+        return redirect('usuario_stream', username=username)
     else:
         # Si NO existe, mandamos alerta y quedamos en home
         messages.error(request, f"❌ El usuario '{query}' no fue encontrado.")
         return redirect('home')
 
+def autocompletar_view(request):
+    """Top-k canales cuyo username empieza con ?q= (los en vivo primero)"""
+    query = request.GET.get('q', '').strip()
+    try:
+        k = int(request.GET.get('k', settings.AUTOCOMPLETAR_MAX))
+    except ValueError:
+        k = settings.AUTOCOMPLETAR_MAX
+    k = max(1, min(k, settings.AUTOCOMPLETAR_MAX))
+
+    resultados = indice.prefijo(query, k) if query else []
+    return JsonResponse({
+        'resultados': [
+            {'username': username, 'en_vivo': en_vivo}
+            for username, en_vivo in resultados
+        ],
+    })
+
 # ============================
 # CANAL DE USUARIO (PÚBLICO)
 # ============================
+def contexto_canal(canal):
+    """Contexto de home.html para un canal (sin nada del visitante)"""
+    hls_final = canal.url_hls or build_hls_url(f"{canal.username}.m3u8", canal.username)
+
+    # ¿Está realmente en vivo? La foto del sondeo manda sobre lo que dice el panel
+    foto = sondeador.instantanea()
+    en_vivo = foto.en_vivo(canal.username) if foto else canal.en_vivo
+
+    stream_data = {
+        'name': f"Canal de {canal.username}",
+        'hls_url': hls_final,
+        'en_vivo': en_vivo,
+    }
+
+    return {
+        'stream': stream_data,
+        'es_home': False,
+        'streamer_name': canal.username,
+        'cliente': canal.cliente,
+        'dvr_url': reverse('dvr_playlist', args=[canal.username]) if settings.DVR_ACTIVO else '',
+    }
+
 def usuario_stream_view(request, username):
-    # 1. Intentamos obtener el canal. Usamos filter().first() para no romper con error 404
-    canal = CanalTransmision.objects.filter(usuario__username=username).first()
+    # 1. Intentamos obtener el canal (canal + usuario + cliente salen del directorio en memoria)
+    canal = directorio.obtener(username)
     
     # === AQUÍ ESTÁ EL CAMBIO IMPORTANTE ===
     if not canal:
@@ -68,46 +174,431 @@ def usuario_stream_view(request, username):
         return redirect('home')
     # ======================================
 
-    # 2. Intentar obtener los datos sociales del Cliente
-    cliente = Cliente.objects.filter(user=canal.usuario).first()
+    # El directorio no distingue mayúsculas: llevamos siempre a la URL canónica
+    if canal.username != username:
+        return redirect('usuario_stream', username=canal.username)
 
-    # 3. Preparar datos del stream
-    hls_final = canal.url_hls if hasattr(canal, 'url_hls') and canal.url_hls else build_hls_url(f"{canal.usuario.username}.m3u8")
+    # 2. Preparar datos del stream
+    contexto = contexto_canal(canal)
+    if settings.PAGINA_CACHE:
+        # Sin guest_name ni espectadores: los completa el navegador (/api/yo/, /api/presencia/)
+        return render_publico(request, canal.username, contexto)
 
-    stream_data = {
-        'name': f"Canal de {canal.usuario.username}",
-        'hls_url': hls_final,
-        'en_vivo': canal.en_vivo,
-    }
+    apodo, migrar = invitado.apodo_de(request)
+    contexto['guest_name'] = apodo or ''
+    contexto['espectadores'] = presencia.contar(canal.username)
+    respuesta = render(request, 'principal/home.html', contexto)
+    if migrar:
+        invitado.guardar(respuesta, apodo)
+    return respuesta
 
-    return render(request, 'principal/home.html', {
-        'stream': stream_data,
-        'es_home': False,
-        'streamer_name': canal.usuario.username,
-        'cliente': cliente,
-        'guest_name': request.session.get('guest_name', ''),
+# ============================
+# API PÚBLICA (Canales en vivo)
+# ============================
+def live_view(request):
+    """Canales en vivo según la última foto del sondeo (sin consultar la base)"""
+    if not settings.SONDEO_ACTIVO:
+        # Sin sondeo queda lo que marcó el panel (del índice en memoria)
+        return JsonResponse({
+            'success': True,
+            'fuente': 'base',
+            'generado': time.time(),
+            'canales': [{'username': username, 'estado': OK} for username in indice.en_vivo()],
+        })
+
+    foto = sondeador.instantanea()
+    if foto is None:
+        return JsonResponse({'success': False, 'error': 'Estado todavía no disponible.'}, status=503)
+
+    return JsonResponse({
+        'success': True,
+        'fuente': 'sondeo',
+        'generado': foto.generada,
+        'canales': [
+            {'username': username, **datos}
+            for username, datos in sorted(foto.canales.items())
+        ],
+    })
+
+def channels_view(request):
+    """Directorio de canales (en vivo primero), paginado por cursor: ?after=&limit="""
+    try:
+        despues = decodificar_cursor(request.GET['after']) if request.GET.get('after') else None
+        limite = int(request.GET.get('limit', 50))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Parámetros inválidos.'}, status=400)
+    limite = max(1, min(limite, settings.CATALOGO_PAGINA_MAX))
+
+    foto = catalogo.obtener()
+    etag = foto.etag(despues, limite)
+    # Listas de ETags, W/ y '*' como manda la RFC (no una comparación de strings)
+    respuesta = get_conditional_response(request, etag=etag, last_modified=int(foto.generada))
+    if respuesta is None:
+        canales, siguiente = foto.pagina(despues, limite)
+        respuesta = JsonResponse({
+            'success': True,
+            'version': foto.version,
+            'canales': canales,
+            'siguiente': siguiente,
+        })
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(foto.generada)
+    respuesta['Cache-Control'] = f"public, max-age={settings.CATALOGO_TTL}"
+    return respuesta
+
+# ============================
+# API PÚBLICA (Espectadores)
+# ============================
+def _respuesta_presencia(nombre):
+    respuesta = JsonResponse({
+        'success': True,
+        'canal': nombre,
+        'espectadores': presencia.contar(nombre),
+        'ventana': presencia.ventana,
+        'latido': presencia.segundos_tramo / 2,
+    })
+    respuesta['Cache-Control'] = 'no-store'
+    return respuesta
+
+# El latido no lleva token CSRF (también sirve desde navigator.sendBeacon): solo suma a un conteo
+@csrf_exempt
+@require_http_methods(['GET', 'HEAD', 'POST'])
+@limitar('presencia', json=True, post='latido')
+def presencia_view(request, username):
+    """GET: espectadores del canal. POST: latido del reproductor (body = id del visor)"""
+    nombre = nombre_sala(username)
+    if nombre is None:
+        return JsonResponse({'success': False, 'error': 'Canal inexistente.'}, status=404)
+
+    if request.method == 'POST':
+        visor = request.body.decode('utf-8', 'ignore').strip()
+        if not visor or len(visor) > 64:
+            return JsonResponse({'success': False, 'error': 'Datos inválidos.'}, status=400)
+        presencia.latido(nombre, visor)
+    return _respuesta_presencia(nombre)
+
+@limitar('ranking', json=True)
+def presencia_ranking_view(request):
+    """Canales con más espectadores en este momento: ?limit="""
+    try:
+        limite = int(request.GET.get('limit', 20))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Parámetros inválidos.'}, status=400)
+    limite = max(1, min(limite, settings.PRESENCIA_RANKING_MAX))
+
+    respuesta = JsonResponse({
+        'success': True,
+        'ventana': presencia.ventana,
+        'canales': [
+            {'username': username, 'espectadores': espectadores}
+            for username, espectadores in presencia.ranking(limite)
+        ],
     })
+    respuesta['Cache-Control'] = f"public, max-age={math.ceil(settings.PRESENCIA_RANKING_SEGUNDOS)}"
+    return respuesta
+
+# ============================
+# API PÚBLICA (Calidad de reproducción)
+# ============================
+def _canal_calidad(canal):
+    """Nombre exacto del canal de un beacon (el oficial o uno del índice); None si no existe."""
+    return SALA_OFICIAL if canal == SALA_OFICIAL else indice.exacto(canal)
+
+# Llega por navigator.sendBeacon, que no manda el header CSRF; solo encola eventos
+@csrf_exempt
+@require_POST
+@limitar('calidad', json=True)
+def calidad_view(request):
+    """Lote de eventos del reproductor: se valida y se encola (sin DB ni disco)"""
+    try:
+        eventos = validar(json.loads(request.body), settings.CALIDAD_LOTE_MAX, _canal_calidad)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Datos inválidos.'}, status=400)
+
+    cola.agregar(eventos)
+    return HttpResponse(status=204)
+
+# ============================
+# MÉTRICAS (Prometheus)
+# ============================
+def metricas_view(request):
+    """Histogramas por vista, caches y conexiones activas (solo METRICAS_IPS)"""
+    if ip_de(request) not in settings.METRICAS_IPS:
+        return HttpResponse(status=404)
+    return HttpResponse(exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# ============================
+# API INTERNA (Datos del visitante)
+# ============================
+def yo_view(request):
+    """Lo personal que las páginas cacheadas no llevan: apodo y alertas flash"""
+    # De paso deja la cookie CSRF que usa el POST de set_guest_name
+    get_token(request)
+
+    apodo, migrar = invitado.apodo_de(request)
+    respuesta = JsonResponse({
+        'guest_name': apodo or '',
+        'mensajes': [str(mensaje) for mensaje in messages.get_messages(request)],
+    })
+    if migrar:
+        invitado.guardar(respuesta, apodo)
+    respuesta['Cache-Control'] = 'private, no-store'
+    return respuesta
 
 # ============================
 # API INTERNA (Chat Invitado)
 # ============================
 @require_POST
+@limitar('apodo', json=True)
 def set_guest_name(request):
-    """Guarda el nombre temporal del invitado en la sesión"""
+    """Guarda el nombre temporal del invitado en una cookie firmada (sin sesión)"""
+    return respuesta_apodo(request, request.user.username if request.user.is_authenticated else None)
+
+def respuesta_apodo(request, propio=None):
+    """
+    Valida el apodo del body y arma la respuesta con la cookie (sin DB).
+    Con `canal` en el body lo reserva ya en esa sala; `propio` es el username
+    del que lo pide logueado (puede usar el nombre de su canal).
+    """
     try:
         data = json.loads(request.body)
-        nickname = data.get('nickname', '').strip()
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Datos inválidos.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'error': 'Datos inválidos.'}, status=400)
+
+    nickname = data.get('nickname')
+    try:
+        nickname = apodos.validar(nickname if isinstance(nickname, str) else '', propio)
+    except ApodoInvalido as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    # El mismo visitante conserva su id (y sus reservas) al cambiar de apodo
+    visitante = invitado.visitante_de(request) or invitado.nuevo_visitante()
+    canal = data.get('canal')
+    if isinstance(canal, str) and es_sala(canal):
+        if not apodos.reservar(canal, nickname, visitante):
+            return JsonResponse({'success': False, 'error': APODO_OCUPADO})
+
+    # Cookie firmada y con vencimiento: la leen las vistas y el chat sin ir a la DB
+    respuesta = JsonResponse({'success': True, 'nickname': nickname})
+    invitado.guardar(respuesta, nickname, visitante, propio)
+    return respuesta
+
+# ============================
+# API INTERNA (Historial del chat)
+# ============================
+def chat_historial(request, username):
+    """Página del historial del chat: ?before=<cursor>&limit=<n>"""
+    nombre = nombre_sala(username)
+    if nombre is None:
+        return JsonResponse({'success': False, 'error': 'Canal inexistente.'}, status=404)
+
+    try:
+        antes = int(request.GET['before']) if request.GET.get('before') else None
+        limite = int(request.GET.get('limit', 50))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Parámetros inválidos.'}, status=400)
+    limite = max(1, min(limite, settings.CHAT_HISTORIAL_PAGINA_MAX))
 
-        if not nickname:
-            return JsonResponse({'success': False, 'error': 'El nombre no puede estar vacío.'})
-        
-        if len(nickname) > 20:
-            return JsonResponse({'success': False, 'error': 'El nombre es muy largo (máx 20 caracteres).'})
+    mensajes, siguiente = registros.obtener(nombre).pagina(antes=antes, limite=limite)
+    return JsonResponse({
+        'success': True,
+        'mensajes': [
+            {'id': id_, 'autor': autor, 'texto': texto, 'ts': ts}
+            for id_, autor, texto, ts in mensajes
+        ],
+        'siguiente': siguiente,
+    })
+
+# ============================
+# PROXY HLS (PLAYLISTS)
+# ============================
+@require_safe
+def hls_proxy_view(request, ruta):
+    """Sirve playlists .m3u8 desde el cache single-flight; el resto va al origen"""
+    if '..' in ruta.split('/'):
+        return HttpResponse(status=400)
+
+    if settings.HLS_SEGMENT_CACHE and es_segmento(ruta):
+        return _servir_segmento(request, ruta)
+
+    if not ruta.endswith('.m3u8'):
+        return redirect(playlists.url_origen(ruta))
+
+    playlist = playlists.obtener(ruta)
+    if playlist.error is not None:
+        status = 404 if playlist.error.status == 404 else 502
+        return HttpResponse(status=status)
 
-        # Guardamos en la sesión (esto es lo que leerá Django Channels después)
-        request.session['guest_name'] = nickname
-        request.session.modified = True # Aseguramos que se guarde
+    respuesta = get_conditional_response(request, etag=playlist.etag)
+    if respuesta is None:
+        respuesta = HttpResponse(playlist.cuerpo, content_type=TIPO_PLAYLIST)
+    respuesta['ETag'] = playlist.etag
+    respuesta['Last-Modified'] = http_date(playlist.obtenida)
+    respuesta['Cache-Control'] = f"public, max-age={max(1, math.floor(settings.HLS_PROXY_TTL))}"
+    return respuesta
 
-        return JsonResponse({'success': True, 'nickname': nickname})
-    except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)})
\ No newline at end of file
+
+def _servir_segmento(request, ruta):
+    """Segmento desde el cache en disco (o mientras se descarga), con soporte de Range"""
+    tipo = TIPOS_SEGMENTO[os.path.splitext(ruta)[1].lower()]
+    origen, valor = segmentos.obtener(ruta)
+
+    if origen == 'archivo':
+        archivo = valor
+        total = os.fstat(archivo.fileno()).st_size
+    else:
+        relleno = valor
+        relleno.cabeceras.wait(settings.HLS_PROXY_TIMEOUT)
+        if relleno.status is not None:
+            return HttpResponse(status=404 if relleno.status == 404 else 502)
+        try:
+            archivo = open(relleno.ruta_parcial, 'rb')
+        except FileNotFoundError:
+            # Terminó y se renombró justo ahora: ya es un acierto
+            return _servir_segmento(request, ruta)
+        total = relleno.total
+
+    try:
+        rango = parsear_rango(request.headers.get('Range'), total)
+    except ValueError:
+        archivo.close()
+        respuesta = HttpResponse(status=416)
+        respuesta['Content-Range'] = f"bytes */{total}"
+        return respuesta
+
+    inicio, fin = rango if rango else (0, None)
+    if origen == 'archivo':
+        if rango is None:
+            # Acierto completo: FileResponse deja que el servidor use sendfile
+            respuesta = FileResponse(archivo, content_type=tipo)
+        else:
+            respuesta = FileResponse(ArchivoAcotado(archivo, inicio, fin), content_type=tipo)
+    else:
+        cuerpo = relleno.leer(archivo, inicio, fin, settings.HLS_PROXY_TIMEOUT)
+        respuesta = StreamingHttpResponse(cuerpo, content_type=tipo)
+
+    if rango is not None:
+        respuesta.status_code = 206
+        respuesta['Content-Range'] = f"bytes {inicio}-{fin}/{total}"
+        respuesta['Content-Length'] = fin - inicio + 1
+    elif total is not None:
+        respuesta['Content-Length'] = total
+    respuesta['Accept-Ranges'] = 'bytes'
+    respuesta['Cache-Control'] = f"public, max-age={settings.HLS_SEGMENT_MAX_AGE}"
+    return respuesta
+
+# ============================
+# LL-HLS (RECARGA BLOQUEANTE)
+# ============================
+def _respuesta_playlist(cuerpo, max_age):
+    respuesta = HttpResponse(cuerpo, content_type=TIPO_PLAYLIST)
+    respuesta['Cache-Control'] = f"public, max-age={max_age}"
+    return respuesta
+
+
+@require_safe
+async def llhls_view(request, ruta):
+    """Playlist del directorio local; con _HLS_msn/_HLS_part espera a que aparezca"""
+    if '..' in ruta.split('/'):
+        return HttpResponse(status=400)
+    ruta_local = settings.HLS_LOCAL_DIR / ruta
+
+    if not ruta.endswith('.m3u8'):
+        # Segmentos y partes: en producción los sirve nginx; esto cubre el caso sin proxy
+        if not ruta_local.is_file():
+            return HttpResponse(status=404)
+        return FileResponse(open(ruta_local, 'rb'))
+
+    vigia = vigias.obtener(str(ruta_local))
+    estado = vigia.actual()
+    if estado is None:
+        return HttpResponse(status=404)
+
+    msn = request.GET.get('_HLS_msn')
+    parte = request.GET.get('_HLS_part')
+    if msn is None:
+        if parte is not None:
+            return HttpResponse(status=400)
+        return _respuesta_playlist(estado.cuerpo, 1)
+
+    try:
+        msn = int(msn)
+        parte = int(parte) if parte is not None else None
+    except ValueError:
+        return HttpResponse(status=400)
+
+    # La especificación pide rechazar lo que está a más de dos segmentos del final
+    if msn > estado.ultimo_msn + 2:
+        return HttpResponse(status=400)
+
+    estado = await vigia.esperar(msn, parte, settings.HLS_BLOQUEO_MAX)
+    if estado is None:
+        return HttpResponse(status=503)
+    # La URL con _HLS_msn/_HLS_part es única: se puede cachear más tiempo
+    return _respuesta_playlist(estado.cuerpo, math.ceil(settings.HLS_BLOQUEO_MAX))
+
+# ============================
+# DVR (PLAYLISTS HACIA ATRÁS)
+# ============================
+def _canal_dvr(username):
+    return directorio.obtener(username) if settings.DVR_ACTIVO else None
+
+
+@require_safe
+def dvr_playlist_view(request, username):
+    """Playlist desde el índice del archivo: ?atras=<minutos> o ?desde=<epoch>[&hasta=<epoch>]"""
+    canal = _canal_dvr(username)
+    if not canal:
+        return HttpResponse(status=404)
+
+    ahora = time.time()
+    ventana = settings.DVR_VENTANA_MAX
+    try:
+        if 'atras' in request.GET:
+            # Se fija el comienzo para que todas las recargas pidan la misma playlist
+            desde = max(ahora - float(request.GET['atras']) * 60, ahora - ventana)
+            if not math.isfinite(desde):
+                raise ValueError
+            url = reverse('dvr_playlist', args=[canal.username])
+            return redirect(f"{url}?desde={math.floor(desde)}")
+        desde = float(request.GET['desde'])
+        hasta = float(request.GET['hasta']) if 'hasta' in request.GET else None
+    except (KeyError, ValueError):
+        return HttpResponse(status=400)
+
+    if not math.isfinite(desde) or (hasta is not None and not math.isfinite(hasta)):
+        return HttpResponse(status=400)
+    if hasta is not None and not 0 < hasta - desde <= ventana:
+        return HttpResponse(status=400)
+
+    if hasta is None:
+        # En vivo: el comienzo se corre con la ventana (y con la retención), avanzando
+        # MEDIA-SEQUENCE, así la playlist nunca deja de crecer
+        desde = max(desde, ahora - ventana)
+    # Con segmentos de al menos 1 s, la ventana máxima acota los registros a leer
+    registros = IndiceCanal(directorio_canal(canal.username)).rango(desde, hasta, int(ventana) + 1)
+    if not registros:
+        return HttpResponse(status=404)
+
+    terminada = hasta is not None
+    ultimo = registros[-1]
+    # Un VOD que ya tiene todo su rango archivado no cambia más
+    completa = terminada and ultimo[1] + ultimo[2] >= hasta
+    return _respuesta_playlist(armar_playlist(registros, terminada), 3600 if completa else 1)
+
+
+@require_safe
+def dvr_segmento_view(request, username, archivo):
+    """Segmento archivado (en producción conviene que lo sirva nginx)"""
+    canal = _canal_dvr(username)
+    if not canal or not es_nombre_segmento(archivo):
+        return HttpResponse(status=404)
+    try:
+        segmento = open(directorio_canal(canal.username) / archivo, 'rb')
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+    respuesta = FileResponse(segmento, content_type=TIPOS_SEGMENTO['.ts'])
+    respuesta['Cache-Control'] = f"public, max-age={settings.HLS_SEGMENT_MAX_AGE}"
+    return respuesta
@@ -0,0 +1,109 @@
+"""
+Versiones async de las vistas más visitadas, para correr bajo daphne.
+
+Con VISTAS_ASYNC=True las rutas de home, búsqueda, canal y apodo apuntan
+acá: corren en el event loop, sin el salto a un hilo de sync_to_async por
+request, y lo que va a la base usa el ORM async (directorio, índice).
+Las vistas de views.py siguen siendo las de WSGI.
+
+Quedan en un hilo los renders de templates (son sync y pueden tardar:
+con request además recorren los mensajes flash, que leen la sesión) y la
+migración del apodo desde sesiones viejas. Con PAGINA_CACHE un acierto se
+sirve sin salir del loop; solo la página que falta se renderiza en un hilo.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
+
+from . import invitado
+from .apodos import apodos
+from .chat import SALA_OFICIAL
+from .directorio import directorio
+from .indice import indice
+from .limites import limitar
+from .paginas import paginas, version_de
+from .presencia import presencia
+from .views import contexto_canal, contexto_home, respuesta_apodo, respuesta_pagina
+
+
+# ============================
+# PÁGINAS PÚBLICAS (PAGINA_CACHE)
+# ============================
+async def render_publico(request, clave, contexto):
+    """views.render_publico sin bloquear el loop cuando la página hay que renderizarla."""
+    version = version_de(contexto)
+    pagina = paginas.obtener(clave, version)
+    if pagina is None:
+        contenido = await sync_to_async(render_to_string)(
+            'principal/home.html', {**contexto, 'pagina_publica': True})
+        pagina = paginas.guardar(clave, version, contenido.encode('utf-8'))
+    return respuesta_pagina(request, pagina)
+
+
+# ============================
+# HOME / CANAL OFICIAL
+# ============================
+async def home_view(request):
+    contexto = contexto_home()
+    if settings.PAGINA_CACHE:
+        return await render_publico(request, SALA_OFICIAL, contexto)
+    contexto['espectadores'] = presencia.contar(SALA_OFICIAL)
+    return await sync_to_async(render)(request, 'principal/home.html', contexto)
+
+
+# ============================
+# BÚSQUEDA DE CANALES
+# ============================
+@limitar('busqueda')
+async def search_view(request):
+    query = request.GET.get('q', '').strip()
+
+    if not query:
+        return redirect('home')
+
+    username = await indice.aexacto(query)
+    if username:
+        return redirect('usuario_stream', username=username)
+
+    messages.error(request, f"❌ El usuario '{query}' no fue encontrado.")
+    return redirect('home')
+
+
+# ============================
+# CANAL DE USUARIO (PÚBLICO)
+# ============================
+async def usuario_stream_view(request, username):
+    canal = await directorio.aobtener(username)
+    if not canal:
+        messages.error(request, f"⚠️ El canal de '{username}' no existe o no está disponible.")
+        return redirect('home')
+
+    if canal.username != username:
+        return redirect('usuario_stream', username=canal.username)
+
+    contexto = contexto_canal(canal)
+    if settings.PAGINA_CACHE:
+        return await render_publico(request, canal.username, contexto)
+
+    apodo, migrar = await invitado.aapodo_de(request)
+    contexto['guest_name'] = apodo or ''
+    contexto['espectadores'] = presencia.contar(canal.username)
+    respuesta = await sync_to_async(render)(request, 'principal/home.html', contexto)
+    if migrar:
+        invitado.guardar(respuesta, apodo)
+    return respuesta
+
+
+# ============================
+# API INTERNA (Chat Invitado)
+# ============================
+@require_POST
+@limitar('apodo', json=True)
+async def set_guest_name(request):
+    """Igual que views.set_guest_name (la sesión solo se lee si hay cookie de sesión)."""
+    usuario = await request.auser()
+    await apodos.aasegurar()
+    return respuesta_apodo(request, usuario.username if usuario.is_authenticated else None)
@@ -3,4 +3,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stream_general.settings')
 
-application = get_asgi_application()
+# Inicializa Django ANTES de importar nada que use modelos
+django_application = get_asgi_application()
+
+from principal.routing import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # HTTP -> Django, WebSocket -> principal.routing
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
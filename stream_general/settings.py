@@ -1,4 +1,6 @@
+import copy
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -18,6 +20,15 @@ if env_file.exists():
 else:
     load_dotenv(BASE_DIR / ".env")
 
+# ============================
+# ARCHIVOS COMPARTIDOS ENTRE WORKERS
+# ============================
+# Tablas mapeadas (límites, presencia) y reparto de orígenes: en /dev/shm si
+# existe, si no en el temporal del sistema. Nunca dentro del proyecto: ni el
+# checkout ni los tests arrastran el estado de otra corrida.
+_RUN_DIR_DEFECTO = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+RUN_DIR = Path(os.getenv("RUN_DIR", _RUN_DIR_DEFECTO / "kaircam"))
+
 # ============================
 # SECURITY
 # ============================
@@ -41,6 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para medir la latencia completa (ver principal/metricas.py)
+    'principal.metricas.MetricasMiddleware',
+    'principal.perfilador.PerfilMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,7 +71,8 @@ ROOT_URLCONF = 'stream_general.urls'
 # ============================
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de render
+        'BACKEND': 'principal.metricas.PlantillasMedidas',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -71,6 +86,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'stream_general.wsgi.application'
+ASGI_APPLICATION = 'stream_general.asgi.application'
 
 # ============================
 # DATABASE
@@ -83,9 +99,79 @@ DATABASES = {
         'PASSWORD': os.getenv("DB_PASSWORD"),
         'HOST': os.getenv("DB_HOST", "localhost"),
         'PORT': os.getenv("DB_PORT", "5432"),
+        # Conexiones persistentes (WSGI); con DB_POOL queda en 0, el pool las reutiliza
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "0")),
+        # Verifica la conexión antes de reutilizarla (también la que presta el pool)
+        'CONN_HEALTH_CHECKS': os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True",
     }
 }
 
+# Pool de conexiones acotado (psycopg 3 + psycopg_pool). Bajo ASGI las
+# conexiones persistentes no sirven: cada request async usa otra, así que
+# en daphne conviene el pool.
+DB_POOL = os.getenv("DB_POOL", "False") == "True"
+if DB_POOL and DATABASES['default']['ENGINE'] == "django.db.backends.postgresql":
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv("DB_POOL_MIN", "2")),
+            'max_size': int(os.getenv("DB_POOL_MAX", "10")),
+            # Segundos que un request espera una conexión libre antes de fallar
+            'timeout': float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            'max_idle': float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+            'max_lifetime': float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+        },
+    }
+
+# ============================
+# RÉPLICAS DE LECTURA
+# ============================
+# Lecturas de las tablas espejo (core_*) a réplicas: "host[:puerto][@peso],..."
+# (con SQLite cada entrada es la ruta del archivo). Mismo usuario y base que default.
+DB_REPLICAS_PESOS = {}
+for _i, _entrada in enumerate(e.strip() for e in os.getenv("DB_REPLICAS", "").split(",")):
+    if not _entrada:
+        continue
+    _destino, _, _peso = _entrada.partition("@")
+    _replica = copy.deepcopy(DATABASES['default'])
+    if _replica['ENGINE'] == "django.db.backends.sqlite3":
+        _replica['NAME'] = _destino
+    else:
+        _replica['HOST'], _, _puerto = _destino.partition(":")
+        _replica['PORT'] = _puerto or _replica['PORT']
+    _replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f"replica{_i + 1}"] = _replica
+    DB_REPLICAS_PESOS[f"replica{_i + 1}"] = int(_peso or 1)
+
+if DB_REPLICAS_PESOS:
+    DATABASE_ROUTERS = ['principal.replicas.RouterReplicas']
+# Cada cuánto se revisan las réplicas y cuánto atraso se tolera (segundos)
+DB_REPLICA_CHEQUEO = float(os.getenv("DB_REPLICA_CHEQUEO", "5"))
+DB_REPLICA_LAG_MAX = float(os.getenv("DB_REPLICA_LAG_MAX", "10"))
+
+# Vistas async (home, búsqueda, canal, apodo) para daphne; WSGI usa las sync
+VISTAS_ASYNC = os.getenv("VISTAS_ASYNC", "False") == "True"
+
+# ============================
+# MÉTRICAS
+# ============================
+# Header Server-Timing (db, tpl, total) en cada respuesta
+METRICAS_SERVER_TIMING = os.getenv("METRICAS_SERVER_TIMING", "True") == "True"
+# IPs que pueden leer /metrics (Prometheus)
+METRICAS_IPS = [ip.strip() for ip in os.getenv("METRICAS_IPS", "127.0.0.1,::1").split(",") if ip.strip()]
+
+# ============================
+# PERFILADOR (muestreo)
+# ============================
+# Perfilar una fracción de los requests (o los que traen X-Kaircam-Perfil desde PERFIL_IPS)
+PERFIL_ACTIVO = os.getenv("PERFIL_ACTIVO", "False") == "True"
+PERFIL_FRACCION = float(os.getenv("PERFIL_FRACCION", "0.01"))
+PERFIL_IPS = [ip.strip() for ip in os.getenv("PERFIL_IPS", "127.0.0.1,::1").split(",") if ip.strip()]
+PERFIL_HZ = float(os.getenv("PERFIL_HZ", "100"))
+PERFIL_DIR = Path(os.getenv("PERFIL_DIR", BASE_DIR / "perfiles"))
+PERFIL_VOLCADO = float(os.getenv("PERFIL_VOLCADO", "30"))
+PERFIL_MAX_ARCHIVOS = int(os.getenv("PERFIL_MAX_ARCHIVOS", "200"))
+
 # ============================
 # PASSWORD VALIDATION
 # ============================
@@ -115,13 +201,204 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# collectstatic deja nombres con hash + .gz/.br (ver principal/estaticos.py).
+# STATIC_ROOT no va al repo: es un paso del deploy, con DEBUG=False
+#   python manage.py derivadas && python manage.py collectstatic --clear --noinput
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "principal.estaticos.EstaticosComprimidos"},
+}
+# Servir /static/ desde Django (daphne sin nginx delante)
+STATIC_SERVIR = os.getenv("STATIC_SERVIR", "False") == "True"
+# Anchos de las derivadas WebP/AVIF (`manage.py derivadas`, antes de collectstatic)
+IMAGENES_ANCHOS = [int(ancho) for ancho in os.getenv("IMAGENES_ANCHOS", "64,128,256,512,1024").split(",")]
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ============================
 # HLS SETTINGS (PÚBLICO)
 # ============================
-HLS_BASE_URL = os.getenv("HLS_BASE_URL")
+# Uno o varios orígenes separados por coma; cada canal se asigna a uno (ver principal/origenes.py)
+HLS_ORIGENES = [url.strip().rstrip("/") for url in os.getenv("HLS_BASE_URL", "").split(",") if url.strip()]
+HLS_BASE_URL = HLS_ORIGENES[0] if HLS_ORIGENES else None
 HLS_PROGRAM_PATH = os.getenv("HLS_PROGRAM_PATH", "program")
+# Con varios orígenes: chequeo de salud (archivo que todo origen sano sirve)
+HLS_ORIGEN_SONDA = os.getenv("HLS_ORIGEN_SONDA", f"{HLS_PROGRAM_PATH.strip('/')}/publicidad.m3u8")
+HLS_ORIGEN_CHEQUEO = float(os.getenv("HLS_ORIGEN_CHEQUEO", "5"))
+HLS_ORIGEN_TIMEOUT = float(os.getenv("HLS_ORIGEN_TIMEOUT", "2"))
+# Fallos seguidos para sacar un origen del anillo
+HLS_ORIGEN_FALLOS = int(os.getenv("HLS_ORIGEN_FALLOS", "2"))
+# Ningún origen recibe más que holgura * carga promedio (espectadores)
+HLS_ORIGEN_HOLGURA = float(os.getenv("HLS_ORIGEN_HOLGURA", "1.25"))
+HLS_ORIGEN_VIRTUALES = int(os.getenv("HLS_ORIGEN_VIRTUALES", "64"))
+# Reparto vigente, compartido por los workers de la máquina
+HLS_ORIGEN_ARCHIVO = Path(os.getenv("HLS_ORIGEN_ARCHIVO", RUN_DIR / "origenes.json"))
+
+# Proxy de playlists: el navegador pide /hls/... a este sitio y nosotros al origen
+HLS_PROXY = os.getenv("HLS_PROXY", "False") == "True"
+HLS_ORIGIN_URL = os.getenv("HLS_ORIGIN_URL", HLS_BASE_URL)
+# Vida de una playlist en cache (menor que la duración de un segmento)
+HLS_PROXY_TTL = float(os.getenv("HLS_PROXY_TTL", "0.5"))
+HLS_PROXY_TTL_ERROR = float(os.getenv("HLS_PROXY_TTL_ERROR", "1"))
+HLS_PROXY_TIMEOUT = float(os.getenv("HLS_PROXY_TIMEOUT", "5"))
+
+# Cache en disco de segmentos (.ts/.m4s) detrás del proxy (requiere HLS_PROXY=True)
+HLS_SEGMENT_CACHE = os.getenv("HLS_SEGMENT_CACHE", "False") == "True"
+HLS_SEGMENT_CACHE_DIR = Path(os.getenv("HLS_SEGMENT_CACHE_DIR", BASE_DIR / "hls_cache"))
+# Tope por worker: con N workers el directorio puede ocupar hasta N veces esto
+HLS_SEGMENT_CACHE_BYTES = int(os.getenv("HLS_SEGMENT_CACHE_BYTES", str(2 * 1024 ** 3)))
+HLS_SEGMENT_MAX_AGE = int(os.getenv("HLS_SEGMENT_MAX_AGE", "3600"))
+
+# LL-HLS: playlists servidas desde el directorio local del empaquetador, con
+# recarga bloqueante (_HLS_msn/_HLS_part). Si está definido tiene prioridad sobre el proxy.
+HLS_LOCAL_DIR = Path(os.environ["HLS_LOCAL_DIR"]) if os.getenv("HLS_LOCAL_DIR") else None
+# Máximo que se estaciona una recarga bloqueante (~3 duraciones objetivo)
+HLS_BLOQUEO_MAX = float(os.getenv("HLS_BLOQUEO_MAX", "6"))
+# Cada cuánto el vigía de cada playlist revisa si cambió
+HLS_VIGIA_INTERVALO = float(os.getenv("HLS_VIGIA_INTERVALO", "0.05"))
+
+# ============================
+# DVR (ARCHIVO DE SEGMENTOS)
+# ============================
+# Playlists hacia atrás en /dvr/<username>/playlist.m3u8 (el archivo lo llena `manage.py dvr indexar`)
+DVR_ACTIVO = os.getenv("DVR_ACTIVO", "False") == "True"
+DVR_DIR = Path(os.getenv("DVR_DIR", BASE_DIR / "dvr"))
+# Playlists en vivo a archivar (por defecto, las del empaquetador en HLS_LOCAL_DIR)
+if os.getenv("DVR_FUENTE"):
+    DVR_FUENTE = Path(os.environ["DVR_FUENTE"])
+else:
+    DVR_FUENTE = HLS_LOCAL_DIR / HLS_PROGRAM_PATH.strip("/") if HLS_LOCAL_DIR else None
+# Máximo que abarca una playlist DVR (segundos) y cuánto se conserva el archivo
+DVR_VENTANA_MAX = float(os.getenv("DVR_VENTANA_MAX", str(3 * 3600)))
+DVR_RETENCION_HORAS = float(os.getenv("DVR_RETENCION_HORAS", "24"))
+DVR_INDEXAR_INTERVALO = float(os.getenv("DVR_INDEXAR_INTERVALO", "1"))
+
+# ============================
+# SONDEO DE STREAMS EN VIVO
+# ============================
+# Hilo de fondo que verifica que las playlists de los canales "en vivo" avancen
+SONDEO_ACTIVO = os.getenv("SONDEO_ACTIVO", "False") == "True"
+SONDEO_INTERVALO = float(os.getenv("SONDEO_INTERVALO", "5"))
+SONDEO_CONCURRENCIA = int(os.getenv("SONDEO_CONCURRENCIA", "16"))
+# Segundos sin que avance EXT-X-MEDIA-SEQUENCE para considerar el stream estancado
+SONDEO_ESTANCADO = float(os.getenv("SONDEO_ESTANCADO", "20"))
+SONDEO_TIMEOUT = float(os.getenv("SONDEO_TIMEOUT", "3"))
+
+# ============================
+# CACHE DE CANALES (EN MEMORIA)
+# ============================
+# Segundos que vive un canal en el directorio de cada proceso
+CANAL_CACHE_TTL = int(os.getenv("CANAL_CACHE_TTL", "30"))
+# Segundos que se recuerda que un username NO existe
+CANAL_CACHE_TTL_NEGATIVO = int(os.getenv("CANAL_CACHE_TTL_NEGATIVO", "5"))
+# Máximo de canales en memoria (después se desaloja el menos usado)
+CANAL_CACHE_MAX = int(os.getenv("CANAL_CACHE_MAX", "5000"))
+# Cada cuántos segundos se relee la tabla espejo para el índice de búsqueda
+INDICE_REFRESCO_SEGUNDOS = int(os.getenv("INDICE_REFRESCO_SEGUNDOS", "60"))
+# Sugerencias que devuelve /api/autocompletar/ como máximo
+AUTOCOMPLETAR_MAX = int(os.getenv("AUTOCOMPLETAR_MAX", "10"))
+# Segundos que vive la foto del catálogo de /api/channels/
+CATALOGO_TTL = int(os.getenv("CATALOGO_TTL", "10"))
+CATALOGO_PAGINA_MAX = int(os.getenv("CATALOGO_PAGINA_MAX", "100"))
+
+# ============================
+# PÁGINAS CACHEADAS
+# ============================
+# La página del canal sale igual para todos (lo personal viene de /api/yo/)
+PAGINA_CACHE = os.getenv("PAGINA_CACHE", "False") == "True"
+PAGINA_CACHE_MAX = int(os.getenv("PAGINA_CACHE_MAX", "2000"))
+PAGINA_CACHE_MAX_AGE = int(os.getenv("PAGINA_CACHE_MAX_AGE", "5"))
+
+# ============================
+# INVITADOS (APODO DEL CHAT)
+# ============================
+# El apodo viaja en una cookie firmada con SECRET_KEY, no en la sesión
+GUEST_COOKIE_NAME = os.getenv("GUEST_COOKIE_NAME", "kaircam_invitado")
+GUEST_TOKEN_MAX_AGE = int(os.getenv("GUEST_TOKEN_MAX_AGE", str(30 * 86400)))
+# Leer (una vez) el guest_name de sesiones creadas antes del cambio
+GUEST_MIGRAR_SESION = os.getenv("GUEST_MIGRAR_SESION", "True") == "True"
+APODOS_LARGO_MAX = int(os.getenv("APODOS_LARGO_MAX", "20"))
+# Términos prohibidos extra, uno por línea (# para comentarios); se recargan en caliente
+APODOS_PROHIBIDOS = Path(os.getenv("APODOS_PROHIBIDOS", BASE_DIR / "apodos_prohibidos.txt"))
+APODOS_RECARGA = float(os.getenv("APODOS_RECARGA", "10"))
+# Usernames de canales más cortos que esto solo chocan con el apodo entero
+APODOS_CANAL_MIN = int(os.getenv("APODOS_CANAL_MIN", "5"))
+# Reservas (canal, apodo) -> visitante por proceso; vencen sin actividad en el chat
+APODOS_RESERVAS_MAX = int(os.getenv("APODOS_RESERVAS_MAX", "100000"))
+APODOS_RESERVA_SEGUNDOS = int(os.getenv("APODOS_RESERVA_SEGUNDOS", "900"))
+
+# ============================
+# LÍMITE DE PETICIONES
+# ============================
+# Token bucket por IP y ruta, compartido entre workers vía mmap
+LIMITE_ACTIVO = os.getenv("LIMITE_ACTIVO", "True") == "True"
+LIMITE_ARCHIVO = Path(os.getenv("LIMITE_ARCHIVO", RUN_DIR / "limites.bin"))
+LIMITE_SLOTS = int(os.getenv("LIMITE_SLOTS", "16384"))
+# Header con la IP real cuando hay un proxy delante (p. ej. HTTP_X_FORWARDED_FOR)
+LIMITE_IP_HEADER = os.getenv("LIMITE_IP_HEADER", "")
+# "capacidad/segundos": ráfaga máxima y en cuánto tiempo se recarga entera
+# presencia / latido: cada pestaña consulta o late cada PRESENCIA_TRAMO/2 s
+# (4 por minuto), y detrás de un NAT o CGNAT comparten IP cientos de
+# espectadores: 600/60 alcanza para ~150 pestañas y 2400/60 para ~600
+# reproductores por IP
+LIMITES = {
+    'busqueda': os.getenv("LIMITE_BUSQUEDA", "30/60"),
+    'apodo': os.getenv("LIMITE_APODO", "5/60"),
+    'presencia': os.getenv("LIMITE_PRESENCIA", "600/60"),
+    'latido': os.getenv("LIMITE_LATIDO", "2400/60"),
+    'calidad': os.getenv("LIMITE_CALIDAD", "30/60"),
+    'ranking': os.getenv("LIMITE_RANKING", "60/60"),
+}
+
+# ============================
+# ESTADO EN VIVO (WEBSOCKET)
+# ============================
+# Cada cuántos segundos el hub consulta en_vivo/url_hls de los canales con espectadores
+ESTADO_POLL_SEGUNDOS = float(os.getenv("ESTADO_POLL_SEGUNDOS", "2"))
+
+# ============================
+# ESPECTADORES (LATIDOS DEL REPRODUCTOR)
+# ============================
+# HyperLogLog por canal y por tramo en memoria compartida
+PRESENCIA_ARCHIVO = Path(os.getenv("PRESENCIA_ARCHIVO", RUN_DIR / "presencia.bin"))
+PRESENCIA_CANALES = int(os.getenv("PRESENCIA_CANALES", "1024"))
+# 2^precisión registros por HyperLogLog (10 -> 1 KB y ~3% de error)
+PRESENCIA_PRECISION = int(os.getenv("PRESENCIA_PRECISION", "10"))
+# El reproductor late cada PRESENCIA_TRAMO/2 segundos; cuenta quien latió en los últimos tramos
+PRESENCIA_TRAMO = int(os.getenv("PRESENCIA_TRAMO", "30"))
+PRESENCIA_TRAMOS = int(os.getenv("PRESENCIA_TRAMOS", "2"))
+# Tope de canales en /api/presencia/
+PRESENCIA_RANKING_MAX = int(os.getenv("PRESENCIA_RANKING_MAX", "50"))
+# Cada cuánto se recalcula el ranking (lo comparten /api/presencia/ y origenes.py)
+PRESENCIA_RANKING_SEGUNDOS = float(os.getenv("PRESENCIA_RANKING_SEGUNDOS", "5"))
+
+# ============================
+# CALIDAD DE REPRODUCCIÓN (BEACONS DEL REPRODUCTOR)
+# ============================
+# Archivos append-only con los eventos; `manage.py calidad` los resume
+CALIDAD_DIR = Path(os.getenv("CALIDAD_DIR", BASE_DIR / "calidad"))
+# Eventos en memoria por proceso antes de descartar lotes nuevos
+CALIDAD_COLA = int(os.getenv("CALIDAD_COLA", "50000"))
+# Cada cuántos segundos se vuelca la cola a disco
+CALIDAD_VOLCADO = float(os.getenv("CALIDAD_VOLCADO", "10"))
+# Tope de eventos por beacon
+CALIDAD_LOTE_MAX = int(os.getenv("CALIDAD_LOTE_MAX", "50"))
+
+# ============================
+# CHAT EN VIVO (WEBSOCKET)
+# ============================
+# Mensajes que guarda cada sala en memoria para quien entra tarde
+CHAT_HISTORIAL = int(os.getenv("CHAT_HISTORIAL", "200"))
+# Ventana (ms) en la que se juntan mensajes antes de difundirlos en un solo frame
+CHAT_LOTE_MS = int(os.getenv("CHAT_LOTE_MS", "100"))
+
+# Registro en disco del chat (segmentos append-only por canal)
+CHAT_LOG_DIR = Path(os.getenv("CHAT_LOG_DIR", BASE_DIR / "chatlog"))
+CHAT_LOG_SEGMENTO_BYTES = int(os.getenv("CHAT_LOG_SEGMENTO_BYTES", str(4 * 1024 * 1024)))
+# Al terminar una transmisión se borran los segmentos más viejos que esto
+CHAT_LOG_RETENCION_DIAS = int(os.getenv("CHAT_LOG_RETENCION_DIAS", "7"))
+# Tope de mensajes por página en /api/chat/<username>/historial/
+CHAT_HISTORIAL_PAGINA_MAX = int(os.getenv("CHAT_HISTORIAL_PAGINA_MAX", "100"))
 
 # ============================
 # CSRF & SESSION (PRODUCCIÓN)
@@ -1,7 +1,14 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from principal.estaticos import servir_estatico
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('principal.urls')),
 ]
+
+if settings.STATIC_SERVIR:
+    # Sin nginx delante: estáticos con hash, precomprimidos y cache inmutable
+    urlpatterns.insert(0, path(f"{settings.STATIC_URL.strip('/')}/<path:ruta>", servir_estatico))